@@ -3,7 +3,37 @@ import './App.css';
 import MessageList from './components/MessageList';
 import InputArea from './components/InputArea';
 import Header from './components/Header';
-import axios from 'axios';
+
+const API_URL = 'http://127.0.0.1:8000';
+
+// Parse a Server-Sent Events stream from a fetch response, calling onEvent(event, data) per message
+async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      const dataLines = [];
+      frame.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+      });
+      if (dataLines.length > 0) {
+        onEvent(event, JSON.parse(dataLines.join('\n')));
+      }
+    }
+  }
+}
 
 function App() {
   const [messages, setMessages] = useState([]);
@@ -42,34 +72,44 @@ function App() {
     setMessages(prev => [...prev, userMessage]);
     setLoading(true);
 
+    // Placeholder bot message that fills in as tokens arrive
+    const botId = Date.now();
+    const updateBotMessage = (update) => {
+      setMessages(prev => prev.map(msg => (msg.id === botId ? { ...msg, ...update(msg) } : msg)));
+    };
+    setMessages(prev => [...prev, { id: botId, type: 'bot', content: '', timestamp: new Date() }]);
+
     try {
-      // Call the API
-      const response = await axios.post('http://127.0.0.1:8000/query', {
-        query: message,
-        top_n: 2
+      // Call the streaming API: sources arrive first, then LLM tokens
+      const response = await fetch(`${API_URL}/query/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ query: message, top_n: 2 })
+      });
+      if (!response.ok) {
+        throw new Error(`Request failed with status ${response.status}`);
+      }
+
+      await readEventStream(response, (event, data) => {
+        if (event === 'sources') {
+          updateBotMessage(() => ({ sources: data.results, metadata: data.metadata }));
+        } else if (event === 'token') {
+          setLoading(false);
+          updateBotMessage(msg => ({ content: msg.content + data.text }));
+        } else if (event === 'done') {
+          updateBotMessage(msg => ({ metadata: { ...msg.metadata, ...data } }));
+        } else if (event === 'error') {
+          throw new Error(data.detail);
+        }
       });
-      // Add bot response to chat
-      const botMessage = {
-        type: 'bot',
-        content: response.data.llm_response,
-        sources: response.data.results,
-        metadata: response.data.metadata,
-        timestamp: new Date()
-      };
-      
-      setMessages(prev => [...prev, botMessage]);
     } catch (error) {
       console.error('Error:', error);
       
-      // Add error message
-      const errorMessage = {
-        type: 'bot',
+      // Replace the in-progress answer with an error message
+      updateBotMessage(() => ({
         content: "Sorry, I encountered an error while processing your request. Please try again.",
-        isError: true,
-        timestamp: new Date()
-      };
-      
-      setMessages(prev => [...prev, errorMessage]);
+        isError: true
+      }));
     } finally {
       setLoading(false);
     }
@@ -30,7 +30,7 @@ function Message({ message }) {
                 {message.sources.map((source, index) => (
                   <div key={index} className="source-item">
                     <div className="source-number">{index + 1}</div>
-                    <div className="source-text">{source}</div>
+                    <div className="source-text">{typeof source === 'string' ? source : source.content}</div>
                   </div>
                 ))}
               </div>
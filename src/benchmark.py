@@ -0,0 +1,402 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from llm import LLMProvider
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+RESOURCES = [
+    "models", "completions", "chat", "embeddings", "files", "batches", "fine_tunes", "keys",
+    "projects", "users", "usage", "invoices", "webhooks", "datasets", "evaluations", "deployments"
+]
+ACTIONS = [("GET", "List"), ("POST", "Create"), ("GET", "Retrieve"), ("PATCH", "Update"), ("DELETE", "Delete")]
+PARAMETERS = [
+    ("limit", "integer", "Maximum number of objects to return."),
+    ("after", "string", "Cursor for pagination; returns objects after this ID."),
+    ("temperature", "number", "Sampling temperature between 0 and 2."),
+    ("max_tokens", "integer", "Upper bound on generated tokens."),
+    ("stream", "boolean", "Whether to stream partial results as server-sent events."),
+    ("metadata", "object", "Up to 16 key-value pairs attached to the object."),
+    ("timeout_ms", "integer", "Request timeout in milliseconds."),
+    ("region", "string", "Region the request is served from.")
+]
+FILLER = (
+    "Requests are authenticated with a bearer token in the Authorization header. Responses are JSON "
+    "objects and errors use standard HTTP status codes with a machine-readable error type. Rate limits "
+    "apply per organization and are reported in the x-ratelimit headers of every response."
+).split()
+
+
+class FakeLLMProvider(LLMProvider):
+    """
+    Offline LLMProvider with a configurable time to first token and token rate.
+
+    Overrides the provider methods main.py calls and sleeps instead of calling a model, so
+    /query latency reflects retrieval and serving overhead plus a known LLM cost.
+    """
+
+    def __init__(self, first_token_ms: float = 300.0, tokens_per_second: float = 200.0, response_tokens: int = 150):
+        """
+        Args:
+            first_token_ms (float): Delay before the first token.
+            tokens_per_second (float): Generation rate after the first token.
+            response_tokens (int): Tokens in every response.
+        """
+        self.first_token = first_token_ms / 1000.0
+        self.token_interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+        self.response_tokens = response_tokens
+
+    def _response(self, query: str, context_docs: List[str]) -> List[str]:
+        words = " ".join(context_docs).split() or query.split()
+        return [words[i % len(words)] + " " for i in range(self.response_tokens)]
+
+    def generate_response(self, query: str, context_docs: List[str]) -> str:
+        time.sleep(self.first_token + self.token_interval * self.response_tokens)
+        return "".join(self._response(query, context_docs))
+
+    async def agenerate_response(self, query: str, context_docs: List[str]) -> str:
+        await asyncio.sleep(self.first_token + self.token_interval * self.response_tokens)
+        return "".join(self._response(query, context_docs))
+
+    async def stream_response(self, query: str, context_docs: List[str]) -> AsyncIterator[str]:
+        await asyncio.sleep(self.first_token)
+        for token in self._response(query, context_docs):
+            yield token
+            await asyncio.sleep(self.token_interval)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {"provider": "fake", "status": "connected"}
+
+
+def generate_corpus(directory: str, files: int = 200, seed: int = 0) -> List[str]:
+    """
+    Write a synthetic API documentation corpus shaped like scraped_data: one markdown page per
+    endpoint group with headings, parameter tables and curl examples.
+
+    Args:
+        directory (str): Output directory (created if missing).
+        files (int): Number of markdown files.
+        seed (int): Random seed, so the same arguments always give the same corpus.
+
+    Returns:
+        list: Questions about the generated endpoints, for use as load-test queries.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    queries = []
+    for index in range(files):
+        resource = RESOURCES[index % len(RESOURCES)]
+        version = f"v{1 + index // len(RESOURCES)}"
+        lines = [f"# {resource.replace('_', ' ').title()} API ({version})", ""]
+        lines += [" ".join(rng.choice(FILLER) for _ in range(60)), ""]
+        for method, verb in ACTIONS:
+            path = f"/{version}/{resource}" + ("/{id}" if verb in ("Retrieve", "Update", "Delete") else "")
+            parameters = rng.sample(PARAMETERS, 3)
+            lines += [f"## {verb} {resource.replace('_', ' ')}", "", f"`{method} {path}`", ""]
+            lines += [" ".join(rng.choice(FILLER) for _ in range(80)), ""]
+            lines += ["| Parameter | Type | Description |", "| --- | --- | --- |"]
+            lines += [f"| `{name}` | {kind} | {description} |" for name, kind, description in parameters]
+            lines += ["", "```bash", f"curl -X {method} https://api.example.com{path} \\",
+                      '  -H "Authorization: Bearer $API_KEY"', "```", ""]
+            queries.append(f"How do I {verb.lower()} {resource.replace('_', ' ')} with {method} {path}?")
+            queries.append(f"What does the {parameters[0][0]} parameter do when calling {method} {path}?")
+        with open(os.path.join(directory, f"docs.example.com_{version}_{resource}.md"), "w", encoding="utf-8") as page:
+            page.write("\n".join(lines))
+    rng.shuffle(queries)
+    return queries
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """Percentiles of a list of latencies in seconds, reported in milliseconds."""
+    if not latencies:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    values = np.asarray(latencies) * 1000.0
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(values.mean()),
+        "max": float(values.max())
+    }
+
+
+async def run_load(
+    client,
+    path: str,
+    payloads: List[Dict[str, Any]],
+    concurrency: int,
+    stream: bool = False
+) -> Dict[str, Any]:
+    """
+    Send every payload to path from concurrency parallel clients and time each request.
+
+    Returns:
+        dict: Request and error counts, throughput, latency percentiles and, for streams,
+            time-to-first-byte percentiles.
+    """
+    queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    latencies, first_bytes, statuses = [], [], {}
+
+    async def send(payload: Dict[str, Any]) -> Tuple[int, Optional[float]]:
+        start = time.perf_counter()
+        if not stream:
+            response = await client.post(path, json=payload)
+            return response.status_code, None
+        first_byte = None
+        async with client.stream("POST", path, json=payload) as response:
+            async for _ in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+            return response.status_code, first_byte
+
+    async def worker():
+        while not queue.empty():
+            payload = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                status, first_byte = await send(payload)
+            except Exception as e:
+                logger.debug(f"Request failed: {e}")
+                status, first_byte = "error", None
+            elapsed = time.perf_counter() - start
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+                if first_byte is not None:
+                    first_bytes.append(first_byte)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall_time = time.perf_counter() - start_time
+
+    result = {
+        "concurrency": concurrency,
+        "requests": len(payloads),
+        "errors": len(payloads) - len(latencies),
+        "status_codes": statuses,
+        "wall_time": wall_time,
+        "requests_per_second": len(latencies) / wall_time if wall_time > 0 else 0.0,
+        "latency_ms": latency_summary(latencies)
+    }
+    if stream:
+        result["time_to_first_byte_ms"] = latency_summary(first_bytes)
+    return result
+
+
+def compare_results(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Describe the change in ingestion throughput and per-concurrency query latency against a baseline run."""
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    lines = []
+    new_ingest, old_ingest = results.get("ingestion"), baseline.get("ingestion")
+    if new_ingest and old_ingest:
+        lines.append(
+            f"ingestion chunks/s: {old_ingest['chunks_per_second']:.1f} -> {new_ingest['chunks_per_second']:.1f} "
+            f"({change(new_ingest['chunks_per_second'], old_ingest['chunks_per_second'])})"
+        )
+    old_levels = {level["concurrency"]: level for level in baseline.get("query", [])}
+    for level in results.get("query", []):
+        old = old_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        for name in ("p50", "p95", "p99"):
+            new_value, old_value = level["latency_ms"][name], old["latency_ms"][name]
+            lines.append(
+                f"c={level['concurrency']} {name}: {old_value:.1f} -> {new_value:.1f} ms ({change(new_value, old_value)})"
+            )
+        lines.append(
+            f"c={level['concurrency']} req/s: {old['requests_per_second']:.1f} -> {level['requests_per_second']:.1f} "
+            f"({change(level['requests_per_second'], old['requests_per_second'])})"
+        )
+    return lines
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup_app(args, workdir: str, corpus_dir: str) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Build the FastAPI app in-process on offline stand-ins and ingest the corpus.
+
+    The native vector index replaces the Chroma server, the hash embedding backend replaces
+    the model and FakeLLMProvider replaces Groq. The rate limit is lifted and, unless
+    requested, the response cache is disabled so every request does the full work.
+
+    Returns:
+        tuple: (app, ingestion results)
+    """
+    os.environ["RATE_LIMIT_PER_MINUTE"] = str(10 ** 9)
+    os.environ.pop("RATE_LIMIT_DB", None)
+    os.environ["RESPONSE_CACHE_SIZE"] = os.environ.get("RESPONSE_CACHE_SIZE", "1024") if args.response_cache else "0"
+    import main
+    from database import ChromaDatabase
+    from parallel_ingest import store_documents_parallel
+
+    db = ChromaDatabase(
+        "benchmark",
+        backend="native",
+        persist_directory=os.path.join(workdir, "index"),
+        cache_dir=os.path.join(workdir, "cache"),
+        embedding_backend=args.embedding_backend,
+        model_name=args.model,
+        embedding_cache_size=0,
+        vector_storage=args.vector_storage
+    )
+    db.warm_up()
+
+    logger.info(f"Ingesting {corpus_dir} with {args.ingest_workers} worker(s)...")
+    if args.ingest_workers > 1:
+        ingestion = store_documents_parallel(db, corpus_dir, workers=args.ingest_workers)
+    else:
+        ingestion = db.store_documents(corpus_dir)
+
+    main.db = db
+    main.llm_provider = FakeLLMProvider(args.llm_first_token_ms, args.llm_tokens_per_second, args.llm_response_tokens)
+    main.context_budgeter.token_counter = db.count_tokens
+    main.startup_state.set_phase("ready")
+
+    processing_time = ingestion["processing_time"]
+    return main.app, {
+        "documents": ingestion["document_count"],
+        "chunks": ingestion["chunk_count"],
+        "seconds": processing_time,
+        "chunks_per_second": ingestion["chunk_count"] / processing_time if processing_time > 0 else 0.0,
+        "tokens_per_second": ingestion["throughput"]["token_count"] / processing_time if processing_time > 0 else 0.0,
+        "workers": args.ingest_workers
+    }
+
+
+async def benchmark_queries(args, app, queries: List[str]) -> List[Dict[str, Any]]:
+    """Run the load generator at every requested concurrency level, in-process or against args.url."""
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=args.timeout)
+
+    path = "/query/stream" if args.stream else "/query"
+    levels = []
+    async with client:
+        # Warm-up requests are not counted
+        await run_load(client, path, [{"query": query} for query in queries[:4]], 2, stream=args.stream)
+        for concurrency in args.concurrency:
+            payloads = [
+                {"query": queries[i % len(queries)], "top_n": args.top_n, "retrieval_mode": args.retrieval_mode}
+                for i in range(args.requests)
+            ]
+            logger.info(f"Sending {len(payloads)} requests to {path} at concurrency {concurrency}...")
+            level = await run_load(client, path, payloads, concurrency, stream=args.stream)
+            logger.info(
+                f"c={concurrency}: {level['requests_per_second']:.1f} req/s, p50 {level['latency_ms']['p50']:.1f} ms, "
+                f"p95 {level['latency_ms']['p95']:.1f} ms, p99 {level['latency_ms']['p99']:.1f} ms, {level['errors']} errors"
+            )
+            levels.append(level)
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline end-to-end benchmark: synthetic corpus, ingestion throughput and /query latency under load"
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier --output file to compare against")
+    parser.add_argument("--url", help="Load-test a running server instead of an in-process offline app")
+    parser.add_argument("--corpus", help="Existing document directory to ingest instead of a synthetic corpus")
+    parser.add_argument("--queries", help="Questions to send, one per line (defaults to ones generated with the corpus)")
+    parser.add_argument("--files", type=int, default=200, help="Files in the synthetic corpus")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic corpus")
+    parser.add_argument("--workdir", help="Directory for the corpus and index (defaults to a temporary directory)")
+    parser.add_argument("--ingest-workers", type=int, default=1, help="Ingestion processes (parallel_ingest when > 1)")
+    parser.add_argument("--embedding-backend", default="hash", help="Embedding backend; 'hash' needs no model download")
+    parser.add_argument("--model", default="BAAI/bge-m3", help="Embedding model for non-hash backends")
+    parser.add_argument("--vector-storage", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrency levels to test")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--retrieval-mode", default="dense", choices=["dense", "lexical", "hybrid"])
+    parser.add_argument("--stream", action="store_true", help="Benchmark /query/stream and report time to first byte")
+    parser.add_argument("--response-cache", action="store_true", help="Leave the response cache enabled")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0, help="Fake LLM delay before the first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0, help="Fake LLM generation rate")
+    parser.add_argument("--llm-response-tokens", type=int, default=150, help="Fake LLM response length")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-benchmark-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        corpus_dir = args.corpus or os.path.join(workdir, "corpus")
+        if args.queries:
+            with open(args.queries, "r", encoding="utf-8") as queries_file:
+                queries = [line.strip() for line in queries_file if line.strip()]
+        else:
+            # With --corpus the synthetic pages are generated only for their questions, which still
+            # exercise the full query path against a real corpus
+            queries = generate_corpus(os.path.join(workdir, "synthetic") if args.corpus else corpus_dir, args.files, args.seed)
+        if not args.corpus and args.queries:
+            generate_corpus(corpus_dir, args.files, args.seed)
+
+        app, ingestion = (None, None) if args.url else setup_app(args, workdir, corpus_dir)
+        if ingestion:
+            logger.info(
+                f"Ingested {ingestion['chunks']} chunks in {ingestion['seconds']:.2f} s "
+                f"({ingestion['chunks_per_second']:.1f} chunks/s)"
+            )
+        levels = asyncio.run(benchmark_queries(args, app, queries))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": vars(args),
+        "ingestion": ingestion,
+        "query": levels
+    }
+
+    print(f"\n{'concurrency':>11} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for level in levels:
+        print(
+            f"{level['concurrency']:>11} {level['requests_per_second']:>8.1f} {level['latency_ms']['p50']:>8.1f} "
+            f"{level['latency_ms']['p95']:>8.1f} {level['latency_ms']['p99']:>8.1f} {level['errors']:>7}"
+        )
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"\nCompared with {args.baseline} (revision {baseline.get('revision')}):")
+        for line in compare_results(results, baseline):
+            print(f"  {line}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
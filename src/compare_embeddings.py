@@ -0,0 +1,151 @@
+import argparse
+import json
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.text_splitter import TokenTextSplitter
+
+from embeddings import EMBEDDING_BACKENDS, EmbeddingBackend, create_embedding_backend
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_corpus(directory_path: str, chunk_size: int, chunk_overlap: int, max_chunks: int) -> List[str]:
+    """Split documents the way ingestion does and keep the first max_chunks chunks."""
+    splitter = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks: List[str] = []
+    for documents in SimpleDirectoryReader(input_dir=directory_path).iter_data():
+        for doc in documents:
+            chunks.extend(splitter.split_text(doc.text))
+        if len(chunks) >= max_chunks:
+            break
+    return chunks[:max_chunks]
+
+
+def parse_candidate(spec: str, default_model: str) -> Tuple[str, str]:
+    """Parse 'backend' or 'backend:model' into (backend, model)."""
+    backend, _, model_name = spec.partition(":")
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    return backend, model_name or default_model
+
+
+def embed_corpus(backend: EmbeddingBackend, chunks: List[str], batch_size: int) -> Tuple[np.ndarray, float]:
+    """Embed chunks in length-sorted batches; returns the vectors in input order and the seconds taken."""
+    order = np.argsort(backend.count_tokens(chunks, truncate=True), kind="stable")
+    vectors: List[Any] = [None] * len(chunks)
+    start_time = time.perf_counter()
+    for i in range(0, len(order), batch_size):
+        batch = order[i:i + batch_size]
+        for idx, vector in zip(batch, backend.encode([chunks[j] for j in batch])):
+            vectors[idx] = vector
+    return np.asarray(vectors, dtype=np.float32), time.perf_counter() - start_time
+
+
+def evaluate(
+    backend: EmbeddingBackend,
+    chunks: List[str],
+    queries: List[str],
+    top_n: int,
+    batch_size: int
+) -> Dict[str, Any]:
+    """Embed the corpus and queries with one backend and rank the corpus for every query."""
+    corpus_vectors, corpus_time = embed_corpus(backend, chunks, batch_size)
+
+    latencies, query_vectors = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        query_vectors.append(backend.encode([query])[0])
+        latencies.append(time.perf_counter() - start_time)
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+
+    # Vectors are normalized, so the dot product ranks like Chroma's L2 distance
+    scores = query_vectors @ corpus_vectors.T
+    k = min(top_n, len(chunks))
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+    return {
+        "top": top,
+        "dimension": int(corpus_vectors.shape[1]),
+        "index_bytes": int(corpus_vectors.nbytes),
+        "corpus_chunks_per_second": len(chunks) / corpus_time if corpus_time > 0 else 0.0,
+        "query_latency_ms": {
+            "p50": float(np.percentile(latencies, 50) * 1000),
+            "p95": float(np.percentile(latencies, 95) * 1000),
+            "mean": float(np.mean(latencies) * 1000)
+        }
+    }
+
+
+def recall_against(baseline_top: np.ndarray, candidate_top: np.ndarray) -> float:
+    """Mean fraction of the baseline's top results that the candidate also returns."""
+    overlaps = [len(set(base) & set(candidate)) / len(base) for base, candidate in zip(baseline_top, candidate_top)]
+    return float(np.mean(overlaps)) if overlaps else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare embedding backends against the float32 baseline on retrieval recall and latency"
+    )
+    parser.add_argument("--queries", required=True, help="Held-out queries, one per line")
+    parser.add_argument("--directory", default="./scraped_data", help="Documents to build the evaluation corpus from")
+    parser.add_argument("--model", default="BAAI/bge-m3", help="Baseline model, run with the torch backend")
+    parser.add_argument(
+        "--candidates",
+        nargs="+",
+        default=["onnx", "onnx-int8"],
+        help="Backends to compare, as 'backend' or 'backend:model' (e.g. torch:BAAI/bge-small-en-v1.5)"
+    )
+    parser.add_argument("--top-n", type=int, default=5, help="Results per query used for recall")
+    parser.add_argument("--max-chunks", type=int, default=2000, help="Corpus size")
+    parser.add_argument("--batch-size", type=int, default=32, help="Chunks per forward pass when embedding the corpus")
+    parser.add_argument("--cache-dir", default="./.cache", help="Model cache directory")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as queries_file:
+        queries = [line.strip() for line in queries_file if line.strip()]
+    chunks = load_corpus(args.directory, 1024, 100, args.max_chunks)
+    logger.info(f"Evaluating on {len(chunks)} chunks and {len(queries)} queries")
+
+    configurations = [("torch", args.model)] + [parse_candidate(spec, args.model) for spec in args.candidates]
+    results = []
+    baseline_top = None
+    for backend_name, model_name in configurations:
+        load_start = time.perf_counter()
+        backend = create_embedding_backend(backend_name, model_name, args.cache_dir)
+        load_time = time.perf_counter() - load_start
+        backend.encode(["warm up"])
+
+        evaluation = evaluate(backend, chunks, queries, args.top_n, args.batch_size)
+        top = evaluation.pop("top")
+        if baseline_top is None:
+            baseline_top = top
+        results.append({
+            "backend": backend_name,
+            "model": model_name,
+            "load_seconds": load_time,
+            f"recall@{args.top_n}": recall_against(baseline_top, top),
+            **evaluation
+        })
+        del backend
+
+    print(f"\n{'backend':<10} {'model':<32} {'recall@' + str(args.top_n):>9} {'p50 ms':>8} {'p95 ms':>8} {'chunks/s':>9} {'dim':>5}")
+    for result in results:
+        print(
+            f"{result['backend']:<10} {result['model']:<32} {result[f'recall@{args.top_n}']:>9.3f} "
+            f"{result['query_latency_ms']['p50']:>8.1f} {result['query_latency_ms']['p95']:>8.1f} "
+            f"{result['corpus_chunks_per_second']:>9.1f} {result['dimension']:>5}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump({"top_n": args.top_n, "chunks": len(chunks), "queries": len(queries), "results": results}, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Longest overlap looked for between adjacent chunks; the splitter's chunk_overlap is far smaller
+MAX_OVERLAP_CHARS = 4000
+# Overlaps shorter than this are left alone
+MIN_OVERLAP_CHARS = 16
+
+
+def approximate_token_counts(texts: Sequence[str]) -> List[int]:
+    """Rough token counts for when no tokenizer is available (about 4 characters per token)."""
+    return [max(len(re.findall(r"\w+|[^\w\s]", text)), len(text) // 4) for text in texts]
+
+
+def merge_overlapping(first: str, second: str) -> str:
+    """
+    Join two consecutive chunks, dropping the text the splitter repeated at the boundary.
+
+    Returns the concatenation with the longest suffix of first that is also a prefix of second
+    removed from second, or both chunks separated by a newline if they do not overlap.
+    """
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) == MIN_OVERLAP_CHARS:
+        window_start = max(len(first) - MAX_OVERLAP_CHARS, 0)
+        position = first.find(probe, window_start)
+        while position != -1:
+            # The earliest match in the window is the longest possible overlap
+            if second.startswith(first[position:]):
+                return first + second[len(first) - position:]
+            position = first.find(probe, position + 1)
+    return f"{first}\n{second}"
+
+
+class ContextBudgeter:
+    """
+    Assembles the LLM context from retrieved chunks under a token budget.
+
+    Chunks are deduplicated (exact repeats and chunks contained in another retrieved chunk),
+    consecutive chunks of the same source are merged with their splitter overlap removed, and
+    the resulting blocks are packed best-ranked first until the budget is spent. Each block is
+    tokenized once.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        token_counter: Optional[Callable[[List[str]], List[int]]] = None,
+        label_sources: bool = True
+    ):
+        """
+        Args:
+            max_tokens (int): Token budget for the packed context.
+            token_counter (callable, optional): Maps a list of texts to their token counts in one call;
+                defaults to a character-based approximation.
+            label_sources (bool): Whether to prefix each block with the file it came from.
+        """
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter or approximate_token_counts
+        self.label_sources = label_sources
+
+    def pack(
+        self,
+        documents: Sequence[str],
+        metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Build the context for a set of retrieved chunks, given best first.
+
+        Args:
+            documents: Chunk texts in rank order.
+            metadatas: Chunk metadata with source and chunk_index, aligned with documents.
+
+        Returns:
+            dict: 'documents' (context blocks to send to the LLM), 'token_count' (tokens in those
+                blocks), 'chunks_used' and 'chunks_dropped'.
+        """
+        metadatas = metadatas or [None] * len(documents)
+
+        # Drop exact repeats and chunks wholly contained in a better-ranked chunk
+        kept = []
+        for rank, (text, metadata) in enumerate(zip(documents, metadatas)):
+            if not text or any(text in other for _, other, _ in kept):
+                continue
+            kept.append((rank, text, metadata or {}))
+
+        blocks = self._merge_adjacent(kept)
+        texts = [self._render(block) for block in blocks]
+        token_counts = self.token_counter(texts) if texts else []
+
+        packed, used, total_tokens = [], 0, 0
+        for block, text, tokens in sorted(zip(blocks, texts, token_counts), key=lambda item: item[0]["rank"]):
+            if total_tokens + tokens <= self.max_tokens:
+                packed.append(text)
+                used += block["chunks"]
+                total_tokens += tokens
+            elif not packed:
+                # Even the best block is over budget: keep the longest prefix of it that fits
+                while tokens > self.max_tokens and len(text) > 1:
+                    text = text[:max(min(int(len(text) * self.max_tokens / tokens), len(text) - 1), 1)]
+                    tokens = self.token_counter([text])[0]
+                packed.append(text)
+                used += block["chunks"]
+                total_tokens += tokens
+
+        if used < len(documents):
+            logger.debug(f"Context packed {used} of {len(documents)} chunks into {total_tokens} tokens")
+        return {
+            "documents": packed,
+            "token_count": total_tokens,
+            "chunks_used": used,
+            "chunks_dropped": len(documents) - used
+        }
+
+    def _merge_adjacent(self, kept) -> List[Dict[str, Any]]:
+        """Group runs of consecutive chunk_index values from one source into single blocks."""
+        by_source: Dict[Any, List] = {}
+        for rank, text, metadata in kept:
+            by_source.setdefault(metadata.get("source", f"#{rank}"), []).append((rank, text, metadata))
+
+        blocks = []
+        for source, chunks in by_source.items():
+            chunks.sort(key=lambda chunk: chunk[2].get("chunk_index", 0))
+            block = None
+            for rank, text, metadata in chunks:
+                index = metadata.get("chunk_index")
+                if block is not None and index is not None and block["last_index"] is not None and index == block["last_index"] + 1:
+                    block["text"] = merge_overlapping(block["text"], text)
+                    block["rank"] = min(block["rank"], rank)
+                    block["chunks"] += 1
+                    block["last_index"] = index
+                    continue
+                block = {
+                    "text": text,
+                    "rank": rank,
+                    "chunks": 1,
+                    "last_index": index,
+                    "file_name": metadata.get("file_name")
+                }
+                blocks.append(block)
+        return blocks
+
+    def _render(self, block: Dict[str, Any]) -> str:
+        if self.label_sources and block["file_name"]:
+            return f"[Source: {block['file_name']}]\n{block['text']}"
+        return block["text"]
@@ -1,31 +1,127 @@
 '''This file will scrape the documentations of the Cerebras API and save them as markdown files in the `scraped_data` directory.
 The `crawl_sequential` function will sequentially crawl the URLs in the `urls` list and save the markdown content to a file.
+The `crawl_concurrent` function does the same with a bounded pool of browser sessions, per-host politeness limits and retries.
+Both record sitemap lastmod, HTTP validators and a content hash per URL in `.crawl_index.json`, so an incremental run can
+skip unchanged pages and never rewrites markdown whose content did not change.
 We utilize crawl4ai to perform the web scraping.
 Taken from: https://github.com/unclecode/crawl4ai
 '''
 
+import argparse
 import asyncio
+import hashlib
 import json
 import os
-from typing import List
+import random
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig
 from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
 import requests
 from xml.etree import ElementTree
 
 SAVE_DIR = "scraped_data"
+# Hidden so SimpleDirectoryReader does not ingest it alongside the markdown
+INDEX_FILE = os.path.join(SAVE_DIR, ".crawl_index.json")
 
 # Ensure save directory exists
 os.makedirs(SAVE_DIR, exist_ok=True)
 
-async def crawl_sequential(urls: List[str]):
-    print("\n=== Sequential Crawling with Session Reuse ===")
-
-    browser_config = BrowserConfig(
+def make_browser_config() -> BrowserConfig:
+    return BrowserConfig(
         headless=True,
         extra_args=["--disable-gpu", "--disable-dev-shm-usage", "--no-sandbox"],
     )
 
+def save_markdown(url: str, markdown_content: str) -> str:
+    filename = os.path.join(SAVE_DIR, f"{url.replace('https://', '').replace('/', '_')}.md")
+    with open(filename, "w", encoding="utf-8") as md_file:
+        md_file.write(markdown_content)
+    return filename
+
+def load_crawl_index() -> Dict[str, Dict]:
+    if not os.path.exists(INDEX_FILE):
+        return {}
+    with open(INDEX_FILE, "r", encoding="utf-8") as index_file:
+        return json.load(index_file)
+
+def save_crawl_index(index: Dict[str, Dict]):
+    with open(f"{INDEX_FILE}.tmp", "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file, indent=4)
+    os.replace(f"{INDEX_FILE}.tmp", INDEX_FILE)
+
+def store_page(url: str, markdown_content: str, headers: Optional[Dict], lastmod: Optional[str], index: Dict[str, Dict]):
+    '''Write a crawled page unless its markdown is identical to the last crawl, and update its index entry.
+
+    Returns the filename and whether the file was (re)written.
+    '''
+    headers = {key.lower(): value for key, value in (headers or {}).items()}
+    content_hash = hashlib.sha256(markdown_content.encode("utf-8")).hexdigest()
+    previous = index.get(url, {})
+
+    filename = previous.get("filename")
+    written = not (previous.get("content_hash") == content_hash and filename and os.path.exists(filename))
+    if written:
+        filename = save_markdown(url, markdown_content)
+
+    index[url] = {
+        "filename": filename,
+        "lastmod": lastmod or previous.get("lastmod"),
+        "etag": headers.get("etag", previous.get("etag")),
+        "last_modified": headers.get("last-modified", previous.get("last_modified")),
+        "content_hash": content_hash,
+        "crawled_at": time.time()
+    }
+    return filename, written
+
+def conditional_headers(previous: Optional[Dict]) -> Dict[str, str]:
+    '''Return the If-None-Match / If-Modified-Since headers for a previously crawled page.'''
+    validators = {}
+    if previous and previous.get("etag"):
+        validators["If-None-Match"] = previous["etag"]
+    if previous and previous.get("last_modified"):
+        validators["If-Modified-Since"] = previous["last_modified"]
+    return validators
+
+def is_unchanged(url: str, lastmod: Optional[str], index: Dict[str, Dict], check_remote: bool = True) -> Optional[str]:
+    '''Decide whether a page can be skipped without fetching it through the browser.
+
+    A page is unchanged when the sitemap lastmod matches the last crawl, or when a conditional
+    HEAD request with the stored ETag / Last-Modified validators returns 304. With
+    check_remote=False only the local checks run and no request is made. Returns the reason it
+    was skipped, or None if it needs to be crawled.
+    '''
+    previous = index.get(url)
+    if not previous or not previous.get("filename") or not os.path.exists(previous["filename"]):
+        return None
+    if lastmod and previous.get("lastmod") == lastmod:
+        return "lastmod"
+
+    validators = conditional_headers(previous)
+    if not validators or not check_remote:
+        return None
+    try:
+        response = requests.head(url, headers=validators, timeout=10, allow_redirects=True)
+        if response.status_code == 304:
+            if lastmod:
+                previous["lastmod"] = lastmod
+            return "not-modified"
+    except requests.RequestException as e:
+        print(f"Conditional check failed for {url}: {e}")
+    return None
+
+def save_results_metadata(results_metadata: List[Dict]):
+    with open(os.path.join(SAVE_DIR, "scraping_results.json"), "w", encoding="utf-8") as json_file:
+        json.dump(results_metadata, json_file, indent=4)
+
+async def crawl_sequential(urls: List[str], lastmods: Optional[Dict[str, str]] = None, incremental: bool = False):
+    print("\n=== Sequential Crawling with Session Reuse ===")
+    lastmods = lastmods or {}
+    crawl_index = load_crawl_index()
+
+    browser_config = make_browser_config()
+
     crawl_config = CrawlerRunConfig(markdown_generator=DefaultMarkdownGenerator())
 
     crawler = AsyncWebCrawler(config=browser_config)
@@ -36,17 +132,22 @@ async def crawl_sequential(urls: List[str]):
     try:
         session_id = "session1"
         for url in urls:
+            if incremental:
+                # The HEAD request is blocking; keep it off the event loop
+                reason = await asyncio.to_thread(is_unchanged, url, lastmods.get(url), crawl_index)
+                if reason:
+                    print(f"Skipped: {url} ({reason})")
+                    results_metadata.append({"url": url, "status": "skipped", "reason": reason, "filename": crawl_index[url]["filename"]})
+                    continue
+
             result = await crawler.arun(url=url, config=crawl_config, session_id=session_id)
             
             if result.success:
                 markdown_content = result.markdown_v2.raw_markdown
-                filename = os.path.join(SAVE_DIR, f"{url.replace('https://', '').replace('/', '_')}.md")
-                
-                with open(filename, "w", encoding="utf-8") as md_file:
-                    md_file.write(markdown_content)
+                filename, written = store_page(url, markdown_content, getattr(result, "response_headers", None), lastmods.get(url), crawl_index)
                 
-                print(f"Saved: {filename} (Length: {len(markdown_content)})")
-                results_metadata.append({"url": url, "status": "success", "filename": filename})
+                print(f"{'Saved' if written else 'Unchanged'}: {filename} (Length: {len(markdown_content)})")
+                results_metadata.append({"url": url, "status": "success" if written else "unchanged", "filename": filename})
             else:
                 print(f"Failed: {url} - Error: {result.error_message}")
                 results_metadata.append({"url": url, "status": "failed", "error": result.error_message})
@@ -54,10 +155,132 @@ async def crawl_sequential(urls: List[str]):
         await crawler.close()
         
         # Save metadata
-        with open(os.path.join(SAVE_DIR, "scraping_results.json"), "w", encoding="utf-8") as json_file:
-            json.dump(results_metadata, json_file, indent=4)
+        save_results_metadata(results_metadata)
+        save_crawl_index(crawl_index)
 
-def get_api_docs_urls():
+class HostThrottle:
+    '''Limits concurrent requests per host and enforces a minimum delay between requests to the same host.'''
+
+    def __init__(self, per_host_limit: int = 2, min_delay: float = 0.5):
+        self.per_host_limit = per_host_limit
+        self.min_delay = min_delay
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last_request: Dict[str, float] = {}
+
+    def slot(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._semaphores[host]
+
+    async def wait_turn(self, url: str):
+        host = urlparse(url).netloc
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            wait = self._last_request.get(host, 0.0) + self.min_delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_request[host] = time.monotonic()
+
+async def crawl_concurrent(
+    urls: List[str],
+    max_concurrency: int = 8,
+    per_host_limit: int = 2,
+    per_host_delay: float = 0.5,
+    max_retries: int = 3,
+    backoff_base: float = 1.0,
+    lastmods: Optional[Dict[str, str]] = None,
+    incremental: bool = False
+):
+    '''Crawl URLs with a pool of max_concurrency browser sessions sharing one AsyncWebCrawler.
+
+    Each worker owns its own session (page) and pulls URLs from a shared queue. Requests to the
+    same host are capped at per_host_limit in flight and spaced at least per_host_delay seconds
+    apart. Failed pages are retried up to max_retries times with exponential backoff and jitter.
+    With incremental=True, pages whose lastmod or HTTP validators show no change are skipped.
+    '''
+    print(f"\n=== Concurrent Crawling with {max_concurrency} Sessions ===")
+    lastmods = lastmods or {}
+    crawl_index = load_crawl_index()
+
+    browser_config = make_browser_config()
+    crawl_config = CrawlerRunConfig(markdown_generator=DefaultMarkdownGenerator())
+
+    crawler = AsyncWebCrawler(config=browser_config)
+    await crawler.start()
+
+    throttle = HostThrottle(per_host_limit=per_host_limit, min_delay=per_host_delay)
+    pending: asyncio.Queue = asyncio.Queue()
+    for position, url in enumerate(urls):
+        pending.put_nowait((position, url))
+    results_metadata: List[Dict] = [None] * len(urls)
+    start_time = time.time()
+
+    async def fetch(url: str, session_id: str):
+        error = None
+        for attempt in range(max_retries + 1):
+            if attempt:
+                delay = backoff_base * (2 ** (attempt - 1)) * (1 + random.random())
+                print(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1}/{max_retries + 1})")
+                await asyncio.sleep(delay)
+            try:
+                async with throttle.slot(url):
+                    await throttle.wait_turn(url)
+                    result = await crawler.arun(url=url, config=crawl_config, session_id=session_id)
+                if result.success:
+                    return result, None
+                error = result.error_message
+            except Exception as e:
+                error = str(e)
+        return None, error
+
+    async def worker(worker_id: int):
+        session_id = f"session{worker_id + 1}"
+        while True:
+            try:
+                position, url = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if incremental:
+                reason = is_unchanged(url, lastmods.get(url), crawl_index, check_remote=False)
+                if reason is None and conditional_headers(crawl_index.get(url)):
+                    # The conditional HEAD counts against the host's concurrency and spacing like a fetch
+                    async with throttle.slot(url):
+                        await throttle.wait_turn(url)
+                        reason = await asyncio.to_thread(is_unchanged, url, lastmods.get(url), crawl_index)
+                if reason:
+                    print(f"Skipped: {url} ({reason})")
+                    results_metadata[position] = {"url": url, "status": "skipped", "reason": reason, "filename": crawl_index[url]["filename"]}
+                    continue
+            result, error = await fetch(url, session_id)
+            if result is not None:
+                markdown_content = result.markdown_v2.raw_markdown
+                filename, written = store_page(url, markdown_content, getattr(result, "response_headers", None), lastmods.get(url), crawl_index)
+                print(f"{'Saved' if written else 'Unchanged'}: {filename} (Length: {len(markdown_content)})")
+                results_metadata[position] = {"url": url, "status": "success" if written else "unchanged", "filename": filename}
+            else:
+                print(f"Failed: {url} - Error: {error}")
+                results_metadata[position] = {"url": url, "status": "failed", "error": error}
+
+    try:
+        await asyncio.gather(*(worker(i) for i in range(min(max_concurrency, len(urls)) or 1)))
+    finally:
+        await crawler.close()
+
+        # Save metadata
+        save_results_metadata([entry for entry in results_metadata if entry is not None])
+        save_crawl_index(crawl_index)
+
+    elapsed = time.time() - start_time
+    statuses = [entry["status"] for entry in results_metadata if entry]
+    print(
+        f"Processed {len(urls)} URLs in {elapsed:.1f}s ({len(urls) / elapsed if elapsed else 0:.2f} pages/s): "
+        f"{statuses.count('success')} saved, {statuses.count('unchanged')} unchanged, "
+        f"{statuses.count('skipped')} skipped, {statuses.count('failed')} failed"
+    )
+
+def get_sitemap_entries():
     sitemap_url = "https://openweathermap.org/sitemap.xml"
     try:
         response = requests.get(sitemap_url)
@@ -65,16 +288,46 @@ def get_api_docs_urls():
         
         root = ElementTree.fromstring(response.content)
         namespace = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-        return [loc.text for loc in root.findall('.//ns:loc', namespace)]
+        entries = []
+        for url_element in root.findall('.//ns:url', namespace):
+            loc = url_element.find('ns:loc', namespace)
+            lastmod = url_element.find('ns:lastmod', namespace)
+            if loc is not None and loc.text:
+                entries.append({"url": loc.text.strip(), "lastmod": lastmod.text.strip() if lastmod is not None and lastmod.text else None})
+        return entries
     except Exception as e:
         print(f"Error fetching sitemap: {e}")
         return []
 
+def get_api_docs_urls():
+    return [entry["url"] for entry in get_sitemap_entries()]
+
 async def main():
-    urls = get_api_docs_urls()
+    parser = argparse.ArgumentParser(description="Crawl API documentation into markdown files")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of browser sessions (1 crawls sequentially)")
+    parser.add_argument("--per-host-limit", type=int, default=2, help="Maximum in-flight requests per host")
+    parser.add_argument("--per-host-delay", type=float, default=0.5, help="Minimum seconds between requests to the same host")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per URL with exponential backoff")
+    parser.add_argument("--incremental", action="store_true", help="Skip pages unchanged since the last crawl")
+    args = parser.parse_args()
+
+    entries = get_sitemap_entries()
+    urls = [entry["url"] for entry in entries]
+    lastmods = {entry["url"]: entry["lastmod"] for entry in entries if entry["lastmod"]}
     if urls:
         print(f"Found {len(urls)} URLs to crawl")
-        await crawl_sequential(urls)
+        if args.concurrency > 1:
+            await crawl_concurrent(
+                urls,
+                max_concurrency=args.concurrency,
+                per_host_limit=args.per_host_limit,
+                per_host_delay=args.per_host_delay,
+                max_retries=args.retries,
+                lastmods=lastmods,
+                incremental=args.incremental
+            )
+        else:
+            await crawl_sequential(urls, lastmods=lastmods, incremental=args.incremental)
     else:
         print("No URLs found to crawl")
 
@@ -2,16 +2,108 @@ import chromadb
 from chromadb.config import Settings
 from llama_index.core import SimpleDirectoryReader
 from llama_index.core.text_splitter import TokenTextSplitter
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+import asyncio
+import atexit
+import hashlib
+import json
 import os
+import queue
+import threading
 import time
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 import logging
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from embeddings import create_embedding_backend
+from embedding_scheduler import EmbeddingScheduler
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from vector_index import LocalVectorIndex
+from response_cache import normalize_query
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
+def stable_chunk_id(source: str, chunk: str, occurrence: int = 0) -> str:
+    """
+    Build a content-derived chunk ID that does not depend on ingestion order.
+    
+    Args:
+        source (str): Path of the source file relative to the ingested directory.
+        chunk (str): The chunk text.
+        occurrence (int): How many identical chunks precede this one in the same file.
+    """
+    digest = hashlib.sha1(f"{source}\0{chunk}".encode("utf-8")).hexdigest()[:24]
+    return digest if occurrence == 0 else f"{digest}_{occurrence}"
+
+
+class _StageError:
+    """Carries an exception raised in a pipeline stage back to the consuming thread."""
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_STAGE_DONE = object()
+
+
+def _prefetch(iterable: Iterable[Any], maxsize: int) -> Iterator[Any]:
+    """
+    Drive an iterable in a background thread, handing items over through a bounded queue.
+    
+    The producer blocks once maxsize items are waiting, and stops early if the consumer
+    goes away. Exceptions raised by the producer are re-raised in the consumer.
+    """
+    items: "queue.Queue[Any]" = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+    
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_StageError(e))
+        else:
+            put(_STAGE_DONE)
+    
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+
+
+def file_fingerprint(path: str) -> Dict[str, Any]:
+    """Return the size, mtime and SHA-256 of a file, used to detect changes between syncs."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            sha256.update(block)
+    stat = os.stat(path)
+    return {"sha256": sha256.hexdigest(), "mtime": stat.st_mtime, "size": stat.st_size}
+
+
 class ChromaDatabase:
     def __init__(
         self, 
@@ -19,7 +111,16 @@ class ChromaDatabase:
         host: str = 'localhost', 
         port: int = 8000,
         model_name: str = "BAAI/bge-m3", 
-        cache_dir: str = "./.cache"
+        cache_dir: str = "./.cache",
+        embedding_cache_size: int = 200_000,
+        embed_workers: int = 2,
+        query_cache_size: int = 1024,
+        backend: str = "http",
+        persist_directory: str = "./chroma_data",
+        query_batch_size: int = 32,
+        query_batch_wait_ms: float = 5.0,
+        embedding_backend: str = "torch",
+        vector_storage: str = "float32"
     ):
         """
         Initialize the ChromaDatabase instance.
@@ -30,118 +131,693 @@ class ChromaDatabase:
             port (int): The port for ChromaDB.
             model_name (str): The name of the embedding model to use.
             cache_dir (str): Directory to cache embeddings to avoid recomputation
+            embedding_cache_size (int): Maximum number of vectors kept in the on-disk embedding cache (0 disables it).
+            embed_workers (int): Threads available to aquery_rag for running query embeddings off the event loop.
+            query_cache_size (int): Number of query embeddings kept in the in-process LRU (0 disables it).
+            backend (str): Vector store to use: "http" (Chroma server at host:port), "persistent"
+                (embedded chromadb.PersistentClient) or "native" (in-process LocalVectorIndex).
+            persist_directory (str): Where the "persistent" and "native" backends keep their data.
+            query_batch_size (int): Most concurrent aquery_rag embeddings run as one batch (1 disables batching).
+            query_batch_wait_ms (float): Longest a query embedding waits for others to batch with.
+            embedding_backend (str): How the embedding model runs: "torch", "onnx" or "onnx-int8".
+            vector_storage (str): Vectors the "native" backend scans per query: "float32", or "float16"/"int8"
+                codes with exact re-ranking of the top candidates.
         """
         try:
             # Create cache directory if it doesn't exist
             os.makedirs(cache_dir, exist_ok=True)
+            self.cache_dir = cache_dir
             
-            # Connect to ChromaDB
-            self.client = chromadb.HttpClient(host=host, port=port)
-            self.collection = self.client.get_or_create_collection(name=database_name)
+            # Connect to ChromaDB, or open an embedded store
+            self.host = host
+            self.port = port
+            self.backend = backend
+            self.persist_directory = persist_directory
+            if backend == "http":
+                self.client = chromadb.HttpClient(host=host, port=port)
+                self.collection = self.client.get_or_create_collection(name=database_name)
+            elif backend == "persistent":
+                self.client = chromadb.PersistentClient(path=persist_directory)
+                self.collection = self.client.get_or_create_collection(name=database_name)
+            elif backend == "native":
+                self.client = None
+                self.collection = LocalVectorIndex(persist_directory, database_name, storage=vector_storage)
+                atexit.register(self.collection.persist)
+            else:
+                raise ValueError(f"Unknown vector backend: {backend}")
+            if vector_storage != "float32" and backend != "native":
+                logger.warning(f"vector_storage={vector_storage} only applies to the native backend; storing float32")
+            
+            # Async query path: model inference runs on a bounded pool, vector search on the async client
+            self.embed_workers = embed_workers
+            self._embed_executor = ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="embed")
+            self._async_collection = None
+            self._async_collection_lock = None
+            self._query_scheduler = None
+            if query_batch_size > 1:
+                self._query_scheduler = EmbeddingScheduler(
+                    self._embed_queries, self._embed_executor, max_batch=query_batch_size, max_wait_ms=query_batch_wait_ms
+                )
+            
+            # Bumped on every write so caches built on query results can detect changes
+            self._write_version = 0
             
             # Initialize embedding model with caching
-            self.embed_model = HuggingFaceEmbedding(
-                model_name=model_name,
-                cache_folder=cache_dir
-            )
+            self.embedder = create_embedding_backend(embedding_backend, model_name, cache_dir)
+            self.model_name = model_name
+            
+            # BM25 index over chunk texts for lexical and hybrid retrieval, kept in step with the collection
+            self.lexical_index = LexicalIndex(os.path.join(cache_dir, "lexical", database_name))
+            
+            # Content-addressed cache of computed vectors, keyed by (model, chunk text)
+            self.embedding_cache = None
+            if embedding_cache_size > 0:
+                self.embedding_cache = EmbeddingCache(cache_dir, self.embedder.cache_id, max_entries=embedding_cache_size)
+                atexit.register(self.embedding_cache.flush)
+            
+            # In-process LRU of query embeddings keyed by normalized query text
+            self.query_cache_size = query_cache_size
+            self._query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+            self._query_cache_lock = threading.Lock()
+            self._query_cache_hits = 0
+            self._query_cache_misses = 0
             
             logger.info(f"Database setup complete using {model_name} embedding model.")
         except Exception as e:
             logger.error(f"Error setting up database: {e}")
             raise
 
+    @classmethod
+    def embedding_worker(
+        cls,
+        model_name: str = "BAAI/bge-m3",
+        cache_dir: str = "./.cache",
+        embedding_backend: str = "torch"
+    ) -> "ChromaDatabase":
+        """
+        Create an instance that can only split and embed documents, without a vector store.
+        
+        Used by parallel ingestion worker processes, which each load their own copy of the model
+        and leave writing to the parent. The embedding cache is not opened, since its files
+        must only be written by one process.
+        
+        Args:
+            model_name (str): The name of the embedding model to use.
+            cache_dir (str): Directory the model files are cached in.
+            embedding_backend (str): How the embedding model runs: "torch", "onnx" or "onnx-int8".
+        """
+        self = cls.__new__(cls)
+        self.cache_dir = cache_dir
+        self.embedder = create_embedding_backend(embedding_backend, model_name, cache_dir)
+        self.model_name = model_name
+        self.embedding_cache = None
+        return self
+
+    def after_fork(self, threads: int = 1):
+        """
+        Re-create per-process state in a worker forked from the process that built this instance.
+        
+        Model weights, the native index's memory maps and the lexical index are inherited and
+        stay shared copy-on-write. Thread pools, locks and vector store connections do not
+        survive fork and are rebuilt. The on-disk embedding cache is detached: its slot index
+        is per-process, so workers writing to it would overwrite each other's rows.
+        
+        Args:
+            threads (int): Cores this worker's model inference may use.
+        """
+        self._embed_executor = ThreadPoolExecutor(max_workers=self.embed_workers, thread_name_prefix="embed")
+        if self._query_scheduler is not None:
+            self._query_scheduler.executor = self._embed_executor
+        self._async_collection = None
+        self._async_collection_lock = None
+        self._query_cache_lock = threading.Lock()
+        self.embedding_cache = None
+        self.embedder.after_fork(threads)
+        
+        name = self.collection.name
+        if self.backend == "http":
+            self.client = chromadb.HttpClient(host=self.host, port=self.port)
+            self.collection = self.client.get_or_create_collection(name=name)
+        elif self.backend == "persistent":
+            # Embedded Chroma holds SQLite handles and its own HNSW copy; each worker reopens it
+            logger.warning("The persistent backend is reopened per worker; use VECTOR_BACKEND=native to share the index")
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+            self.client = chromadb.PersistentClient(path=self.persist_directory)
+            self.collection = self.client.get_or_create_collection(name=name)
+        else:
+            self.collection.after_fork()
+        self.lexical_index.after_fork()
+
     def store_documents(
         self, 
         directory_path: str, 
         chunk_size: int = 1024, 
         chunk_overlap: int = 100, 
-        batch_size: int = 100
+        batch_size: int = 100,
+        max_batch_tokens: int = 16384,
+        queue_size: int = 4,
+        progress: Optional[Callable[[Dict[str, int]], None]] = None
     ):
         """
         Store documents from a directory into ChromaDB with batch processing and metadata.
         
+        Files are streamed through read/split -> embed -> add stages connected by bounded
+        queues, so peak memory is proportional to batch_size * queue_size rather than the
+        corpus, and embedding starts as soon as the first batch of chunks is ready.
+        
         Args:
             directory_path (str): The path to the directory containing documents.
             chunk_size (int): The size of each text chunk.
             chunk_overlap (int): The overlap between consecutive text chunks.
-            batch_size (int): Number of documents to process in each batch.
+            batch_size (int): Number of chunks to add to the collection in each batch.
+            max_batch_tokens (int): Upper bound on padded tokens per forward pass of the embedding model.
+            queue_size (int): Maximum number of batches buffered between pipeline stages.
+            progress (callable, optional): Called after every written batch with files_total,
+                files_read and chunks_stored.
         """
         try:
             logger.info(f"Loading documents from {directory_path}...")
             reader = SimpleDirectoryReader(input_dir=directory_path)
-            documents = reader.load_data()
-            logger.info(f"Loaded {len(documents)} documents.")
+            logger.info(f"Found {len(reader.input_files)} files.")
             
             # Initialize text splitter
             splitter = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
             
-            # Process documents and track metadata
-            chunks = []
-            metadatas = []
-            doc_count = 0
+            start_time = time.time()
+            manifest = {"settings": {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}, "files": {}}
+            counts = {"documents": 0, "files": 0}
+            
+            def chunk_stream():
+                for source_name, document_count, file_chunks in self._iter_files(reader, splitter, directory_path):
+                    counts["documents"] += document_count
+                    counts["files"] += 1
+                    # Record what was ingested so sync_directory can diff against it later
+                    if os.path.isfile(source_name):
+                        manifest["files"][os.path.relpath(source_name, directory_path)] = {
+                            **file_fingerprint(source_name),
+                            "chunk_ids": file_chunks["ids"]
+                        }
+                    yield from zip(file_chunks["ids"], file_chunks["chunks"], file_chunks["metadatas"])
+            
+            cache_hits_before = self.embedding_cache.hits if self.embedding_cache else 0
+            ingest_stats = self._ingest(
+                chunk_stream(),
+                batch_size=batch_size,
+                max_batch_tokens=max_batch_tokens,
+                queue_size=queue_size,
+                on_batch=progress and (lambda chunks: progress({
+                    "files_total": len(reader.input_files), "files_read": counts["files"], "chunks_stored": chunks
+                }))
+            )
+            self._save_manifest(manifest)
+            
+            if self.embedding_cache:
+                self.embedding_cache.flush()
+            metrics.INGESTED_DOCUMENTS.inc(counts["documents"])
+            metrics.INGEST_RUNS.inc(kind="full")
+            
+            processing_time = time.time() - start_time
+            chunk_count = ingest_stats["chunk_count"]
+            embedding_time = ingest_stats["embedding_time"]
+            token_count = ingest_stats["token_count"]
+            throughput = {
+                "embedding_time": embedding_time,
+                "token_count": token_count,
+                "chunks_per_second": chunk_count / embedding_time if embedding_time > 0 else 0.0,
+                "tokens_per_second": token_count / embedding_time if embedding_time > 0 else 0.0,
+                "cache_hits": (self.embedding_cache.hits - cache_hits_before) if self.embedding_cache else 0
+            }
+            logger.info(f"Documents stored successfully. Processed {chunk_count} chunks in {processing_time:.2f} seconds.")
+            logger.info(
+                f"Embedding throughput: {throughput['chunks_per_second']:.1f} chunks/s, "
+                f"{throughput['tokens_per_second']:.0f} tokens/s"
+            )
+            
+            return {
+                "document_count": counts["documents"],
+                "chunk_count": chunk_count,
+                "processing_time": processing_time,
+                "throughput": throughput
+            }
+            
+        except Exception as e:
+            logger.error(f"Error storing documents: {e}", exc_info=True)
+            raise
+
+    def sync_directory(
+        self,
+        directory_path: str,
+        chunk_size: int = 1024,
+        chunk_overlap: int = 100,
+        batch_size: int = 100,
+        max_batch_tokens: int = 16384,
+        queue_size: int = 4,
+        progress: Optional[Callable[[Dict[str, int]], None]] = None
+    ):
+        """
+        Incrementally bring the collection in line with a directory.
+        
+        Files are compared against the manifest written by the previous store/sync using size
+        and mtime, falling back to a content hash. Only new or changed files are re-split;
+        chunks whose content-derived ID already exists are not re-embedded, chunks that
+        disappeared are deleted, and chunks of removed files are deleted.
+        
+        Args:
+            directory_path (str): The path to the directory containing documents.
+            chunk_size (int): The size of each text chunk.
+            chunk_overlap (int): The overlap between consecutive text chunks.
+            batch_size (int): Number of chunks to add to the collection in each batch.
+            max_batch_tokens (int): Upper bound on padded tokens per forward pass of the embedding model.
+            queue_size (int): Maximum number of batches buffered between pipeline stages.
             
+        Returns:
+            dict: Counts of added, changed, removed and unchanged files and of upserted, updated and deleted chunks.
+        """
+        try:
             start_time = time.time()
-            for doc_idx, doc in enumerate(documents):
-                text_chunks = splitter.split_text(doc.text)
-                source_name = doc.metadata.get("file_path", f"document_{doc_idx}")
-                file_name = os.path.basename(source_name)
-                
-                for chunk_idx, chunk in enumerate(text_chunks):
-                    chunks.append(chunk)
-                    metadatas.append({
-                        "source": source_name,
-                        "file_name": file_name,
-                        "chunk_index": chunk_idx,
-                        "doc_index": doc_idx,
-                        "total_chunks": len(text_chunks)
-                    })
-                doc_count += 1
-                
-                # Log progress for large document sets
-                if doc_count % 10 == 0:
-                    logger.info(f"Processed {doc_count}/{len(documents)} documents")
-            
-            # Batch processing with metadata
-            total_batches = (len(chunks) + batch_size - 1) // batch_size
-            for i in range(0, len(chunks), batch_size):
-                batch_chunks = chunks[i:i+batch_size]
-                batch_metadatas = metadatas[i:i+batch_size]
+            settings = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+            manifest = self._load_manifest()
+            
+            previous_files = manifest.get("files", {}) if manifest else {}
+            if manifest and manifest.get("settings") != settings:
+                logger.info("Chunking settings changed since the last sync; re-splitting every file.")
+                previous_files = {
+                    relative: {**entry, "sha256": None, "mtime": None}
+                    for relative, entry in previous_files.items()
+                }
+            
+            reader = SimpleDirectoryReader(input_dir=directory_path)
+            paths = {os.path.relpath(str(path), directory_path): str(path) for path in reader.input_files}
+            
+            current_files: Dict[str, Dict[str, Any]] = {}
+            changed: Dict[str, Dict[str, Any]] = {}
+            for relative, path in paths.items():
+                entry = previous_files.get(relative)
+                stat = os.stat(path)
+                if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    current_files[relative] = entry
+                    continue
                 
-                # Generate embeddings
-                batch_embeddings = [self.embed_model.get_text_embedding(chunk) for chunk in batch_chunks]
+                fingerprint = file_fingerprint(path)
+                if entry and entry["sha256"] == fingerprint["sha256"]:
+                    current_files[relative] = {**entry, **fingerprint}
+                else:
+                    changed[relative] = fingerprint
+            
+            removed = [relative for relative in previous_files if relative not in paths]
+            stats = {
+                "added_files": sum(1 for relative in changed if relative not in previous_files),
+                "changed_files": sum(1 for relative in changed if relative in previous_files),
+                "removed_files": len(removed),
+                "unchanged_files": len(current_files),
+                "upserted_chunks": 0,
+                "updated_chunks": 0,
+                "deleted_chunks": 0
+            }
+            
+            stale_ids: List[str] = []
+            for relative in removed:
+                stale_ids.extend(previous_files[relative].get("chunk_ids", []))
+            
+            if changed:
+                splitter = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+                changed_reader = SimpleDirectoryReader(input_files=[paths[relative] for relative in changed])
+                moved_ids, moved_metadatas = [], []
+                files_read = [0]
                 
-                # Create unique IDs
-                batch_ids = [f"doc_{meta['doc_index']}_chunk_{meta['chunk_index']}" for meta in batch_metadatas]
+                def new_chunk_stream():
+                    for source_name, _, file_chunks in self._iter_files(changed_reader, splitter, directory_path):
+                        files_read[0] += 1
+                        relative = os.path.relpath(source_name, directory_path)
+                        old_ids = previous_files.get(relative, {}).get("chunk_ids", [])
+                        old_positions = {chunk_id: index for index, chunk_id in enumerate(old_ids)}
+                        
+                        for chunk_id, chunk, metadata in zip(file_chunks["ids"], file_chunks["chunks"], file_chunks["metadatas"]):
+                            if chunk_id not in old_positions:
+                                yield chunk_id, chunk, metadata
+                            elif old_positions[chunk_id] != metadata["chunk_index"] or len(old_ids) != metadata["total_chunks"]:
+                                # Same content, but its position in the file shifted
+                                moved_ids.append(chunk_id)
+                                moved_metadatas.append(metadata)
+                        
+                        kept = set(file_chunks["ids"])
+                        stale_ids.extend(chunk_id for chunk_id in old_ids if chunk_id not in kept)
+                        current_files[relative] = {**changed[relative], "chunk_ids": file_chunks["ids"]}
                 
-                # Add to collection
-                self.collection.add(
-                    documents=batch_chunks,
-                    embeddings=batch_embeddings,
-                    metadatas=batch_metadatas,
-                    ids=batch_ids
+                ingest_stats = self._ingest(
+                    new_chunk_stream(),
+                    batch_size=batch_size,
+                    max_batch_tokens=max_batch_tokens,
+                    queue_size=queue_size,
+                    on_batch=progress and (lambda chunks: progress({
+                        "files_total": len(changed), "files_read": files_read[0], "chunks_stored": chunks
+                    }))
                 )
                 
-                logger.info(f"Processed batch {i//batch_size + 1}/{total_batches}")
+                # Files the reader produced no text for still need their old chunks dropped
+                for relative in changed:
+                    if relative not in current_files:
+                        stale_ids.extend(previous_files.get(relative, {}).get("chunk_ids", []))
+                        current_files[relative] = {**changed[relative], "chunk_ids": []}
+                
+                for i in range(0, len(moved_ids), batch_size):
+                    self.collection.update(ids=moved_ids[i:i+batch_size], metadatas=moved_metadatas[i:i+batch_size])
+                stats["upserted_chunks"] = ingest_stats["chunk_count"]
+                stats["updated_chunks"] = len(moved_ids)
             
-            processing_time = time.time() - start_time
-            logger.info(f"Documents stored successfully. Processed {len(chunks)} chunks in {processing_time:.2f} seconds.")
+            if manifest is None and self.collection.count() > 0:
+                # No manifest yet: drop anything not produced by this sync (e.g. order-based legacy IDs)
+                known = {chunk_id for entry in current_files.values() for chunk_id in entry["chunk_ids"]}
+                existing = self.collection.get(include=[])["ids"]
+                stale_ids.extend(chunk_id for chunk_id in existing if chunk_id not in known)
             
-            return {
-                "document_count": len(documents),
-                "chunk_count": len(chunks),
-                "processing_time": processing_time
-            }
+            for i in range(0, len(stale_ids), batch_size):
+                self.collection.delete(ids=stale_ids[i:i+batch_size])
+            self.lexical_index.delete(stale_ids)
+            stats["deleted_chunks"] = len(stale_ids)
+            
+            self._save_manifest({"settings": settings, "files": current_files})
+            if self.embedding_cache:
+                self.embedding_cache.flush()
+            
+            stats["processing_time"] = time.time() - start_time
+            metrics.INGEST_RUNS.inc(kind="sync")
+            logger.info(
+                f"Synced {directory_path}: {stats['added_files']} added, {stats['changed_files']} changed, "
+                f"{stats['removed_files']} removed, {stats['unchanged_files']} unchanged files; "
+                f"{stats['upserted_chunks']} chunks upserted, {stats['deleted_chunks']} deleted "
+                f"in {stats['processing_time']:.2f} seconds."
+            )
+            return stats
             
         except Exception as e:
-            logger.error(f"Error storing documents: {e}", exc_info=True)
+            logger.error(f"Error syncing documents: {e}", exc_info=True)
             raise
 
+    def _iter_files(self, reader, splitter, directory_path: str):
+        """
+        Lazily read and split one file at a time.
+        
+        Yields:
+            tuple: (source path, number of documents read, {"ids", "chunks", "metadatas"}) per file.
+        """
+        total_files = len(reader.input_files)
+        for file_idx, documents in enumerate(reader.iter_data()):
+            for source_name, file_chunks in self._chunk_documents(documents, splitter, directory_path).items():
+                yield source_name, len(documents), file_chunks
+            
+            # Log progress for large document sets
+            if (file_idx + 1) % 10 == 0:
+                logger.info(f"Processed {file_idx + 1}/{total_files} files")
+
+    def _chunk_documents(self, documents, splitter, directory_path: str) -> Dict[str, Dict[str, List[Any]]]:
+        """
+        Split documents into chunks with stable IDs, grouped by source file.
+        
+        Returns:
+            dict: Source path -> {"ids", "chunks", "metadatas"} lists in file order.
+        """
+        texts_by_source: Dict[str, List[str]] = {}
+        for doc_idx, doc in enumerate(documents):
+            source_name = doc.metadata.get("file_path", f"document_{doc_idx}")
+            texts_by_source.setdefault(source_name, []).extend(splitter.split_text(doc.text))
+        
+        files = {}
+        for source_name, text_chunks in texts_by_source.items():
+            relative = os.path.relpath(source_name, directory_path) if os.path.exists(source_name) else source_name
+            file_name = os.path.basename(source_name)
+            occurrences: Dict[str, int] = {}
+            ids, metadatas = [], []
+            for chunk_idx, chunk in enumerate(text_chunks):
+                base_id = stable_chunk_id(relative, chunk)
+                ids.append(stable_chunk_id(relative, chunk, occurrences.get(base_id, 0)))
+                occurrences[base_id] = occurrences.get(base_id, 0) + 1
+                metadatas.append({
+                    "source": source_name,
+                    "file_name": file_name,
+                    "chunk_index": chunk_idx,
+                    "total_chunks": len(text_chunks)
+                })
+            files[source_name] = {"ids": ids, "chunks": text_chunks, "metadatas": metadatas}
+        return files
+
+    def _ingest(
+        self,
+        chunk_stream: Iterable[Tuple[str, str, Dict[str, Any]]],
+        batch_size: int = 100,
+        max_batch_tokens: int = 16384,
+        queue_size: int = 4,
+        on_batch: Optional[Callable[[int], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Embed and upsert a stream of (id, chunk, metadata) tuples.
+        
+        Batching runs in one background thread and embedding in another, each handing results
+        on through a queue of at most queue_size batches, while the calling thread writes to
+        the collection. A slow stage therefore applies backpressure instead of letting work
+        pile up in memory. on_batch, if given, is called with the running chunk count after
+        every write.
+        
+        Returns:
+            dict: Number of chunks written, seconds spent embedding and tokens run through the model.
+        """
+        stats = {"chunk_count": 0, "embedding_time": 0.0, "token_count": 0}
+        
+        def batches():
+            batch = []
+            for item in chunk_stream:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        
+        def embedded_batches():
+            for batch in _prefetch(batches(), queue_size):
+                batch_ids, batch_chunks, batch_metadatas = (list(column) for column in zip(*batch))
+                
+                # Generate embeddings
+                embed_start = time.time()
+                batch_embeddings, batch_tokens = self._embed_batch(batch_chunks, max_batch_tokens=max_batch_tokens)
+                stats["embedding_time"] += time.time() - embed_start
+                stats["token_count"] += batch_tokens
+                metrics.INGEST_EMBEDDING_SECONDS.inc(time.time() - embed_start)
+                metrics.INGESTED_TOKENS.inc(batch_tokens)
+                yield batch_ids, batch_chunks, batch_metadatas, batch_embeddings
+        
+        for batch_number, (batch_ids, batch_chunks, batch_metadatas, batch_embeddings) in enumerate(
+            _prefetch(embedded_batches(), queue_size), start=1
+        ):
+            self._write_chunks(batch_ids, batch_chunks, batch_metadatas, batch_embeddings)
+            stats["chunk_count"] += len(batch_ids)
+            logger.info(f"Processed batch {batch_number} ({stats['chunk_count']} chunks so far)")
+            if on_batch:
+                on_batch(stats["chunk_count"])
+        
+        return stats
+
+    def _write_chunks(self, ids: List[str], chunks: List[str], metadatas: List[Dict[str, Any]], embeddings: List[List[float]]):
+        """Write one batch of embedded chunks to the collection and the lexical index."""
+        # Upsert so re-ingesting unchanged content is idempotent
+        self.collection.upsert(
+            documents=chunks,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=ids
+        )
+        self.lexical_index.add(ids, chunks)
+        metrics.INGESTED_CHUNKS.inc(len(ids))
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.cache_dir, "manifests", f"{self.collection.name}.json")
+
+    def _load_manifest(self) -> Optional[Dict[str, Any]]:
+        """Load the ingestion manifest for this collection, or None if there is none yet."""
+        path = self._manifest_path()
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        """Atomically write the ingestion manifest for this collection."""
+        # The native index buffers document text in memory; persist it alongside the manifest
+        if self.backend == "native":
+            self.collection.persist()
+        self.lexical_index.persist()
+        path = self._manifest_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(f"{path}.tmp", path)
+        self._write_version += 1
+
+    def get_collection_version(self):
+        """
+        Return a cheap token that changes whenever the collection content changes.
+        
+        Combines writes made through this instance with the manifest's mtime, so ingestion
+        run by another process sharing the same cache_dir is picked up too.
+        """
+        try:
+            manifest_mtime = os.stat(self._manifest_path()).st_mtime_ns
+        except OSError:
+            manifest_mtime = None
+        return (self._write_version, manifest_mtime)
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Count tokens in each text with the embedding model's tokenizer, without truncation.
+        
+        Used to budget LLM context; falls back to an approximation without a tokenizer.
+        """
+        return self.embedder.count_tokens(texts, truncate=False)
+
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        """
+        Count model tokens for each text, used to bucket texts of similar length together.
+        
+        Falls back to a whitespace count when the embedding model does not expose its tokenizer.
+        """
+        return self.embedder.count_tokens(texts, truncate=True)
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        """Run a single padded forward pass of the embedding model over texts."""
+        return self.embedder.encode(texts)
+
+    def _embed_batch(self, texts: List[str], max_batch_tokens: int = 16384):
+        """
+        Embed texts in length-bucketed batches bounded by a padded token budget.
+        
+        Texts already in the embedding cache are served from it. The rest are sorted by token
+        length so each forward pass pads to a similar length, and a batch is closed once
+        (longest text * batch size) would exceed max_batch_tokens.
+        
+        Args:
+            texts (List[str]): The texts to embed.
+            max_batch_tokens (int): Upper bound on padded tokens per forward pass.
+            
+        Returns:
+            tuple: Embeddings in the same order as texts, and the total number of tokens run through the model.
+        """
+        if not texts:
+            return [], 0
+        
+        if self.embedding_cache:
+            embeddings = self.embedding_cache.get_many(texts)
+        else:
+            embeddings = [None] * len(texts)
+        
+        missing = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings, 0
+        
+        lengths = [0] * len(texts)
+        for idx, length in zip(missing, self._token_lengths([texts[idx] for idx in missing])):
+            lengths[idx] = length
+        order = sorted(missing, key=lengths.__getitem__)
+        
+        bucket: List[int] = []
+        for idx in order:
+            # Sorted ascending, so the incoming text sets the padded length of the bucket
+            if bucket and max(lengths[idx], 1) * (len(bucket) + 1) > max_batch_tokens:
+                for bucket_idx, embedding in zip(bucket, self._encode([texts[j] for j in bucket])):
+                    embeddings[bucket_idx] = embedding
+                bucket = []
+            bucket.append(idx)
+        
+        if bucket:
+            for bucket_idx, embedding in zip(bucket, self._encode([texts[j] for j in bucket])):
+                embeddings[bucket_idx] = embedding
+        
+        if self.embedding_cache:
+            self.embedding_cache.put_many([texts[idx] for idx in missing], [embeddings[idx] for idx in missing])
+        
+        return embeddings, sum(lengths)
+
+    def _embed_query(self, query: str) -> List[float]:
+        """Embed a single query, consulting the in-process LRU and then the embedding cache first."""
+        return self._embed_queries([query])[0]
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed several queries with one forward pass over those not already cached.
+        
+        Each query is looked up in the in-process LRU (by normalized text) and then in the
+        embedding cache; the remaining distinct queries are encoded together. New query vectors
+        only go into the LRU: the embedding cache holds chunk vectors, and question text written
+        there would evict them.
+        """
+        keys = [normalize_query(query) for query in queries]
+        embeddings: Dict[str, List[float]] = {}
+        if self.query_cache_size > 0:
+            with self._query_cache_lock:
+                for key in keys:
+                    cached = self._query_embeddings.get(key)
+                    if cached is not None:
+                        self._query_embeddings.move_to_end(key)
+                        self._query_cache_hits += 1
+                        embeddings[key] = cached
+                    else:
+                        self._query_cache_misses += 1
+        
+        misses = list({key: query for key, query in zip(keys, queries) if key not in embeddings}.items())
+        if misses:
+            miss_texts = [query for _, query in misses]
+            vectors = self.embedding_cache.get_many(miss_texts) if self.embedding_cache else [None] * len(misses)
+            to_encode = [position for position, vector in enumerate(vectors) if vector is None]
+            if to_encode:
+                encoded = self._encode([miss_texts[position] for position in to_encode])
+                for position, vector in zip(to_encode, encoded):
+                    vectors[position] = vector
+            
+            for (key, _), vector in zip(misses, vectors):
+                embeddings[key] = vector
+            if self.query_cache_size > 0:
+                with self._query_cache_lock:
+                    for key, _ in misses:
+                        self._query_embeddings[key] = embeddings[key]
+                        self._query_embeddings.move_to_end(key)
+                    while len(self._query_embeddings) > self.query_cache_size:
+                        self._query_embeddings.popitem(last=False)
+        return [embeddings[key] for key in keys]
+
+    def warm_up(self) -> float:
+        """
+        Run dummy inference through the query and ingestion embedding paths.
+        
+        Forces lazy model/tokenizer initialization so the first real query does not pay for it.
+        
+        Returns:
+            float: Seconds spent warming up.
+        """
+        start_time = time.time()
+        self._token_lengths(["warm up query"])
+        self._encode(["warm up document"])
+        warm_up_time = time.time() - start_time
+        logger.info(f"Embedding model warmed up in {warm_up_time:.2f} seconds")
+        return warm_up_time
+
+    def query_cache_stats(self) -> Dict[str, Any]:
+        lookups = self._query_cache_hits + self._query_cache_misses
+        return {
+            "size": len(self._query_embeddings),
+            "max_size": self.query_cache_size,
+            "hits": self._query_cache_hits,
+            "misses": self._query_cache_misses,
+            "hit_rate": self._query_cache_hits / lookups if lookups else 0.0
+        }
+
     def query_rag(
         self, 
         query: str, 
         top_n: int = 5, 
         similarity_threshold: Optional[float] = None,
-        include_metadata: bool = True
+        include_metadata: bool = True,
+        include_embeddings: bool = False,
+        retrieval_mode: str = "dense"
     ):
         """
         Query the ChromaDB collection and retrieve top results.
@@ -151,57 +827,427 @@ class ChromaDatabase:
             top_n (int): The number of top results to retrieve.
             similarity_threshold (float, optional): If set, filter results below this similarity threshold.
             include_metadata (bool): Whether to include metadata in results.
+            include_embeddings (bool): Whether to return the stored chunk vectors; off by default
+                since they dominate the response size.
+            retrieval_mode (str): "dense" (vector similarity), "lexical" (BM25) or "hybrid"
+                (reciprocal rank fusion of both).
             
         Returns:
-            dict: Query results including documents, metadata, and distances.
+            dict: Query results including documents, metadata, distances, and per-stage 'timings' in seconds.
         """
         try:
             start_time = time.time()
-            print("Query = ", query)
+            stage_start = time.perf_counter()
+            logger.debug("Query = %s", query)
             
             # Generate embedding for query
-            query_embedding = self.embed_model.get_text_embedding(query)
+            query_embedding = self._embed_query(query)
+            embedded = time.perf_counter()
             
             # Query the collection
-            results = self.collection.query(
-                query_embeddings=[query_embedding], 
-                n_results=top_n,
-                include=["documents", "metadatas", "distances", "embeddings"] if include_metadata else ["documents", "distances"]
-            )
-            print("Top Results:", results)
-            #print(results)
-            print(len(results['documents']))
+            if retrieval_mode == "dense":
+                results = self.collection.query(
+                    query_embeddings=[query_embedding], 
+                    n_results=top_n,
+                    include=self._query_include(include_metadata, include_embeddings)
+                )
+            else:
+                results = self._hybrid_query(
+                    query, query_embedding, top_n, include_metadata, include_embeddings, retrieval_mode
+                )
+            logger.debug("Top results: %s", results)
+            searched = time.perf_counter()
             query_time = time.time() - start_time
             logger.info(f"Query completed in {query_time:.4f} seconds")
             
-            # Filter by similarity threshold if specified
-            if similarity_threshold is not None and results['distances'] and results['distances'][0]:
-                distances = results['distances'][0]
-                mask = [distance >= similarity_threshold for distance in distances]
-                
-                filtered_results = {
-                    'ids': [[id for id, m in zip(results['ids'][0], mask) if m]] if 'ids' in results else [],
-                    'documents': [[doc for doc, m in zip(results['documents'][0], mask) if m]],
-                    'metadatas': [[meta for meta, m in zip(results['metadatas'][0], mask) if m]] if 'metadatas' in results else [],
-                    'distances': [[dist for dist, m in zip(distances, mask) if m]],
-                    'query_time': query_time
-                }
-                
-                logger.info(f"Filtered from {len(distances)} to {len(filtered_results['distances'][0])} results using threshold {similarity_threshold}")
-                return filtered_results
+            results = self._filter_results(results, similarity_threshold, query_time)
+            results['timings'] = {
+                "embed": embedded - stage_start,
+                "search": searched - embedded,
+                "filter": time.perf_counter() - searched
+            }
+            return results
             
-            # Add query time to results
-            results['query_time'] = query_time
+        except Exception as e:
+            logger.error(f"Error querying database: {e}", exc_info=True)
+            raise
+
+    async def aquery_rag(
+        self,
+        query: str,
+        top_n: int = 5,
+        similarity_threshold: Optional[float] = None,
+        include_metadata: bool = True,
+        include_embeddings: bool = False,
+        include_query_embedding: bool = False,
+        retrieval_mode: str = "dense"
+    ):
+        """
+        Non-blocking variant of query_rag for use inside the event loop.
+        
+        The query embedding runs on the bounded embedding thread pool and the vector search
+        goes through chromadb's AsyncHttpClient (or a worker thread if it is unavailable), so
+        the event loop keeps serving other requests meanwhile.
+        
+        Args:
+            query (str): The query string.
+            top_n (int): The number of top results to retrieve.
+            similarity_threshold (float, optional): If set, filter results below this similarity threshold.
+            include_metadata (bool): Whether to include metadata in results.
+            include_embeddings (bool): Whether to return the stored chunk vectors.
+            include_query_embedding (bool): Whether to return the query embedding under 'query_embedding'.
+            retrieval_mode (str): "dense", "lexical" or "hybrid"; see query_rag.
+            
+        Returns:
+            dict: Query results including documents, metadata, distances, and per-stage 'timings' in seconds.
+        """
+        try:
+            start_time = time.time()
+            stage_start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            
+            # Generate embedding for query, batched with other concurrent queries when enabled
+            if self._query_scheduler is not None:
+                query_embedding = await self._query_scheduler.embed(query)
+            else:
+                query_embedding = await loop.run_in_executor(self._embed_executor, self._embed_query, query)
+            embedded = time.perf_counter()
+            
+            # Query the collection
+            query_kwargs = {
+                "query_embeddings": [query_embedding],
+                "n_results": top_n,
+                "include": self._query_include(include_metadata, include_embeddings)
+            }
+            if retrieval_mode != "dense":
+                results = await asyncio.to_thread(
+                    self._hybrid_query,
+                    query, query_embedding, top_n, include_metadata, include_embeddings, retrieval_mode
+                )
+            else:
+                async_collection = await self._get_async_collection()
+                if async_collection is not None:
+                    results = await async_collection.query(**query_kwargs)
+                else:
+                    results = await asyncio.to_thread(self.collection.query, **query_kwargs)
+            searched = time.perf_counter()
+            
+            query_time = time.time() - start_time
+            logger.info(f"Query completed in {query_time:.4f} seconds")
+            
+            results = self._filter_results(results, similarity_threshold, query_time)
+            results['timings'] = {
+                "embed": embedded - stage_start,
+                "search": searched - embedded,
+                "filter": time.perf_counter() - searched
+            }
+            if include_query_embedding:
+                results['query_embedding'] = query_embedding
             return results
             
         except Exception as e:
             logger.error(f"Error querying database: {e}", exc_info=True)
             raise
 
+    def query_rag_batch(
+        self,
+        queries: List[str],
+        top_n: int = 5,
+        similarity_threshold: Optional[float] = None,
+        include_metadata: bool = True,
+        include_embeddings: bool = False,
+        include_query_embedding: bool = False,
+        retrieval_mode: str = "dense",
+        batch_size: int = 64
+    ) -> List[Dict[str, Any]]:
+        """
+        Query the collection for many questions at once.
+        
+        Queries are embedded batch_size at a time, shortest first so similar lengths share
+        padding, and each batch is searched with a single multi-vector collection query.
+        Lexical and hybrid modes still rank each query on its own, since BM25 is per query.
+        
+        Args:
+            queries (list): The query strings.
+            top_n (int): The number of top results to retrieve per query.
+            similarity_threshold (float, optional): If set, filter results below this similarity threshold.
+            include_metadata (bool): Whether to include metadata in results.
+            include_embeddings (bool): Whether to return the stored chunk vectors.
+            include_query_embedding (bool): Whether to return each query embedding under 'query_embedding'.
+            retrieval_mode (str): "dense", "lexical" or "hybrid"; see query_rag.
+            batch_size (int): Queries per forward pass and per collection query.
+            
+        Returns:
+            list: One query_rag-shaped result per query, in input order. 'query_time' and 'timings'
+                (embed/search/filter seconds) cover the whole batch.
+        """
+        try:
+            start_time = time.time()
+            timings = {"embed": 0.0, "search": 0.0, "filter": 0.0}
+            results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+            
+            for batch in self._query_batches(queries, batch_size):
+                stage_start = time.perf_counter()
+                vectors = self._embed_queries([queries[index] for index in batch])
+                timings["embed"] += time.perf_counter() - stage_start
+                self._search_batch(
+                    queries, batch, vectors, results, timings, top_n, similarity_threshold,
+                    include_metadata, include_embeddings, include_query_embedding, retrieval_mode
+                )
+            
+            return self._finish_batch(results, timings, start_time)
+            
+        except Exception as e:
+            logger.error(f"Error querying database in batch: {e}", exc_info=True)
+            raise
+
+    async def aquery_rag_batch(
+        self,
+        queries: List[str],
+        top_n: int = 5,
+        similarity_threshold: Optional[float] = None,
+        include_metadata: bool = True,
+        include_embeddings: bool = False,
+        include_query_embedding: bool = False,
+        retrieval_mode: str = "dense",
+        batch_size: int = 64
+    ) -> List[Dict[str, Any]]:
+        """
+        Non-blocking variant of query_rag_batch for use inside the event loop.
+        
+        Each batch's forward pass is one job on the bounded embedding thread pool that
+        interactive queries use, so a large batch queues alongside them instead of adding
+        threads; the searches run in a worker thread.
+        
+        Args:
+            Same as query_rag_batch.
+            
+        Returns:
+            list: One query_rag-shaped result per query, in input order.
+        """
+        try:
+            start_time = time.time()
+            timings = {"embed": 0.0, "search": 0.0, "filter": 0.0}
+            results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+            loop = asyncio.get_running_loop()
+            
+            for batch in self._query_batches(queries, batch_size):
+                stage_start = time.perf_counter()
+                vectors = await loop.run_in_executor(
+                    self._embed_executor, self._embed_queries, [queries[index] for index in batch]
+                )
+                timings["embed"] += time.perf_counter() - stage_start
+                await asyncio.to_thread(
+                    self._search_batch,
+                    queries, batch, vectors, results, timings, top_n, similarity_threshold,
+                    include_metadata, include_embeddings, include_query_embedding, retrieval_mode
+                )
+            
+            return self._finish_batch(results, timings, start_time)
+            
+        except Exception as e:
+            logger.error(f"Error querying database in batch: {e}", exc_info=True)
+            raise
+
+    @staticmethod
+    def _query_batches(queries: List[str], batch_size: int) -> List[List[int]]:
+        """Split query positions into batches, shortest queries first so similar lengths share padding"""
+        order = sorted(range(len(queries)), key=lambda index: len(queries[index]))
+        return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+    def _search_batch(
+        self,
+        queries: List[str],
+        batch: List[int],
+        vectors: List[List[float]],
+        results: List[Optional[Dict[str, Any]]],
+        timings: Dict[str, float],
+        top_n: int,
+        similarity_threshold: Optional[float],
+        include_metadata: bool,
+        include_embeddings: bool,
+        include_query_embedding: bool,
+        retrieval_mode: str
+    ):
+        """Search one embedded batch, storing each filtered result at its query's position in results"""
+        stage_start = time.perf_counter()
+        if retrieval_mode == "dense":
+            found = self.collection.query(
+                query_embeddings=vectors, n_results=top_n, include=self._query_include(include_metadata, include_embeddings)
+            )
+            fields = [
+                field for field in ("ids", "documents", "metadatas", "distances", "embeddings")
+                if found.get(field) is not None
+            ]
+            batch_results = [{field: [found[field][position]] for field in fields} for position in range(len(batch))]
+        else:
+            batch_results = [
+                self._hybrid_query(queries[index], vector, top_n, include_metadata, include_embeddings, retrieval_mode)
+                for index, vector in zip(batch, vectors)
+            ]
+        searched = time.perf_counter()
+        
+        for index, vector, result in zip(batch, vectors, batch_results):
+            result = self._filter_results(result, similarity_threshold, 0.0)
+            if include_query_embedding:
+                result['query_embedding'] = vector
+            results[index] = result
+        timings["search"] += searched - stage_start
+        timings["filter"] += time.perf_counter() - searched
+
+    @staticmethod
+    def _finish_batch(results: List[Dict[str, Any]], timings: Dict[str, float], start_time: float) -> List[Dict[str, Any]]:
+        query_time = time.time() - start_time
+        for result in results:
+            result['query_time'] = query_time
+            result['timings'] = timings
+        logger.info(f"Batch of {len(results)} queries completed in {query_time:.4f} seconds")
+        return results
+
+    async def _get_async_collection(self):
+        """Lazily connect chromadb's AsyncHttpClient, returning None if this chromadb has no async client."""
+        if self._async_collection is not None:
+            return self._async_collection
+        if self.backend != "http" or not hasattr(chromadb, "AsyncHttpClient"):
+            return None
+        
+        if self._async_collection_lock is None:
+            self._async_collection_lock = asyncio.Lock()
+        async with self._async_collection_lock:
+            if self._async_collection is None:
+                async_client = await chromadb.AsyncHttpClient(host=self.host, port=self.port)
+                self._async_collection = await async_client.get_or_create_collection(name=self.collection.name)
+        return self._async_collection
+
+    def _hybrid_query(
+        self,
+        query: str,
+        query_embedding: List[float],
+        top_n: int,
+        include_metadata: bool,
+        include_embeddings: bool,
+        retrieval_mode: str,
+        rrf_k: int = 60
+    ) -> Dict[str, Any]:
+        """
+        Rank chunks by BM25 ("lexical") or by reciprocal rank fusion of BM25 and dense ranks ("hybrid").
+        
+        Each ranking considers several times top_n candidates, and only the fused top_n chunks
+        are fetched from the collection. Chunks the dense search did not return get their
+        distance computed from the stored vector, so results keep the collection query shape.
+        """
+        if retrieval_mode not in ("lexical", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        
+        candidates = max(top_n * 4, 20)
+        rankings = [[chunk_id for chunk_id, _ in self.lexical_index.search(query, candidates)]]
+        dense_distances: Dict[str, float] = {}
+        if retrieval_mode == "hybrid":
+            dense = self.collection.query(query_embeddings=[query_embedding], n_results=candidates, include=["distances"])
+            dense_distances = dict(zip(dense["ids"][0], dense["distances"][0]))
+            rankings.append(dense["ids"][0])
+        fused = reciprocal_rank_fusion(rankings, k=rrf_k)[:top_n]
+        
+        results: Dict[str, Any] = {"ids": [[]], "documents": [[]], "distances": [[]]}
+        if include_metadata:
+            results["metadatas"] = [[]]
+        if include_embeddings:
+            results["embeddings"] = [[]]
+        if not fused:
+            return results
+        
+        need_vectors = include_embeddings or any(chunk_id not in dense_distances for chunk_id in fused)
+        fetched = self.collection.get(
+            ids=fused,
+            include=["documents"] + (["metadatas"] if include_metadata else []) + (["embeddings"] if need_vectors else [])
+        )
+        rows = {chunk_id: row for row, chunk_id in enumerate(fetched["ids"])}
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        for chunk_id in fused:
+            row = rows.get(chunk_id)
+            if row is None:
+                continue
+            if chunk_id in dense_distances:
+                distance = dense_distances[chunk_id]
+            else:
+                # Squared L2, Chroma's default distance
+                distance = float(np.sum((np.asarray(fetched["embeddings"][row], dtype=np.float32) - query_vector) ** 2))
+            results["ids"][0].append(chunk_id)
+            results["documents"][0].append(fetched["documents"][row])
+            results["distances"][0].append(distance)
+            if include_metadata:
+                results["metadatas"][0].append(fetched["metadatas"][row])
+            if include_embeddings:
+                results["embeddings"][0].append(fetched["embeddings"][row])
+        return results
+
+    def rebuild_lexical_index(self, batch_size: int = 1000) -> int:
+        """
+        Rebuild the BM25 index from the documents already stored in the collection.
+        
+        Needed once for collections ingested before the lexical index existed.
+        
+        Returns:
+            int: Number of chunks indexed.
+        """
+        try:
+            self.lexical_index.clear()
+            offset = 0
+            while True:
+                page = self.collection.get(include=["documents"], limit=batch_size, offset=offset)
+                if not page["ids"]:
+                    break
+                self.lexical_index.add(page["ids"], page["documents"])
+                offset += len(page["ids"])
+            self.lexical_index.persist()
+            logger.info(f"Rebuilt lexical index with {self.lexical_index.count()} chunks")
+            return self.lexical_index.count()
+        except Exception as e:
+            logger.error(f"Error rebuilding lexical index: {e}")
+            raise
+
+    def _query_include(self, include_metadata: bool, include_embeddings: bool = False) -> List[str]:
+        """Fields to fetch from the collection; vectors only when explicitly requested."""
+        include = ["documents", "distances"]
+        if include_metadata:
+            include.append("metadatas")
+        if include_embeddings:
+            include.append("embeddings")
+        return include
+
+    def _filter_results(self, results, similarity_threshold: Optional[float], query_time: float):
+        """Apply the optional similarity threshold and attach the query time to collection query results."""
+        # Filter by similarity threshold if specified
+        if similarity_threshold is not None and results['distances'] and results['distances'][0]:
+            distances = results['distances'][0]
+            mask = [distance >= similarity_threshold for distance in distances]
+            
+            filtered_results = {
+                'ids': [[id for id, m in zip(results['ids'][0], mask) if m]] if 'ids' in results else [],
+                'documents': [[doc for doc, m in zip(results['documents'][0], mask) if m]],
+                'metadatas': [[meta for meta, m in zip(results['metadatas'][0], mask) if m]] if 'metadatas' in results else [],
+                'distances': [[dist for dist, m in zip(distances, mask) if m]],
+                'query_time': query_time
+            }
+            
+            logger.info(f"Filtered from {len(distances)} to {len(filtered_results['distances'][0])} results using threshold {similarity_threshold}")
+            return filtered_results
+        
+        # Add query time to results
+        results['query_time'] = query_time
+        return results
+
     def delete_collection(self):
         """Delete the current collection"""
         try:
-            self.client.delete_collection(self.collection.name)
+            if self.backend == "native":
+                self.collection.drop()
+            else:
+                self.client.delete_collection(self.collection.name)
+            self.lexical_index.clear()
+            if os.path.exists(self._manifest_path()):
+                os.remove(self._manifest_path())
+            self._write_version += 1
             logger.info(f"Collection {self.collection.name} deleted successfully")
             return {"status": "success", "message": f"Collection {self.collection.name} deleted"}
         except Exception as e:
@@ -215,7 +1261,14 @@ class ChromaDatabase:
             return {
                 "collection_name": self.collection.name,
                 "document_count": count,
-                "embedding_model": self.embed_model.model_name
+                "embedding_model": self.model_name,
+                "embedding_backend": self.embedder.name,
+                "backend": self.backend,
+                "vector_index": self.collection.stats() if self.backend == "native" else None,
+                "embedding_cache": self.embedding_cache.stats() if self.embedding_cache else None,
+                "query_embedding_cache": self.query_cache_stats(),
+                "query_batching": self._query_scheduler.stats() if self._query_scheduler else None,
+                "lexical_index": self.lexical_index.stats()
             }
         except Exception as e:
             logger.error(f"Error getting collection stats: {e}")
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_BYTES = 16
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of embedding vectors.
+
+    Vectors live in a memory-mapped float32 matrix, one row per slot. A parallel memory-mapped
+    array of 16-byte keys (hash of model name + chunk text) is the index: it is rebuilt into a
+    dict on load, and because each row's key is written next to its vector a slot can never be
+    read back under a stale key after eviction. A per-slot tick array records recency so the
+    least recently used entries are evicted once max_entries is reached.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 200_000):
+        """
+        Open (or create) the cache for a given embedding model.
+
+        Args:
+            cache_dir (str): Root cache directory; vectors go under cache_dir/embeddings/<model>.
+            model_name (str): The embedding model name, part of every cache key.
+            max_entries (int): Maximum number of vectors kept on disk before LRU eviction.
+        """
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.directory = os.path.join(cache_dir, "embeddings", re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._keys_path = os.path.join(self.directory, "keys.bin")
+        self._ticks_path = os.path.join(self.directory, "ticks.bin")
+
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[bytes, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._dim: Optional[int] = None
+        self._capacity = 0
+        self._tick = 0
+        self._vectors = None
+        self._keys = None
+        self._ticks = None
+        self.hits = 0
+        self.misses = 0
+
+        self._load()
+
+    def key(self, text: str) -> bytes:
+        """Return the content address of a text for this cache's model."""
+        digest = hashlib.blake2b(digest_size=KEY_BYTES)
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.digest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached embeddings.
+
+        Returns:
+            list: One entry per text, either the cached vector or None on a miss.
+        """
+        keys = [self.key(text) for text in texts]
+        results: List[Optional[List[float]]] = []
+        with self._lock:
+            for key in keys:
+                slot = self._index.get(key)
+                if slot is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self._index.move_to_end(key)
+                self._tick += 1
+                self._ticks[slot] = self._tick
+                self.hits += 1
+                results.append(self._vectors[slot].tolist())
+        return results
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]]):
+        """Store embeddings for texts, evicting the least recently used entries if full."""
+        if not texts:
+            return
+
+        with self._lock:
+            dim = len(embeddings[0])
+            if self._dim != dim:
+                if self._dim is not None:
+                    logger.warning(f"Embedding dimension changed from {self._dim} to {dim}; resetting cache.")
+                self._reset(dim)
+
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                slot = self._index.get(key)
+                if slot is None:
+                    slot = self._allocate_slot()
+                    self._index[key] = slot
+                else:
+                    self._index.move_to_end(key)
+                # Write the vector before its key so a crash never exposes a half-written row
+                self._vectors[slot] = embedding
+                self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._tick += 1
+                self._ticks[slot] = self._tick
+
+    def flush(self):
+        """Flush memory-mapped arrays to disk."""
+        with self._lock:
+            for array in (self._vectors, self._keys, self._ticks):
+                if array is not None:
+                    array.flush()
+
+    def stats(self):
+        """Return size and hit/miss counters for the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def _load(self):
+        """Rebuild the in-memory index from the key and tick arrays on disk."""
+        if not os.path.exists(self._meta_path):
+            return
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+            if meta.get("model_name") != self.model_name:
+                logger.warning(f"Embedding cache at {self.directory} belongs to another model; ignoring it.")
+                return
+            self._dim = meta["dim"]
+            self._capacity = meta["capacity"]
+            self._open_arrays("r+")
+        except Exception as e:
+            logger.warning(f"Could not load embedding cache from {self.directory}: {e}")
+            self._dim = None
+            self._capacity = 0
+            return
+
+        occupied = np.flatnonzero(self._keys.any(axis=1))
+        occupied = occupied[np.argsort(self._ticks[occupied], kind="stable")]
+        # Keep the most recently used entries if max_entries shrank since the cache was written
+        excess = max(len(occupied) - self.max_entries, 0)
+        for slot in occupied[:excess]:
+            self._keys[slot] = 0
+        occupied = occupied[excess:]
+        for slot in occupied:
+            self._index[self._keys[slot].tobytes()] = int(slot)
+        used = set(int(slot) for slot in occupied)
+        self._free = [slot for slot in range(self._capacity - 1, -1, -1) if slot not in used]
+        self._tick = int(self._ticks.max()) if self._capacity else 0
+        logger.info(f"Loaded embedding cache with {len(self._index)} entries from {self.directory}")
+
+    def _reset(self, dim: int):
+        """Discard all entries and start an empty cache with a new vector dimension."""
+        self._vectors = self._keys = self._ticks = None
+        for path in (self._vectors_path, self._keys_path, self._ticks_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._index.clear()
+        self._free = []
+        self._dim = dim
+        self._capacity = 0
+        self._tick = 0
+
+    def _allocate_slot(self) -> int:
+        """Return a free slot, growing the files or evicting the LRU entry as needed."""
+        if len(self._index) >= self.max_entries:
+            _, slot = self._index.popitem(last=False)
+            self._keys[slot] = 0
+            return slot
+        if not self._free:
+            self._grow(min(max(self._capacity * 2, 1024), self.max_entries))
+        return self._free.pop()
+
+    def _grow(self, capacity: int):
+        """Extend the memory-mapped files to hold capacity rows."""
+        for array in (self._vectors, self._keys, self._ticks):
+            if array is not None:
+                array.flush()
+        self._vectors = self._keys = self._ticks = None
+
+        for path, row_bytes in (
+            (self._vectors_path, self._dim * 4),
+            (self._keys_path, KEY_BYTES),
+            (self._ticks_path, 8)
+        ):
+            with open(path, "ab") as handle:
+                handle.truncate(capacity * row_bytes)
+
+        self._free.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+        self._open_arrays("r+")
+
+        with open(self._meta_path, "w", encoding="utf-8") as meta_file:
+            json.dump({"model_name": self.model_name, "dim": self._dim, "capacity": capacity}, meta_file)
+
+    def _open_arrays(self, mode: str):
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(self._capacity, self._dim))
+        self._keys = np.memmap(self._keys_path, dtype=np.uint8, mode=mode, shape=(self._capacity, KEY_BYTES))
+        self._ticks = np.memmap(self._ticks_path, dtype=np.uint64, mode=mode, shape=(self._capacity,))
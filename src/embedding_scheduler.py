@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingScheduler:
+    """
+    Micro-batches query embeddings requested concurrently from the event loop.
+
+    Texts submitted through embed() are queued; the queue is dispatched as one batch to the
+    executor once max_batch texts are waiting or max_wait_ms after the first of them arrived,
+    whichever comes first, and each caller's future is resolved with its own vector. Under
+    load many batch-size-1 forward passes become a few larger ones, while a lone request
+    waits at most max_wait_ms extra.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        executor: Executor,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0
+    ):
+        """
+        Args:
+            embed_batch: Embeds a list of texts in one call; runs on the executor.
+            executor: Pool the batched calls run on.
+            max_batch (int): Largest number of texts embedded in one call.
+            max_wait_ms (float): Longest time the first queued text waits for others to join it.
+        """
+        self.embed_batch = embed_batch
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.texts = 0
+
+    async def embed(self, text: str) -> List[float]:
+        """Queue a text for the next batch and wait for its embedding."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._dispatch(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._dispatch, loop)
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "average_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0
+        }
+
+    def _dispatch(self, loop: asyncio.AbstractEventLoop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # Callers that gave up while queued do not need embedding
+        pending = [(text, future) for text, future in self._pending if not future.done()]
+        batch, self._pending = pending[:self.max_batch], pending[self.max_batch:]
+        if self._pending:
+            self._timer = loop.call_later(0 if len(self._pending) >= self.max_batch else self.max_wait, self._dispatch, loop)
+        if not batch:
+            return
+
+        self.batches += 1
+        self.texts += len(batch)
+        result = loop.run_in_executor(self.executor, self.embed_batch, [text for text, _ in batch])
+        result.add_done_callback(lambda done: self._resolve(batch, done))
+
+    @staticmethod
+    def _resolve(batch: List[Tuple[str, asyncio.Future]], done: asyncio.Future):
+        if done.cancelled():
+            # e.g. the executor shut down before running the batch; exception() would raise here
+            for _, future in batch:
+                if not future.done():
+                    future.cancel()
+            return
+        error = done.exception()
+        if error is not None:
+            logger.error(f"Error embedding query batch: {error}")
+        embeddings = None if error is not None else done.result()
+        for position, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(embeddings[position])
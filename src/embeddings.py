@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8", "hash")
+
+
+class EmbeddingBackend(ABC):
+    """Runs an embedding model: one padded forward pass per encode() call, plus token counting."""
+
+    name = "base"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @property
+    def cache_id(self) -> str:
+        """Identity used for cached vectors; backends that produce different vectors must not share it."""
+        return self.model_name if self.name == "torch" else f"{self.model_name}@{self.name}"
+
+    @abstractmethod
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in a single batch, returning normalized vectors."""
+        pass
+
+    @abstractmethod
+    def count_tokens(self, texts: List[str], truncate: bool = True) -> List[int]:
+        """Count model tokens per text, optionally capped at the model's maximum sequence length."""
+        pass
+
+    def after_fork(self, threads: int):
+        """Prepare a model inherited through fork for inference in the child, using threads cores."""
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Shared encode/count_tokens for backends built on a sentence-transformers model."""
+
+    normalize = True
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        self.model = None
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self.model.encode(
+            texts,
+            batch_size=len(texts),
+            normalize_embeddings=self.normalize,
+            show_progress_bar=False
+        )
+        return embeddings.tolist()
+
+    def count_tokens(self, texts: List[str], truncate: bool = True) -> List[int]:
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            # Whitespace approximation; the +2 stands in for special tokens
+            return [len(text.split()) + 2 if truncate else max(len(text.split()), len(text) // 4) for text in texts]
+        if truncate:
+            max_length = getattr(self.model, "max_seq_length", None) or 512
+            encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)
+        else:
+            encoded = tokenizer(texts, add_special_tokens=False, truncation=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+
+class HuggingFaceBackend(SentenceTransformerBackend):
+    """The default float32 PyTorch model, loaded through llama_index's HuggingFaceEmbedding."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str, cache_dir: str):
+        super().__init__(model_name)
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        self.embed_model = HuggingFaceEmbedding(model_name=model_name, cache_folder=cache_dir)
+        self.normalize = getattr(self.embed_model, "normalize", True)
+        # The sentence-transformers model behind it is called directly so a whole list goes through
+        # as one batch instead of being re-split by embed_batch_size
+        self.model = getattr(self.embed_model, "_model", None)
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        if self.model is not None and hasattr(self.model, "encode"):
+            return super().encode(texts)
+        return self.embed_model.get_text_embedding_batch(texts)
+
+
+class ONNXBackend(SentenceTransformerBackend):
+    """
+    The model exported to ONNX and run by ONNX Runtime on CPU, optionally with int8 weights.
+
+    The export (and quantized copy) is made once and saved under cache_dir/onnx/<model>, so
+    later starts load it directly.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name: str, cache_dir: str, quantize: bool = False, quantization_config: str = "avx2"):
+        """
+        Args:
+            model_name (str): Hugging Face model to export.
+            cache_dir (str): Root cache directory for the exported model.
+            quantize (bool): Whether to run int8 dynamically quantized weights.
+            quantization_config (str): Target instruction set for quantization: arm64, avx2, avx512 or avx512_vnni.
+        """
+        super().__init__(model_name)
+        from sentence_transformers import SentenceTransformer
+
+        self.name = "onnx-int8" if quantize else "onnx"
+        export_dir = os.path.join(cache_dir, "onnx", re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        if not os.path.exists(os.path.join(export_dir, "onnx", "model.onnx")):
+            logger.info(f"Exporting {model_name} to ONNX in {export_dir}...")
+            model = SentenceTransformer(model_name, backend="onnx", cache_folder=cache_dir)
+            model.save_pretrained(export_dir)
+
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if quantize:
+            file_name = f"model_qint8_{quantization_config}.onnx"
+            if not os.path.exists(os.path.join(export_dir, "onnx", file_name)):
+                from sentence_transformers import export_dynamic_quantized_onnx_model
+                logger.info(f"Quantizing {model_name} to int8 ({quantization_config})...")
+                export_dynamic_quantized_onnx_model(
+                    SentenceTransformer(export_dir, backend="onnx"), quantization_config, export_dir
+                )
+            model_kwargs["file_name"] = os.path.join("onnx", file_name)
+        self.export_dir = export_dir
+        self.model_kwargs = model_kwargs
+        self.model = SentenceTransformer(export_dir, backend="onnx", model_kwargs=model_kwargs)
+
+    def after_fork(self, threads: int):
+        # ONNX Runtime's thread pool does not survive fork, so each worker opens its own session
+        from sentence_transformers import SentenceTransformer
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = threads
+        self.model = SentenceTransformer(
+            self.export_dir, backend="onnx", model_kwargs={**self.model_kwargs, "session_options": session_options}
+        )
+
+
+class HashingBackend(EmbeddingBackend):
+    """
+    Model-free stand-in: words are feature-hashed into a fixed-size signed bag-of-words vector.
+
+    Deterministic and needs no downloads, so benchmarks and offline runs can exercise the full
+    ingestion and query path. Similarity is purely lexical; not for real deployments.
+    """
+
+    name = "hash"
+    max_seq_length = 512
+
+    def __init__(self, model_name: str, dimension: int = 1024):
+        super().__init__(model_name)
+        self.dimension = dimension
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+                vectors[row, digest % self.dimension] += 1.0 if digest >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-12)).tolist()
+
+    def count_tokens(self, texts: List[str], truncate: bool = True) -> List[int]:
+        counts = [len(re.findall(r"\w+|[^\w\s]", text)) for text in texts]
+        return [min(count + 2, self.max_seq_length) for count in counts] if truncate else counts
+
+
+def create_embedding_backend(name: str, model_name: str, cache_dir: str) -> EmbeddingBackend:
+    """
+    Build an embedding backend by name.
+
+    Args:
+        name (str): "torch" (float32 PyTorch), "onnx" (ONNX Runtime), "onnx-int8" (ONNX Runtime, int8 weights)
+            or "hash" (model-free stand-in for benchmarks).
+        model_name (str): The embedding model, e.g. "BAAI/bge-m3" or a smaller one such as "BAAI/bge-small-en-v1.5".
+        cache_dir (str): Directory for model files and exports.
+    """
+    if name == "torch":
+        return HuggingFaceBackend(model_name, cache_dir)
+    if name in ("onnx", "onnx-int8"):
+        return ONNXBackend(model_name, cache_dir, quantize=name == "onnx-int8")
+    if name == "hash":
+        return HashingBackend(model_name)
+    raise ValueError(f"Unknown embedding backend: {name} (expected one of {', '.join(EMBEDDING_BACKENDS)})")
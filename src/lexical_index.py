@@ -0,0 +1,263 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9_]+")
+_COMPOUND = re.compile(r"[a-z0-9_]+(?:[./:?=&-]+[a-z0-9_{}]+)+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase word tokens.
+
+    Compound identifiers such as endpoint paths ("/data/2.5/weather") or dotted names are
+    also kept whole, so an exact identifier in the query outranks its common parts.
+    """
+    text = text.lower()
+    return _WORD.findall(text) + _COMPOUND.findall(text)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """
+    Fuse several ranked ID lists into one with reciprocal rank fusion.
+
+    Args:
+        rankings: Ranked lists of IDs, best first.
+        k (int): Damping constant; larger values flatten the contribution of top ranks.
+
+    Returns:
+        list: IDs ordered by their summed 1 / (k + rank) score.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk texts.
+
+    Postings are stored in compressed sparse row form: a term's document numbers (uint32)
+    and term frequencies (uint16) are one contiguous slice of two flat arrays, found via an
+    offsets array. New chunks are appended to small per-term pending lists and folded into
+    the flat arrays on the next search or persist. Deleted chunks are tombstoned and dropped
+    from the postings once they make up a quarter of the index.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        """
+        Open (or create) an index persisted at path (.json and .npz files are written next to it).
+
+        Args:
+            path (str): File path prefix for the persisted index.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 document length normalization.
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+        self._load()
+
+    def count(self) -> int:
+        return len(self._id_to_doc)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]):
+        """Index texts under the given chunk IDs, replacing any earlier text for the same ID."""
+        with self._lock:
+            self.delete([chunk_id for chunk_id in ids if chunk_id in self._id_to_doc])
+            for chunk_id, text in zip(ids, texts):
+                doc = len(self._ids)
+                self._ids.append(chunk_id)
+                self._id_to_doc[chunk_id] = doc
+                self._alive.append(1)
+
+                term_counts = Counter(tokenize(text))
+                self._lengths.append(sum(term_counts.values()))
+                for term, tf in term_counts.items():
+                    term_number = self._terms.setdefault(term, len(self._terms))
+                    docs, tfs = self._pending.setdefault(term_number, (array("I"), array("H")))
+                    docs.append(doc)
+                    tfs.append(min(tf, 65535))
+            self._dirty = True
+
+    def delete(self, ids: Sequence[str]):
+        """Tombstone the given chunk IDs; unknown IDs are ignored."""
+        with self._lock:
+            for chunk_id in ids:
+                doc = self._id_to_doc.pop(chunk_id, None)
+                if doc is None:
+                    continue
+                self._ids[doc] = None
+                self._alive[doc] = 0
+                self._dead += 1
+            self._dirty = True
+
+    def search(self, query: str, top_n: int = 10) -> List[Tuple[str, float]]:
+        """
+        Rank indexed chunks against a query with BM25.
+
+        Returns:
+            list: Up to top_n (chunk ID, score) pairs with a positive score, best first.
+        """
+        with self._lock:
+            if not self._id_to_doc:
+                return []
+            self._merge()
+
+            alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            live_count = len(self._id_to_doc)
+            average_length = float(lengths[alive].mean()) or 1.0
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+
+            for term in set(tokenize(query)):
+                term_number = self._terms.get(term)
+                if term_number is None:
+                    continue
+                start, end = self._offsets[term_number], self._offsets[term_number + 1]
+                docs = self._docs[start:end]
+                tfs = self._tfs[start:end].astype(np.float32)
+                document_frequency = int(alive[docs].sum())
+                if document_frequency == 0:
+                    continue
+                idf = math.log(1.0 + (live_count - document_frequency + 0.5) / (document_frequency + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * lengths[docs] / average_length)
+                scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+            scores[~alive] = 0.0
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > top_n:
+                candidates = candidates[np.argpartition(scores[candidates], -top_n)[-top_n:]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(self._ids[doc], float(scores[doc])) for doc in candidates]
+
+    def persist(self):
+        """Write the index to disk if it changed since it was loaded or last persisted."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._merge(compact=True)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+            with open(f"{self.path}.npz.tmp", "wb") as arrays_file:
+                np.savez(
+                    arrays_file,
+                    offsets=self._offsets,
+                    docs=self._docs,
+                    tfs=self._tfs,
+                    lengths=np.frombuffer(self._lengths, dtype=np.uint32),
+                    alive=np.frombuffer(self._alive, dtype=np.uint8)
+                )
+            terms = sorted(self._terms, key=self._terms.get)
+            with open(f"{self.path}.json.tmp", "w", encoding="utf-8") as records_file:
+                json.dump({"ids": self._ids, "terms": terms}, records_file)
+            os.replace(f"{self.path}.npz.tmp", f"{self.path}.npz")
+            os.replace(f"{self.path}.json.tmp", f"{self.path}.json")
+            self._dirty = False
+
+    def clear(self):
+        """Drop every indexed chunk and remove the persisted files."""
+        with self._lock:
+            self._reset()
+            for suffix in (".npz", ".json"):
+                if os.path.exists(f"{self.path}{suffix}"):
+                    os.remove(f"{self.path}{suffix}")
+
+    def after_fork(self):
+        """Reset the lock in a forked child; the posting arrays stay shared copy-on-write."""
+        self._lock = threading.RLock()
+
+    def stats(self) -> Dict[str, int]:
+        return {"chunks": self.count(), "terms": len(self._terms), "postings": int(len(self._docs))}
+
+    def _reset(self):
+        self._ids: List[Optional[str]] = []
+        self._id_to_doc: Dict[str, int] = {}
+        self._alive = bytearray()
+        self._lengths = array("I")
+        self._terms: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._docs = np.zeros(0, dtype=np.uint32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+        self._pending: Dict[int, Tuple[array, array]] = {}
+        self._dead = 0
+        self._dirty = False
+
+    def _load(self):
+        if not (os.path.exists(f"{self.path}.json") and os.path.exists(f"{self.path}.npz")):
+            return
+        try:
+            with open(f"{self.path}.json", "r", encoding="utf-8") as records_file:
+                records = json.load(records_file)
+            arrays = np.load(f"{self.path}.npz")
+            self._ids = records["ids"]
+            self._terms = {term: number for number, term in enumerate(records["terms"])}
+            self._offsets = arrays["offsets"]
+            self._docs = arrays["docs"]
+            self._tfs = arrays["tfs"]
+            self._lengths = array("I", arrays["lengths"].tobytes())
+            self._alive = bytearray(arrays["alive"].tobytes())
+        except Exception as e:
+            logger.warning(f"Could not load lexical index from {self.path}: {e}")
+            self._reset()
+            return
+        self._id_to_doc = {chunk_id: doc for doc, chunk_id in enumerate(self._ids) if chunk_id is not None}
+        self._dead = len(self._ids) - len(self._id_to_doc)
+        logger.info(f"Loaded lexical index with {self.count()} chunks and {len(self._terms)} terms")
+
+    def _merge(self, compact: bool = False):
+        """Fold pending postings into the flat arrays, dropping tombstoned documents if worthwhile."""
+        compact = self._dead > 0 and (compact or self._dead * 4 > len(self._ids))
+        if not self._pending and not compact:
+            return
+
+        if compact:
+            alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+            renumber = np.cumsum(alive, dtype=np.int64) - 1
+
+        term_count = len(self._terms)
+        merged_terms = len(self._offsets) - 1
+        lists_docs, lists_tfs = [], []
+        offsets = np.zeros(term_count + 1, dtype=np.int64)
+        for term_number in range(term_count):
+            # Terms first seen since the last merge have no slice in the flat arrays yet
+            start, end = (self._offsets[term_number], self._offsets[term_number + 1]) if term_number < merged_terms else (0, 0)
+            docs, tfs = self._docs[start:end], self._tfs[start:end]
+            pending = self._pending.get(term_number)
+            if pending is not None:
+                # Pending documents were numbered after everything merged, so lists stay sorted
+                docs = np.concatenate([docs, np.frombuffer(pending[0], dtype=np.uint32)])
+                tfs = np.concatenate([tfs, np.frombuffer(pending[1], dtype=np.uint16)])
+            if compact:
+                keep = alive[docs]
+                docs = renumber[docs[keep]].astype(np.uint32)
+                tfs = tfs[keep]
+            lists_docs.append(docs)
+            lists_tfs.append(tfs)
+            offsets[term_number + 1] = offsets[term_number] + len(docs)
+
+        self._docs = np.concatenate(lists_docs) if lists_docs else np.zeros(0, dtype=np.uint32)
+        self._tfs = np.concatenate(lists_tfs) if lists_tfs else np.zeros(0, dtype=np.uint16)
+        self._offsets = offsets
+        self._pending = {}
+
+        if compact:
+            self._ids = [chunk_id for chunk_id in self._ids if chunk_id is not None]
+            self._lengths = array("I", np.frombuffer(self._lengths, dtype=np.uint32)[alive].tobytes())
+            self._alive = bytearray(b"\x01" * len(self._ids))
+            self._id_to_doc = {chunk_id: doc for doc, chunk_id in enumerate(self._ids)}
+            self._dead = 0
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# LLM Provider abstraction layer
+class LLMProvider(ABC):
+    @abstractmethod
+    def generate_response(self, query: str, context_docs: List[str]) -> str:
+        pass
+    
+    async def agenerate_response(self, query: str, context_docs: List[str]) -> str:
+        """Async variant of generate_response; providers without an async client run it in a worker thread"""
+        return await asyncio.to_thread(self.generate_response, query, context_docs)
+    
+    async def stream_response(self, query: str, context_docs: List[str]) -> AsyncIterator[str]:
+        """Yield the response as text fragments; providers without streaming yield it in one piece"""
+        yield await self.agenerate_response(query, context_docs)
+    
+    @abstractmethod
+    def get_status(self) -> Dict[str, Any]:
+        pass
+
+# Implementation for Groq
+class GroqLLMProvider(LLMProvider):
+    def __init__(self, api_key: str, model_name: str = "llama-3.1-8b-instant"):
+        try:
+            from groq import Groq, AsyncGroq
+            self.client = Groq(api_key=api_key)
+            self.async_client = AsyncGroq(api_key=api_key)
+            self.model_name = model_name
+            self.status = "connected"
+        except Exception as e:
+            logger.error(f"Error initializing Groq client: {e}")
+            self.client = None
+            self.async_client = None
+            self.model_name = model_name
+            self.status = f"error: {str(e)}"
+    
+    def _build_system_prompt(self, context_docs: List[str]) -> str:
+        # Combine the retrieved documents into context
+        context = "\n\n".join(context_docs)
+        
+        # Create system prompt with RAG context
+        return f"""
+        Instructions:
+        - Be helpful and answer questions concisely based on the provided context.
+        - If the context doesn't contain relevant information, say 'I don't have enough information to answer this question.'
+        - Provide specific information from the context when available.
+        - When referencing information, mention which document it came from if possible.
+        
+        Context:
+        {context}
+        """
+    
+    def generate_response(self, query: str, context_docs: List[str]) -> str:
+        """Generate a response using Groq API based on retrieved documents"""
+        if not self.client:
+            return "LLM provider not initialized. Please check the configuration."
+        
+        system_prompt = self._build_system_prompt(context_docs)
+        logger.debug("System prompt: %s", system_prompt)
+        
+        try:
+            start_time = time.time()
+            chat_completion = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": query}
+                ]
+            )
+            response = chat_completion.choices[0].message.content
+            
+            logger.info(f"LLM response generated in {time.time() - start_time:.2f} seconds")
+            return response
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            return f"Error generating response: {str(e)}"
+    
+    async def agenerate_response(self, query: str, context_docs: List[str]) -> str:
+        """Generate a response with the async Groq client without blocking the event loop"""
+        if not self.async_client:
+            return "LLM provider not initialized. Please check the configuration."
+        
+        system_prompt = self._build_system_prompt(context_docs)
+        
+        try:
+            start_time = time.time()
+            chat_completion = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": query}
+                ]
+            )
+            response = chat_completion.choices[0].message.content
+            
+            logger.info(f"LLM response generated in {time.time() - start_time:.2f} seconds")
+            return response
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            return f"Error generating response: {str(e)}"
+    
+    async def stream_response(self, query: str, context_docs: List[str]) -> AsyncIterator[str]:
+        """Stream response tokens from Groq as they are generated"""
+        if not self.async_client:
+            yield "LLM provider not initialized. Please check the configuration."
+            return
+        
+        system_prompt = self._build_system_prompt(context_docs)
+        
+        try:
+            start_time = time.time()
+            stream = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": query}
+                ],
+                stream=True
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+            
+            logger.info(f"LLM response streamed in {time.time() - start_time:.2f} seconds")
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            yield f"Error generating response: {str(e)}"
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "provider": "Groq",
+            "model": self.model_name,
+            "status": self.status
+        }
@@ -1,16 +1,25 @@
 from fastapi import FastAPI, HTTPException, Query, Body, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Literal, Optional, Dict, Any, Union
 import uvicorn
+import asyncio
+import json
 import os
 import time
 import logging
-from abc import ABC, abstractmethod
+import threading
 from dotenv import load_dotenv
 
-# Import database
-from database import ChromaDatabase
+# database and parallel_ingest pull in chromadb, llama_index and torch; they are imported
+# by load_database so the server can bind before they load
+from response_cache import ResponseCache
+from context import ContextBudgeter
+from singleflight import SingleFlight
+from llm import LLMProvider, GroqLLMProvider
+from rate_limit import RateLimiter, SQLiteBucketStore
+import metrics
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -19,6 +28,9 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# LOG_LEVEL=DEBUG turns on the per-query result and prompt dumps
+logging.getLogger().setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+
 # resolving issue with tokenizers parallelism
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
@@ -42,6 +54,10 @@ class QueryRequest(BaseModel):
     query: str = Field(..., description="The natural language query to process")
     top_n: Optional[int] = Field(5, description="Number of documents to retrieve")
     similarity_threshold: Optional[float] = Field(None, description="Optional similarity threshold (0-1)")
+    retrieval_mode: Literal["dense", "lexical", "hybrid"] = Field(
+        os.environ.get("RETRIEVAL_MODE", "dense"),
+        description="Ranking: dense vector similarity, BM25 keyword match, or a fusion of both"
+    )
 
 class SourceInfo(BaseModel):
     file_name: str
@@ -60,160 +76,337 @@ class QueryResponse(BaseModel):
     llm_response: str
     metadata: Optional[Dict[str, Any]] = None
 
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., description="The questions to answer, at most BATCH_MAX_QUERIES")
+    top_n: Optional[int] = Field(5, description="Number of documents to retrieve per question")
+    similarity_threshold: Optional[float] = Field(None, description="Optional similarity threshold (0-1)")
+    retrieval_mode: Literal["dense", "lexical", "hybrid"] = Field(
+        os.environ.get("RETRIEVAL_MODE", "dense"),
+        description="Ranking: dense vector similarity, BM25 keyword match, or a fusion of both"
+    )
+    stream: bool = Field(False, description="Stream one NDJSON line per question as each answer completes")
+
+class BatchQueryResponse(BaseModel):
+    results: List[QueryResponse]
+    metadata: Optional[Dict[str, Any]] = None
+
 class HealthResponse(BaseModel):
     status: str
     database: Dict[str, Any]
     llm_provider: Dict[str, Any]
     uptime: float
+    cache: Optional[Dict[str, Any]] = None
+    startup: Optional[Dict[str, Any]] = None
+    rate_limit: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
 
-# LLM Provider abstraction layer
-class LLMProvider(ABC):
-    @abstractmethod
-    def generate_response(self, query: str, context_docs: List[str]) -> str:
-        pass
+class StartupState:
+    """
+    Tracks database startup (model load, then ingestion) for /health and /ready.
     
-    @abstractmethod
-    def get_status(self) -> Dict[str, Any]:
-        pass
-
-# Implementation for Groq
-class GroqLLMProvider(LLMProvider):
-    def __init__(self, api_key: str, model_name: str = "llama-3.1-8b-instant"):
-        try:
-            from groq import Groq
-            self.client = Groq(api_key=api_key)
-            self.model_name = model_name
-            self.status = "connected"
-        except Exception as e:
-            logger.error(f"Error initializing Groq client: {e}")
-            self.client = None
-            self.model_name = model_name
-            self.status = f"error: {str(e)}"
-    
-    def generate_response(self, query: str, context_docs: List[str]) -> str:
-        """Generate a response using Groq API based on retrieved documents"""
-        if not self.client:
-            return "LLM provider not initialized. Please check the configuration."
-        
-        # Combine the retrieved documents into context
-        context = "\n\n".join(context_docs)
-        
-        # Create system prompt with RAG context
-        system_prompt = f"""
-        Instructions:
-        - Be helpful and answer questions concisely based on the provided context.
-        - If the context doesn't contain relevant information, say 'I don't have enough information to answer this question.'
-        - Provide specific information from the context when available.
-        - When referencing information, mention which document it came from if possible.
-        
-        Context:
-        {context}
-        """
-
-        print(system_prompt)
-        
-        try:
-            start_time = time.time()
-            chat_completion = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ]
-            )
-            response = chat_completion.choices[0].message.content
-            
-            logger.info(f"LLM response generated in {time.time() - start_time:.2f} seconds")
-            return response
-        except Exception as e:
-            logger.error(f"Error generating response: {e}")
-            return f"Error generating response: {str(e)}"
+    Phases run starting -> loading_model -> ingesting -> ready, or end in failed. Updated from
+    the startup thread and read from request handlers; each update replaces whole values.
+    """
+    
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.phase = "starting"
+        self.error: Optional[str] = None
+        self.progress: Dict[str, int] = {}
+        self.started_at = time.time()
+        self.phase_started_at = self.started_at
+        self.durations: Dict[str, float] = {}
     
-    def get_status(self) -> Dict[str, Any]:
+    @property
+    def ready(self) -> bool:
+        return self.phase == "ready"
+    
+    def set_phase(self, phase: str, error: Optional[str] = None):
+        now = time.time()
+        self.durations[self.phase] = now - self.phase_started_at
+        self.phase, self.phase_started_at = phase, now
+        self.error = error
+        logger.info(f"Startup phase: {phase}" + (f" ({error})" if error else ""))
+    
+    def update_progress(self, progress: Dict[str, int]):
+        self.progress = dict(progress)
+    
+    def stats(self) -> Dict[str, Any]:
         return {
-            "provider": "Groq",
-            "model": self.model_name,
-            "status": self.status
+            "mode": self.mode,
+            "phase": self.phase,
+            "ready": self.ready,
+            "error": self.error,
+            "progress": self.progress,
+            "elapsed": (time.time() - self.started_at) if not self.ready else sum(self.durations.values()),
+            "phase_seconds": self.durations
         }
 
-# Rate limiter middleware
-class RateLimiter:
-    def __init__(self, requests_per_minute=60):
-        self.requests_per_minute = requests_per_minute
-        self.request_history = {}
-        
-    async def __call__(self, request: Request):
-        client_ip = request.client.host
-        current_time = time.time()
-        
-        # Clean old entries
-        self.request_history = {ip: times for ip, times in self.request_history.items() 
-                             if times and times[-1] > current_time - 60}
-        
-        # Initialize if new client
-        if client_ip not in self.request_history:
-            self.request_history[client_ip] = []
-        
-        # Check rate limit
-        if len(self.request_history[client_ip]) >= self.requests_per_minute:
-            raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.")
-        
-        # Record request
-        self.request_history[client_ip].append(current_time)
-        return True
-
 # Global instances
 db = None
 llm_provider = None
 start_time = time.time()
+# RATE_LIMIT_DB points every worker on the node at one SQLite file so they share a budget
+rate_limiter = RateLimiter(
+    requests_per_minute=int(os.environ.get("RATE_LIMIT_PER_MINUTE", "60")),
+    burst=int(os.environ["RATE_LIMIT_BURST"]) if os.environ.get("RATE_LIMIT_BURST") else None,
+    store=SQLiteBucketStore(os.environ["RATE_LIMIT_DB"]) if os.environ.get("RATE_LIMIT_DB") else None
+)
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.environ.get("RESPONSE_CACHE_TTL", "3600")),
+    semantic_distance=float(os.environ["SEMANTIC_CACHE_DISTANCE"]) if os.environ.get("SEMANTIC_CACHE_DISTANCE") else None
+)
+context_budgeter = ContextBudgeter(max_tokens=int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000")))
+# Concurrent identical /query requests share one retrieval and LLM call
+query_flights = SingleFlight()
+# /query/batch limits: questions per request, and LLM calls in flight per request
+BATCH_MAX_QUERIES = int(os.environ.get("BATCH_MAX_QUERIES", "1000"))
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", "8"))
+# /query/batch draws from its own per-client budget of questions, sized so a full batch fits in one burst
+batch_rate_limiter = RateLimiter(
+    requests_per_minute=int(os.environ.get("BATCH_RATE_LIMIT_PER_MINUTE", str(BATCH_MAX_QUERIES))),
+    burst=int(os.environ.get("BATCH_RATE_LIMIT_BURST", str(BATCH_MAX_QUERIES))),
+    store=SQLiteBucketStore(os.environ["RATE_LIMIT_DB"]) if os.environ.get("RATE_LIMIT_DB") else None,
+    scope="batch"
+)
+# STARTUP_MODE=background binds the port at once and loads the model and ingests in a thread
+startup_state = StartupState(os.environ.get("STARTUP_MODE", "blocking"))
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the database and LLM provider when the application starts"""
-    global db, llm_provider
-    print("Initializing database and LLM provider...")
+# Provider replies that report a failure rather than an answer, and must not be cached
+LLM_ERROR_PREFIXES = ("Error generating response", "LLM provider not initialized")
+
+def format_document_results(results: Dict[str, Any]):
+    """Turn collection query results into the retrieved texts and DocumentResult models"""
+    documents = results.get('documents', [[]])[0] if results else []
+    metadatas = results.get('metadatas', [[]])[0] if results else []
+    distances = results.get('distances', [[]])[0] if results else []
     
-    # Initialize LLM provider
-    groq_api_key = os.environ.get("GROQ_API_KEY")
-    if groq_api_key:
-        llm_provider = GroqLLMProvider(api_key=groq_api_key)
-        logger.info("LLM provider initialized.")
+    # Prepare document results
+    doc_results = []
+    for i, (doc, meta, dist) in enumerate(zip(documents, metadatas, distances)):
+        source_info = SourceInfo(
+            file_name=meta.get('file_name', 'unknown'),
+            source_path=meta.get('source', 'unknown'),
+            chunk_index=meta.get('chunk_index', 0)
+        ) if meta else None
+        
+        doc_results.append(DocumentResult(
+            content=doc,
+            metadata=meta,
+            similarity=1.0 - dist,  # Convert distance to similarity
+            source=source_info
+        ))
+    return documents, doc_results
+
+async def pack_context(results: Dict[str, Any]) -> Dict[str, Any]:
+    """Deduplicate, merge and pack retrieved chunks into the LLM context budget, off the event loop"""
+    documents = results.get('documents', [[]])[0] if results else []
+    metadatas = results.get('metadatas', [[]])[0] if results and results.get('metadatas') else None
+    return await asyncio.to_thread(context_budgeter.pack, documents, metadatas)
+
+def sse_event(event: str, data: Any) -> str:
+    """Encode a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def model_to_dict(model: BaseModel) -> Dict[str, Any]:
+    return model.model_dump() if hasattr(model, "model_dump") else model.dict()
+
+def cache_answer(cache_key, results: Dict[str, Any], doc_results: List[DocumentResult], llm_response: str, metadata: Dict[str, Any], version):
+    """Store a freshly generated answer in both response cache tiers"""
+    if llm_response.startswith(LLM_ERROR_PREFIXES):
+        return
+    response_cache.put(
+        cache_key,
+        {"results": [model_to_dict(doc) for doc in doc_results], "llm_response": llm_response, "metadata": metadata},
+        version=version,
+        query_embedding=results.get('query_embedding'),
+        chunk_ids=results.get('ids', [[]])[0] if results.get('ids') else []
+    )
+
+def cached_response(query: str, cached: Dict[str, Any], **metadata) -> QueryResponse:
+    """Build the response for an exact response cache hit"""
+    return QueryResponse(
+        query=query,
+        results=cached["results"],
+        llm_response=cached["llm_response"],
+        metadata={**cached["metadata"], "cache": "exact", **metadata}
+    )
+
+async def prepare_answer(
+    results: Dict[str, Any], cache_key, cache_version, spans: metrics.Spans, top_n: Optional[int], similarity_threshold: Optional[float]
+) -> Dict[str, Any]:
+    """
+    Everything between retrieval and generation, shared by the query endpoints: format the
+    retrieved chunks, look up an answer to a near-identical question and pack the LLM context.
+    
+    Returns:
+        dict: doc_results, context, metadata, semantic_hit (the cached answer to reuse, or None)
+            and cache ("semantic" or "miss").
+    """
+    with spans.span("format"):
+        documents, doc_results = format_document_results(results)
+    # Reuse the answer of a near-identical query that retrieved the same chunks
+    semantic_hit = response_cache.get_semantic(
+        cache_key, results.get('query_embedding'), results.get('ids', [[]])[0], version=cache_version
+    )
+    with spans.span("context"):
+        context = await pack_context(results)
+    
+    metadata = {
+        "total_results": len(documents),
+        "top_n": top_n,
+        "query_time": results.get('query_time', 0),
+        "similarity_threshold": similarity_threshold,
+        "context_tokens": context["token_count"],
+        "context_chunks": context["chunks_used"]
+    }
+    return {
+        "doc_results": doc_results,
+        "context": context,
+        "metadata": metadata,
+        "semantic_hit": semantic_hit,
+        "cache": "semantic" if semantic_hit is not None else "miss"
+    }
+
+async def answer_query(
+    query: str,
+    results: Dict[str, Any],
+    cache_key,
+    cache_version,
+    spans: metrics.Spans,
+    top_n: Optional[int],
+    similarity_threshold: Optional[float],
+    llm_slots: Optional[asyncio.Semaphore] = None
+):
+    """
+    Answer a question from its retrieved results and cache the new answer.
+    
+    Args:
+        llm_slots (asyncio.Semaphore, optional): Bounds concurrent LLM calls, e.g. within a batch.
+        
+    Returns:
+        tuple: (doc_results, llm_response, metadata), with metadata["cache"] "semantic" or "miss".
+    """
+    prepared = await prepare_answer(results, cache_key, cache_version, spans, top_n, similarity_threshold)
+    if prepared["semantic_hit"] is not None:
+        llm_response = prepared["semantic_hit"]["llm_response"]
     else:
-        logger.warning("GROQ_API_KEY not found in environment variables.")
+        if llm_slots is not None:
+            await llm_slots.acquire()
+        try:
+            with spans.span("llm"):
+                llm_response = await llm_provider.agenerate_response(query, prepared["context"]["documents"])
+        finally:
+            if llm_slots is not None:
+                llm_slots.release()
+        cache_answer(cache_key, results, prepared["doc_results"], llm_response, prepared["metadata"], cache_version)
+    return prepared["doc_results"], llm_response, {**prepared["metadata"], "cache": prepared["cache"]}
+
+def load_database(ingest: bool = True, warm_up: bool = True):
+    """
+    Load the embedding model, connect the vector store and ingest documents, updating startup_state
     
-    # Initialize database
+    Args:
+        ingest (bool): Ingest scraped_data (and build a missing lexical index); False only opens the store.
+        warm_up (bool): Run dummy inference once the model is loaded.
+    """
+    global db
     try:
+        startup_state.set_phase("loading_model")
+        from database import ChromaDatabase
+        from parallel_ingest import store_documents_parallel
+        
         db_host = os.environ.get("CHROMADB_HOST", "localhost")
         db_port = int(os.environ.get("CHROMADB_PORT", "8000"))
         
-        db = ChromaDatabase(
+        database = ChromaDatabase(
             "api_documentation", 
             host=db_host, 
             port=db_port, 
-            model_name="BAAI/bge-m3"
+            model_name=os.environ.get("EMBEDDING_MODEL", "BAAI/bge-m3"),
+            embedding_backend=os.environ.get("EMBEDDING_BACKEND", "torch"),
+            embed_workers=int(os.environ.get("EMBED_WORKERS", "2")),
+            backend=os.environ.get("VECTOR_BACKEND", "http"),
+            persist_directory=os.environ.get("VECTOR_PERSIST_DIR", "./chroma_data"),
+            vector_storage=os.environ.get("VECTOR_STORAGE", "float32"),
+            query_batch_size=int(os.environ.get("QUERY_BATCH_SIZE", "32")),
+            query_batch_wait_ms=float(os.environ.get("QUERY_BATCH_WAIT_MS", "5"))
         )
+        context_budgeter.token_counter = database.count_tokens
+        
+        # Pay lazy model initialization now rather than on the first user query
+        if warm_up:
+            database.warm_up()
+        # Queries can be served from here on; /ready waits for ingestion as well
+        db = database
+        if not ingest:
+            startup_state.set_phase("ready")
+            logger.info("Database opened without ingestion.")
+            return
+        startup_state.set_phase("ingesting")
  
         # Check if documents are already stored
         stats = db.get_collection_stats()
-        print(stats)
-        if stats["document_count"] > 0:
-            print(f"Collection already contains {stats['document_count']} document chunks.")
+        logger.info(f"Collection stats: {stats}")
+        if os.environ.get("INGEST_MODE", "full") == "sync":
+            # Incremental mode: diff scraped_data against the last ingestion manifest every start
+            if os.path.exists("./scraped_data"):
+                result = db.sync_directory('./scraped_data', progress=startup_state.update_progress)
+                logger.info(f"Synced scraped_data: {result['upserted_chunks']} chunks upserted, {result['deleted_chunks']} deleted.")
+            else:
+                logger.warning("API documentation directory ./scraped_data not found.")
+        elif stats["document_count"] > 0:
             logger.info(f"Collection already contains {stats['document_count']} document chunks.")
         else:
-            print("Storing documents in the database...")
             # Store documents if needed
             # data_dir = os.environ.get("API_DOCS_DIR")
             if os.path.exists("./scraped_data"):
                 logger.info(f"Storing API documentation from scraped_data...")
-                result = db.store_documents('./scraped_data')
+                ingest_workers = int(os.environ.get("INGEST_WORKERS", "1"))
+                if ingest_workers > 1:
+                    result = store_documents_parallel(
+                        db, './scraped_data', workers=ingest_workers, progress=startup_state.update_progress
+                    )
+                else:
+                    result = db.store_documents('./scraped_data', progress=startup_state.update_progress)
                 logger.info(f"Stored {result['document_count']} documents with {result['chunk_count']} chunks.")
             else:
-                logger.warning(f"API documentation directory {data_dir} not found.")
+                logger.warning("API documentation directory ./scraped_data not found.")
         
+        # Collections ingested before the lexical index existed need it built once
+        if db.lexical_index.count() == 0 and db.collection.count() > 0:
+            db.rebuild_lexical_index()
+        
+        startup_state.set_phase("ready")
         logger.info("Database setup complete.")
     except Exception as e:
+        startup_state.set_phase("failed", error=str(e))
         logger.error(f"Error during startup: {e}", exc_info=True)
 
+@app.on_event("startup")
+async def startup_event():
+    """Initialize the database and LLM provider when the application starts"""
+    global llm_provider
+    logger.info("Initializing database and LLM provider...")
+    
+    # Initialize LLM provider
+    groq_api_key = os.environ.get("GROQ_API_KEY")
+    if groq_api_key:
+        llm_provider = GroqLLMProvider(api_key=groq_api_key)
+        logger.info("LLM provider initialized.")
+    else:
+        logger.warning("GROQ_API_KEY not found in environment variables.")
+    
+    # Initialize database, unless serve.py already loaded it before forking this worker
+    if db is not None:
+        logger.info("Using the database loaded before fork.")
+    elif startup_state.mode == "background":
+        # Daemon thread: shutting down mid-ingestion should not wait for it
+        threading.Thread(target=load_database, name="startup", daemon=True).start()
+    else:
+        load_database()
+
 @app.get("/", summary="Root endpoint", tags=["Information"])
 async def root():
     """Root endpoint that returns API information"""
@@ -222,7 +415,11 @@ async def root():
         "version": "0.1.0",
         "endpoints": {
             "/query": "POST endpoint to query the RAG system",
+            "/query/stream": "POST endpoint streaming sources and LLM tokens as Server-Sent Events",
+            "/query/batch": "POST endpoint answering many questions in one request, optionally streamed as NDJSON",
             "/health": "GET endpoint to check API health",
+            "/ready": "GET readiness probe; 503 until the model is loaded and ingestion has finished",
+            "/metrics": "GET Prometheus metrics",
             "/docs": "API documentation (Swagger UI)"
         }
     }
@@ -235,7 +432,7 @@ async def health_check():
     database_status = {"status": "not connected"}
     if db is not None:
         try:
-            stats = db.get_collection_stats()
+            stats = await asyncio.to_thread(db.get_collection_stats)
             database_status = {
                 "status": "connected", 
                 **stats
@@ -249,17 +446,64 @@ async def health_check():
     
     uptime = time.time() - start_time
     
+    if startup_state.phase in ("starting", "loading_model", "ingesting"):
+        status = "starting"
+    elif startup_state.phase == "failed":
+        # db or llm_provider may already be set when a later startup step failed
+        status = "failed"
+    else:
+        status = "healthy" if db is not None and llm_provider is not None else "warning"
+    
     return {
-        "status": "healthy" if db is not None and llm_provider is not None else "warning",
+        "status": status,
         "database": database_status,
         "llm_provider": llm_status,
-        "uptime": uptime
+        "uptime": uptime,
+        "cache": {**response_cache.stats(), "coalescing": query_flights.stats()},
+        "rate_limit": {**rate_limiter.stats(), "batch": batch_rate_limiter.stats()},
+        "startup": startup_state.stats(),
+        "error": startup_state.error
     }
 
+@app.get("/ready", summary="Readiness probe", tags=["Information"])
+async def readiness_check():
+    """Return 200 once the model is loaded and ingestion has finished, 503 before that or if startup failed"""
+    return JSONResponse(
+        status_code=200 if startup_state.ready else 503,
+        content={
+            "ready": startup_state.ready,
+            "phase": startup_state.phase,
+            "progress": startup_state.progress,
+            "error": startup_state.error
+        }
+    )
+
+def collect_stats() -> Dict[str, Dict[str, Any]]:
+    """Gather cache, coalescing, rate limiter, startup and database stats for /metrics"""
+    stats = {
+        "response_cache": response_cache.stats(),
+        "coalescing": query_flights.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "batch_rate_limit": batch_rate_limiter.stats(),
+        "startup": {"ready": startup_state.ready}
+    }
+    if db is not None:
+        try:
+            stats["database"] = db.get_collection_stats()
+        except Exception as e:
+            logger.warning(f"Could not collect database stats for /metrics: {e}")
+    return stats
+
+@app.get("/metrics", response_class=PlainTextResponse, summary="Prometheus metrics", tags=["Information"])
+async def metrics_endpoint():
+    """Per-stage query latency histograms, ingestion counters and cache/limiter stats in the Prometheus text format"""
+    stats = await asyncio.to_thread(collect_stats)
+    return PlainTextResponse(metrics.render(stats), media_type="text/plain; version=0.0.4")
+
 @app.post(
     "/query", 
     response_model=QueryResponse, 
-    dependencies=[Depends(RateLimiter())],
+    dependencies=[Depends(rate_limiter)],
     summary="Query the RAG system",
     tags=["RAG"],
     description="Query the RAG system with a natural language question to retrieve relevant API documentation and generate a response"
@@ -282,57 +526,280 @@ async def query(request: QueryRequest):
     if llm_provider is None:
         raise HTTPException(status_code=503, detail="LLM provider not initialized")
     
+    spans = metrics.Spans("query")
     try:
-        # Get query results
-        results = db.query_rag(
-            request.query, 
+        # Repeated questions are answered from the cache without retrieval or generation
+        cache_key = ResponseCache.make_key(
+            request.query,
             top_n=request.top_n,
-            similarity_threshold=request.similarity_threshold
+            similarity_threshold=request.similarity_threshold,
+            retrieval_mode=request.retrieval_mode
         )
-        print("Query results:", results)
-        # Format the documents
-        documents = results.get('documents', [[]])[0] if results else []
-        metadatas = results.get('metadatas', [[]])[0] if results else []
-        distances = results.get('distances', [[]])[0] if results else []
+        cache_version = db.get_collection_version()
+        cached = response_cache.get(cache_key, version=cache_version)
+        if cached is not None:
+            metrics.QUERY_REQUESTS.inc(endpoint="query", outcome="exact")
+            return cached_response(request.query, cached, timings_ms=spans.finish())
         
-        # Prepare document results
-        doc_results = []
-        for i, (doc, meta, dist) in enumerate(zip(documents, metadatas, distances)):
-            source_info = SourceInfo(
-                file_name=meta.get('file_name', 'unknown'),
-                source_path=meta.get('source', 'unknown'),
-                chunk_index=meta.get('chunk_index', 0)
-            ) if meta else None
-            
-            doc_results.append(DocumentResult(
-                content=doc,
-                metadata=meta,
-                similarity=1.0 - dist,  # Convert distance to similarity
-                source=source_info
-            ))
-        
-        print("Documents retrieved:", documents)
-        # Generate LLM response
-        llm_response = llm_provider.generate_response(request.query, documents)
+        async def answer():
+            # Get query results
+            results = await db.aquery_rag(
+                request.query, 
+                top_n=request.top_n,
+                similarity_threshold=request.similarity_threshold,
+                include_query_embedding=response_cache.semantic_distance is not None,
+                retrieval_mode=request.retrieval_mode
+            )
+            spans.add_many(results.get('timings', {}))
+            logger.debug("Query results: %s", results)
+            return await answer_query(
+                request.query, results, cache_key, cache_version, spans, request.top_n, request.similarity_threshold
+            )
         
-        # Add metadata about the query
-        metadata = {
-            "total_results": len(documents),
-            "top_n": request.top_n,
-            "query_time": results.get('query_time', 0),
-            "similarity_threshold": request.similarity_threshold
-        }
+        # Requests for the same normalized query and parameters arriving while one is in flight join it
+        (doc_results, llm_response, metadata), coalesced = await query_flights.do((cache_key, cache_version), answer)
+        metrics.QUERY_REQUESTS.inc(endpoint="query", outcome="coalesced" if coalesced else metadata["cache"])
         
         return QueryResponse(
             query=request.query,
             results=doc_results,
             llm_response=llm_response,
-            metadata=metadata
+            metadata={**metadata, "coalesced": coalesced, "timings_ms": spans.finish()}
         )
     except Exception as e:
+        metrics.QUERY_REQUESTS.inc(endpoint="query", outcome="error")
         logger.error(f"Error processing query: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+@app.post(
+    "/query/stream",
+    dependencies=[Depends(rate_limiter)],
+    summary="Query the RAG system with a streamed answer",
+    tags=["RAG"],
+    description="Same as /query, but streams Server-Sent Events: the retrieved sources first, then LLM tokens as they are generated"
+)
+async def query_stream(request: QueryRequest):
+    """
+    Stream the RAG answer as Server-Sent Events
+    
+    - `sources`: retrieved document chunks and query metadata, sent before generation starts
+    - `token`: a fragment of the LLM response (`{"text": ...}`)
+    - `done`: final metadata once the response is complete
+    - `error`: sent instead of the remaining events if the query fails
+    """
+    global db, llm_provider
+    
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database not initialized")
+    
+    if llm_provider is None:
+        raise HTTPException(status_code=503, detail="LLM provider not initialized")
+    
+    async def event_stream():
+        request_start = time.time()
+        spans = metrics.Spans("query_stream")
+        try:
+            cache_key = ResponseCache.make_key(
+                request.query,
+                top_n=request.top_n,
+                similarity_threshold=request.similarity_threshold,
+                retrieval_mode=request.retrieval_mode
+            )
+            cache_version = db.get_collection_version()
+            cached = response_cache.get(cache_key, version=cache_version)
+            if cached is not None:
+                metrics.QUERY_REQUESTS.inc(endpoint="query_stream", outcome="exact")
+                metadata = {**cached["metadata"], "cache": "exact"}
+                yield sse_event("sources", {"query": request.query, "results": cached["results"], "metadata": metadata})
+                yield sse_event("token", {"text": cached["llm_response"]})
+                yield sse_event("done", {
+                    **metadata,
+                    "time_to_first_token": time.time() - request_start,
+                    "total_time": time.time() - request_start,
+                    "timings_ms": spans.finish()
+                })
+                return
+            
+            results = await db.aquery_rag(
+                request.query,
+                top_n=request.top_n,
+                similarity_threshold=request.similarity_threshold,
+                include_query_embedding=response_cache.semantic_distance is not None,
+                retrieval_mode=request.retrieval_mode
+            )
+            spans.add_many(results.get('timings', {}))
+            prepared = await prepare_answer(
+                results, cache_key, cache_version, spans, request.top_n, request.similarity_threshold
+            )
+            doc_results, context, metadata = prepared["doc_results"], prepared["context"], prepared["metadata"]
+            yield sse_event("sources", {
+                "query": request.query,
+                "results": [model_to_dict(doc) for doc in doc_results],
+                "metadata": {**metadata, "cache": prepared["cache"]}
+            })
+            
+            first_token_time = None
+            if prepared["semantic_hit"] is not None:
+                first_token_time = time.time() - request_start
+                yield sse_event("token", {"text": prepared["semantic_hit"]["llm_response"]})
+            else:
+                tokens = []
+                # Providers report a failure mid-stream as a final error fragment after a partial answer
+                failed = False
+                llm_start = time.perf_counter()
+                async for token in llm_provider.stream_response(request.query, context["documents"]):
+                    if first_token_time is None:
+                        first_token_time = time.time() - request_start
+                        spans.add("llm_first_token", time.perf_counter() - llm_start)
+                    failed = failed or token.startswith(LLM_ERROR_PREFIXES)
+                    tokens.append(token)
+                    yield sse_event("token", {"text": token})
+                spans.add("llm", time.perf_counter() - llm_start)
+                if not failed:
+                    cache_answer(cache_key, results, doc_results, "".join(tokens), metadata, cache_version)
+            
+            metrics.QUERY_REQUESTS.inc(endpoint="query_stream", outcome=prepared["cache"])
+            yield sse_event("done", {
+                **metadata,
+                "cache": prepared["cache"],
+                "time_to_first_token": first_token_time,
+                "total_time": time.time() - request_start,
+                "timings_ms": spans.finish()
+            })
+        except Exception as e:
+            metrics.QUERY_REQUESTS.inc(endpoint="query_stream", outcome="error")
+            logger.error(f"Error processing streamed query: {e}", exc_info=True)
+            yield sse_event("error", {"detail": f"Error processing query: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post(
+    "/query/batch",
+    response_model=BatchQueryResponse,
+    summary="Answer many questions in one request",
+    tags=["RAG"],
+    description="Batch form of /query for evaluation runs and offline jobs: retrieval for all questions is batched, and LLM calls run with bounded concurrency"
+)
+async def query_batch(request: BatchQueryRequest, http_request: Request):
+    """
+    Answer a list of questions
+    
+    Cached questions are answered straight away. The rest are embedded in batches and
+    searched with one multi-vector query per batch, then their LLM calls run at most
+    BATCH_LLM_CONCURRENCY at a time. Each answer is shaped like a /query response. Every
+    question, cached or not, is charged to the client's batch rate limit before any work.
+    
+    - **stream**: false returns every answer in input order once all are done; true streams
+      `application/x-ndjson`, one line per question (with its `index`) as soon as it completes
+    """
+    global db, llm_provider
+    
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database not initialized")
+    
+    if llm_provider is None:
+        raise HTTPException(status_code=503, detail="LLM provider not initialized")
+    
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    
+    # Admit the batch before touching the cache, so rejected batches leave its stats alone
+    await batch_rate_limiter.take(http_request, cost=len(request.queries))
+    
+    spans = metrics.Spans("query_batch")
+    cache_version = db.get_collection_version()
+    cache_keys = [
+        ResponseCache.make_key(
+            query,
+            top_n=request.top_n,
+            similarity_threshold=request.similarity_threshold,
+            retrieval_mode=request.retrieval_mode
+        )
+        for query in request.queries
+    ]
+    cached = [response_cache.get(cache_key, version=cache_version) for cache_key in cache_keys]
+    misses = [index for index, entry in enumerate(cached) if entry is None]
+    
+    try:
+        retrieved = await db.aquery_rag_batch(
+            [request.queries[index] for index in misses],
+            top_n=request.top_n,
+            similarity_threshold=request.similarity_threshold,
+            include_query_embedding=response_cache.semantic_distance is not None,
+            retrieval_mode=request.retrieval_mode
+        ) if misses else []
+    except Exception as e:
+        metrics.QUERY_REQUESTS.inc(len(request.queries), endpoint="query_batch", outcome="error")
+        logger.error(f"Error processing query batch: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error processing query batch: {str(e)}")
+    if retrieved:
+        spans.add_many(retrieved[0].get('timings', {}))
+    results_by_index = dict(zip(misses, retrieved))
+    llm_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    
+    async def respond(index: int):
+        query = request.queries[index]
+        try:
+            if cached[index] is not None:
+                response = cached_response(query, cached[index])
+                outcome = "exact"
+            else:
+                # Shares in-flight work with identical questions from this batch or from /query
+                (doc_results, llm_response, metadata), coalesced = await query_flights.do(
+                    (cache_keys[index], cache_version),
+                    lambda: answer_query(
+                        query, results_by_index[index], cache_keys[index], cache_version, spans,
+                        request.top_n, request.similarity_threshold, llm_slots
+                    )
+                )
+                response = QueryResponse(
+                    query=query,
+                    results=doc_results,
+                    llm_response=llm_response,
+                    metadata={**metadata, "coalesced": coalesced}
+                )
+                outcome = "coalesced" if coalesced else metadata["cache"]
+        except Exception as e:
+            # One failed question should not sink the rest of the batch
+            logger.error(f"Error processing batched query {index}: {e}", exc_info=True)
+            response = QueryResponse(
+                query=query, results=[], llm_response="", metadata={"error": f"Error processing query: {str(e)}"}
+            )
+            outcome = "error"
+        metrics.QUERY_REQUESTS.inc(endpoint="query_batch", outcome=outcome)
+        return index, response
+    
+    if request.stream:
+        async def ndjson_stream():
+            tasks = [asyncio.ensure_future(respond(index)) for index in range(len(request.queries))]
+            try:
+                for completed in asyncio.as_completed(tasks):
+                    index, response = await completed
+                    yield json.dumps({"index": index, **model_to_dict(response)}) + "\n"
+                spans.finish()
+            finally:
+                # Stop generating answers nobody will read if the client goes away
+                for task in tasks:
+                    task.cancel()
+        
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+    
+    responses = await asyncio.gather(*(respond(index) for index in range(len(request.queries))))
+    return BatchQueryResponse(
+        results=[response for _, response in responses],
+        metadata={
+            "total_queries": len(request.queries),
+            "cached": len(request.queries) - len(misses),
+            "errors": sum(1 for _, response in responses if "error" in (response.metadata or {})),
+            "llm_concurrency": BATCH_LLM_CONCURRENCY,
+            "timings_ms": spans.finish()
+        }
+    )
+
 if __name__ == "__main__":
     # Run the FastAPI app using Uvicorn
     port = int(os.environ.get("PORT", 8001))
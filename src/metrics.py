@@ -0,0 +1,197 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Histogram buckets in seconds, from sub-millisecond cache and search work up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, label_values: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(label_values.get(label, "")) for label in self.labels)
+
+    def _label_text(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{label}="{_escape(value)}"' for label, value in pairs) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **label_values: str):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **label_values: str) -> float:
+        return self._values.get(self._key(label_values), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    """
+    Cumulative-bucket histogram in the Prometheus exposition format.
+
+    observe() is a bisect over the bucket bounds plus a few additions under a lock, so it is
+    cheap enough to call for every stage of every request.
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **label_values: str):
+        key = self._key(label_values)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        lines = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{self._label_text(key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {count}")
+        return lines
+
+
+class Spans:
+    """
+    Stage timings for one request.
+
+    Each finished stage is added to the request's timings (returned to the client in
+    milliseconds) and observed into the stage histogram under the given endpoint label.
+    """
+
+    def __init__(self, endpoint: str, histogram: Optional[Histogram] = None):
+        self.endpoint = endpoint
+        self.histogram = histogram or QUERY_STAGE_SECONDS
+        self.start = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage: str, seconds: float):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        self.histogram.observe(seconds, endpoint=self.endpoint, stage=stage)
+
+    def add_many(self, timings: Dict[str, float]):
+        for stage, seconds in timings.items():
+            self.add(stage, seconds)
+
+    def finish(self) -> Dict[str, float]:
+        """Record the total time since the spans were created and return every timing in milliseconds."""
+        self.add("total", time.perf_counter() - self.start)
+        return {stage: round(seconds * 1000.0, 3) for stage, seconds in self.timings.items()}
+
+
+def render(extra_stats: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    """
+    Render every registered metric, plus numeric values from stats dicts, in the Prometheus text format.
+
+    Args:
+        extra_stats (dict, optional): Stats dicts by name (e.g. {"response_cache": response_cache.stats()});
+            each numeric leaf becomes an untyped sample named rag_<name>_<key path>.
+    """
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for prefix, stats in (extra_stats or {}).items():
+        for name, value in _flatten(f"rag_{prefix}", stats):
+            lines.append(f"# TYPE {name} untyped")
+            lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _flatten(prefix: str, stats: Any) -> Iterator[Tuple[str, float]]:
+    if isinstance(stats, bool):
+        yield prefix, float(stats)
+    elif isinstance(stats, (int, float)):
+        yield prefix, float(stats)
+    elif isinstance(stats, dict):
+        for key, value in stats.items():
+            yield from _flatten(f"{prefix}_{_sanitize(str(key))}", value)
+
+
+def _sanitize(name: str) -> str:
+    return "".join(character if character.isalnum() or character == "_" else "_" for character in name)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+
+
+QUERY_STAGE_SECONDS = Histogram(
+    "rag_query_stage_seconds",
+    "Time spent in each stage of a query (embed, search, filter, context, llm, llm_first_token, format, total).",
+    labels=("endpoint", "stage")
+)
+QUERY_REQUESTS = Counter("rag_query_requests_total", "Query requests by endpoint and outcome.", labels=("endpoint", "outcome"))
+INGESTED_DOCUMENTS = Counter("rag_ingested_documents_total", "Documents read by ingestion.")
+INGESTED_CHUNKS = Counter("rag_ingested_chunks_total", "Chunks written to the collection by ingestion.")
+INGESTED_TOKENS = Counter("rag_ingested_tokens_total", "Tokens run through the embedding model during ingestion.")
+INGEST_EMBEDDING_SECONDS = Counter("rag_ingest_embedding_seconds_total", "Seconds spent embedding during ingestion.")
+INGEST_RUNS = Counter("rag_ingest_runs_total", "Completed ingestion runs by kind.", labels=("kind",))
+
+REGISTRY = [
+    QUERY_STAGE_SECONDS,
+    QUERY_REQUESTS,
+    INGESTED_DOCUMENTS,
+    INGESTED_CHUNKS,
+    INGESTED_TOKENS,
+    INGEST_EMBEDDING_SECONDS,
+    INGEST_RUNS
+]
@@ -0,0 +1,300 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.text_splitter import TokenTextSplitter
+
+import metrics
+from database import ChromaDatabase, file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Per-process embedding instance, created once by the pool initializer
+_worker: Optional[ChromaDatabase] = None
+
+
+def _init_worker(model_name: str, cache_dir: str, embedding_backend: str, threads: int):
+    """Load the embedding model once per worker process and size its thread pool to its share of cores."""
+    global _worker
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker = ChromaDatabase.embedding_worker(model_name, cache_dir, embedding_backend)
+
+
+def _split_files(paths: List[str], directory_path: str, chunk_size: int, chunk_overlap: int) -> Dict[str, Any]:
+    """
+    Read and split a group of files inside a worker process.
+
+    Returns:
+        dict: The worker's pid, per-file chunks and the time spent.
+    """
+    start_time = time.time()
+    reader = SimpleDirectoryReader(input_files=paths)
+    splitter = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    files = []
+    for source_name, document_count, file_chunks in _worker._iter_files(reader, splitter, directory_path):
+        files.append({"source": source_name, "document_count": document_count, **file_chunks})
+
+    return {"pid": os.getpid(), "files": files, "file_count": len(paths), "busy_time": time.time() - start_time}
+
+
+def _embed_texts(texts: List[str], max_batch_tokens: int) -> Dict[str, Any]:
+    """
+    Embed chunks the parent did not find in the embedding cache, inside a worker process.
+
+    Returns:
+        dict: The worker's pid, a float32 embedding matrix, and timing counters.
+    """
+    start_time = time.time()
+    # Embed the whole group together so length bucketing sees every chunk
+    embeddings, token_count = _worker._embed_batch(texts, max_batch_tokens=max_batch_tokens)
+    embedding_time = time.time() - start_time
+    return {
+        "pid": os.getpid(),
+        # float32 arrays pickle far smaller than lists of Python floats
+        "embeddings": np.asarray(embeddings, dtype=np.float32),
+        "token_count": token_count,
+        "embedding_time": embedding_time,
+        "busy_time": time.time() - start_time
+    }
+
+
+def store_documents_parallel(
+    db: ChromaDatabase,
+    directory_path: str,
+    workers: Optional[int] = None,
+    chunk_size: int = 1024,
+    chunk_overlap: int = 100,
+    batch_size: int = 100,
+    max_batch_tokens: int = 16384,
+    files_per_task: int = 8,
+    progress: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Ingest a directory like ChromaDatabase.store_documents, spreading splitting and embedding over processes.
+
+    Files are handed out to a process pool in groups of files_per_task to be read and split.
+    The calling process looks each group's chunks up in the embedding cache and sends only the
+    misses back to the pool to be embedded; each worker loads the embedding model once. The
+    calling process is the only writer: it batches results into collection upserts, the lexical
+    index, the embedding cache and the ingestion manifest. At most two tasks per worker are in
+    flight, bounding memory.
+
+    Args:
+        db (ChromaDatabase): Database to write to; its model name and cache directory are used by the workers.
+        directory_path (str): The path to the directory containing documents.
+        workers (int, optional): Number of worker processes (defaults to the CPU count).
+        chunk_size (int): The size of each text chunk.
+        chunk_overlap (int): The overlap between consecutive text chunks.
+        batch_size (int): Number of chunks per collection write.
+        max_batch_tokens (int): Upper bound on padded tokens per forward pass of the embedding model.
+        files_per_task (int): Number of files a worker processes per task.
+        progress (callable, optional): Called after every collected task with files_total,
+            files_read and chunks_stored.
+
+    Returns:
+        dict: Same fields as store_documents, plus per-worker throughput under 'workers'. As in
+            store_documents, throughput rates are per second of embedding (summed over workers);
+            wall_chunks_per_second and wall_tokens_per_second give the rate over the whole run.
+    """
+    try:
+        start_time = time.time()
+        workers = workers or os.cpu_count() or 1
+        threads = max((os.cpu_count() or 1) // workers, 1)
+
+        logger.info(f"Loading documents from {directory_path}...")
+        paths = [str(path) for path in SimpleDirectoryReader(input_dir=directory_path).input_files]
+        tasks = [paths[i:i + files_per_task] for i in range(0, len(paths), files_per_task)]
+        logger.info(f"Found {len(paths)} files; ingesting with {workers} worker processes.")
+
+        manifest = {"settings": {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}, "files": {}}
+        buffer: Dict[str, List[Any]] = {"ids": [], "chunks": [], "metadatas": [], "embeddings": []}
+        per_worker: Dict[int, Dict[str, float]] = {}
+        counts = {"documents": 0, "files": 0, "chunks": 0, "tokens": 0, "embedding_time": 0.0, "cache_hits": 0}
+
+        def flush():
+            if not buffer["ids"]:
+                return
+            db._write_chunks(buffer["ids"], buffer["chunks"], buffer["metadatas"], buffer["embeddings"])
+            counts["chunks"] += len(buffer["ids"])
+            for values in buffer.values():
+                values.clear()
+
+        def worker_stats_for(pid: int) -> Dict[str, float]:
+            return per_worker.setdefault(
+                pid, {"files": 0, "chunks": 0, "tokens": 0, "embedding_time": 0.0, "busy_time": 0.0}
+            )
+
+        def collect(group: Dict[str, Any], embeddings: List[List[float]]):
+            counts["files"] += group["file_count"]
+            offset = 0
+            for file_entry in group["files"]:
+                counts["documents"] += file_entry["document_count"]
+                source_name = file_entry["source"]
+                if os.path.isfile(source_name):
+                    manifest["files"][os.path.relpath(source_name, directory_path)] = {
+                        **file_fingerprint(source_name),
+                        "chunk_ids": file_entry["ids"]
+                    }
+                count = len(file_entry["chunks"])
+                buffer["ids"].extend(file_entry["ids"])
+                buffer["chunks"].extend(file_entry["chunks"])
+                buffer["metadatas"].extend(file_entry["metadatas"])
+                buffer["embeddings"].extend(embeddings[offset:offset + count])
+                offset += count
+                while len(buffer["ids"]) >= batch_size:
+                    flush()
+            if progress:
+                progress({"files_total": len(paths), "files_read": counts["files"], "chunks_stored": counts["chunks"]})
+
+        def split_done(group: Dict[str, Any]):
+            """Look a split group's chunks up in the embedding cache; returns its texts, their embeddings (None on a miss) and the miss positions."""
+            worker = worker_stats_for(group["pid"])
+            worker["files"] += group["file_count"]
+            worker["busy_time"] += group["busy_time"]
+            texts = [chunk for file_entry in group["files"] for chunk in file_entry["chunks"]]
+            embeddings = db.embedding_cache.get_many(texts) if db.embedding_cache else [None] * len(texts)
+            counts["cache_hits"] += sum(1 for embedding in embeddings if embedding is not None)
+            missing = [position for position, embedding in enumerate(embeddings) if embedding is None]
+            return texts, embeddings, missing
+
+        def embed_done(result: Dict[str, Any], texts: List[str], embeddings: List[Any], missing: List[int]):
+            worker = worker_stats_for(result["pid"])
+            worker["chunks"] += len(missing)
+            worker["tokens"] += result["token_count"]
+            worker["embedding_time"] += result["embedding_time"]
+            worker["busy_time"] += result["busy_time"]
+            counts["tokens"] += result["token_count"]
+            counts["embedding_time"] += result["embedding_time"]
+            metrics.INGESTED_TOKENS.inc(result["token_count"])
+            metrics.INGEST_EMBEDDING_SECONDS.inc(result["embedding_time"])
+
+            vectors = result["embeddings"].tolist()
+            for position, vector in zip(missing, vectors):
+                embeddings[position] = vector
+            if db.embedding_cache:
+                db.embedding_cache.put_many([texts[position] for position in missing], vectors)
+
+        # Spawn rather than fork: the parent may already hold model threads and open connections
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(db.model_name, db.cache_dir, db.embedder.name, threads)
+        ) as pool:
+            remaining = iter(tasks)
+            # Split tasks map to (None, None); embed tasks to their split group and (texts, embeddings, misses)
+            in_flight: Dict[Any, Tuple[Optional[Dict[str, Any]], Any]] = {}
+            while True:
+                for task in remaining:
+                    in_flight[pool.submit(_split_files, task, directory_path, chunk_size, chunk_overlap)] = (None, None)
+                    if len(in_flight) >= workers * 2:
+                        break
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    group, pending = in_flight.pop(future)
+                    if group is None:
+                        group = future.result()
+                        texts, embeddings, missing = split_done(group)
+                        if missing:
+                            embed_future = pool.submit(_embed_texts, [texts[position] for position in missing], max_batch_tokens)
+                            in_flight[embed_future] = (group, (texts, embeddings, missing))
+                            continue
+                    else:
+                        texts, embeddings, missing = pending
+                        embed_done(future.result(), texts, embeddings, missing)
+                    collect(group, embeddings)
+                logger.info(f"Processed {counts['chunks'] + len(buffer['ids'])} chunks so far")
+
+        flush()
+        db._save_manifest(manifest)
+        if db.embedding_cache:
+            db.embedding_cache.flush()
+        metrics.INGESTED_DOCUMENTS.inc(counts["documents"])
+        metrics.INGEST_RUNS.inc(kind="parallel")
+
+        processing_time = time.time() - start_time
+        embedding_time = counts["embedding_time"]
+        worker_stats = [
+            {
+                "pid": pid,
+                **stats,
+                "chunks_per_second": stats["chunks"] / stats["embedding_time"] if stats["embedding_time"] > 0 else 0.0,
+                "tokens_per_second": stats["tokens"] / stats["embedding_time"] if stats["embedding_time"] > 0 else 0.0
+            }
+            for pid, stats in sorted(per_worker.items())
+        ]
+        for worker in worker_stats:
+            logger.info(
+                f"Worker {worker['pid']}: {worker['files']} files, {worker['chunks']} chunks, "
+                f"{worker['chunks_per_second']:.1f} chunks/s, {worker['tokens_per_second']:.0f} tokens/s"
+            )
+        logger.info(f"Documents stored successfully. Processed {counts['chunks']} chunks in {processing_time:.2f} seconds.")
+
+        return {
+            "document_count": counts["documents"],
+            "chunk_count": counts["chunks"],
+            "processing_time": processing_time,
+            "throughput": {
+                "embedding_time": embedding_time,
+                "token_count": counts["tokens"],
+                "chunks_per_second": counts["chunks"] / embedding_time if embedding_time > 0 else 0.0,
+                "tokens_per_second": counts["tokens"] / embedding_time if embedding_time > 0 else 0.0,
+                "cache_hits": counts["cache_hits"],
+                "wall_chunks_per_second": counts["chunks"] / processing_time if processing_time > 0 else 0.0,
+                "wall_tokens_per_second": counts["tokens"] / processing_time if processing_time > 0 else 0.0
+            },
+            "workers": worker_stats
+        }
+
+    except Exception as e:
+        logger.error(f"Error storing documents in parallel: {e}", exc_info=True)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a directory of documents using a pool of embedding processes")
+    parser.add_argument("directory", nargs="?", default="./scraped_data", help="Directory of documents to ingest")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (defaults to the CPU count)")
+    parser.add_argument("--collection", default="api_documentation", help="Collection name")
+    parser.add_argument("--files-per-task", type=int, default=8, help="Files handed to a worker at a time")
+    parser.add_argument("--batch-size", type=int, default=100, help="Chunks per collection write")
+    args = parser.parse_args()
+
+    db = ChromaDatabase(
+        args.collection,
+        host=os.environ.get("CHROMADB_HOST", "localhost"),
+        port=int(os.environ.get("CHROMADB_PORT", "8000")),
+        backend=os.environ.get("VECTOR_BACKEND", "http"),
+        persist_directory=os.environ.get("VECTOR_PERSIST_DIR", "./chroma_data"),
+        vector_storage=os.environ.get("VECTOR_STORAGE", "float32"),
+        model_name=os.environ.get("EMBEDDING_MODEL", "BAAI/bge-m3"),
+        embedding_backend=os.environ.get("EMBEDDING_BACKEND", "torch")
+    )
+    result = store_documents_parallel(
+        db,
+        args.directory,
+        workers=args.workers,
+        files_per_task=args.files_per_task,
+        batch_size=args.batch_size
+    )
+    print(f"Stored {result['chunk_count']} chunks from {result['document_count']} documents in {result['processing_time']:.2f} seconds")
+    for worker in result["workers"]:
+        print(f"  worker {worker['pid']}: {worker['chunks']} chunks, {worker['chunks_per_second']:.1f} chunks/s")
+
+
+if __name__ == "__main__":
+    main()
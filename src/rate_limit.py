@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBucketStore:
+    """
+    Token buckets for one process, kept in least-recently-used order.
+
+    Every take() is O(1): the client's bucket moves to the end of the OrderedDict and idle
+    buckets are popped from the front. A bucket idle for capacity / rate seconds has refilled
+    completely, so evicting it loses nothing; max_clients bounds memory beyond that.
+    """
+
+    shared = False
+
+    def __init__(self, max_clients: int = 100_000):
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (capacity, now))
+        allowed, tokens, retry_after = _refill_and_take(tokens, updated, now, rate, capacity, cost)
+        self._buckets[key] = (tokens, now)
+
+        idle = capacity / rate
+        while self._buckets:
+            oldest_key, (_, oldest_updated) = next(iter(self._buckets.items()))
+            if oldest_updated > now - idle and len(self._buckets) <= self.max_clients:
+                break
+            del self._buckets[oldest_key]
+        return allowed, retry_after
+
+    def clients(self) -> int:
+        return len(self._buckets)
+
+    def after_fork(self):
+        pass
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets in a SQLite file, so every worker process on a node draws from the same budget.
+
+    Each take() is one short IMMEDIATE transaction on the client's row; WAL mode keeps readers
+    and the single writer from blocking each other. Rows idle long enough to have refilled
+    are deleted every evict_every calls.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, evict_every: int = 1000):
+        self.path = path
+        self.evict_every = evict_every
+        self._calls = 0
+        self._connect()
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated)")
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        with self._lock:
+            # Wall-clock time, since the rows are shared between processes
+            now = time.time()
+            cursor = self._connection.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                row = cursor.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row is not None else (capacity, now)
+                allowed, tokens, retry_after = _refill_and_take(tokens, updated, now, rate, capacity, cost)
+                cursor.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now)
+                )
+                self._calls += 1
+                if self._calls % self.evict_every == 0:
+                    cursor.execute("DELETE FROM buckets WHERE updated < ?", (now - capacity / rate,))
+                cursor.execute("COMMIT")
+            except Exception:
+                if self._connection.in_transaction:
+                    cursor.execute("ROLLBACK")
+                raise
+            return allowed, retry_after
+
+    def clients(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+    def after_fork(self):
+        """Open a fresh connection in a forked child; SQLite connections must not cross fork."""
+        self._connect()
+
+
+def _refill_and_take(
+    tokens: float, updated: float, now: float, rate: float, capacity: float, cost: float = 1.0
+) -> Tuple[bool, float, float]:
+    """Refill a bucket for the time elapsed and try to take cost tokens; returns (allowed, tokens, retry_after)."""
+    tokens = min(capacity, tokens + max(now - updated, 0.0) * rate)
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / rate
+
+
+class RateLimiter:
+    """
+    Per-client token-bucket rate limiting, used as a FastAPI dependency.
+
+    Each client IP may make requests_per_minute requests per minute on average, with bursts of
+    up to burst requests. Buckets live in process memory by default; pass a SQLiteBucketStore
+    to enforce one budget across all uvicorn workers on a node. Limiters with different scopes
+    keep separate buckets for the same client, even in one store.
+    """
+
+    def __init__(self, requests_per_minute: int = 60, burst: Optional[int] = None, store=None, scope: str = ""):
+        """
+        Args:
+            requests_per_minute (int): Sustained requests allowed per client per minute.
+            burst (int, optional): Bucket capacity, i.e. requests allowed back to back (defaults to requests_per_minute).
+            store: MemoryBucketStore (default) or SQLiteBucketStore holding the buckets.
+            scope (str): Prefix for this limiter's bucket keys.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst or requests_per_minute)
+        self.store = store or MemoryBucketStore()
+        self.scope = scope
+        self.counters = {"allowed": 0, "limited": 0}
+
+    async def __call__(self, request: Request):
+        return await self.take(request)
+
+    async def take(self, request: Request, cost: float = 1.0):
+        """
+        Charge cost requests to the client's bucket, raising 429 if it cannot cover them yet.
+
+        Args:
+            request (Request): The incoming request, identifying the client by IP.
+            cost (float): Requests this call counts as, e.g. the questions in a batch.
+        """
+        if cost > self.capacity:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Request counts as {cost:g} requests, more than the rate limit burst of {self.capacity:g}"
+            )
+        client_ip = request.client.host if request.client else "unknown"
+        key = f"{self.scope}:{client_ip}" if self.scope else client_ip
+        try:
+            if self.store.shared:
+                allowed, retry_after = await asyncio.to_thread(self.store.take, key, self.rate, self.capacity, cost)
+            else:
+                allowed, retry_after = self.store.take(key, self.rate, self.capacity, cost)
+        except sqlite3.Error as e:
+            # Fail open: a broken limiter store should not take the API down with it
+            logger.error(f"Rate limiter store error: {e}")
+            return True
+
+        if not allowed:
+            self.counters["limited"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded. Try again later.",
+                headers={"Retry-After": str(max(int(retry_after + 0.999), 1))}
+            )
+        self.counters["allowed"] += 1
+        return True
+
+    def after_fork(self):
+        self.store.after_fork()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "burst": int(self.capacity),
+            "backend": "sqlite" if self.store.shared else "memory",
+            "clients": self.store.clients(),
+            **self.counters
+        }
@@ -0,0 +1,184 @@
+import re
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text for cache keys: case, surrounding/inner whitespace and trailing punctuation."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().lower()
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "version", "embedding", "bucket")
+
+    def __init__(self, value, expires_at, version, embedding=None, bucket=None):
+        self.value = value
+        self.expires_at = expires_at
+        self.version = version
+        self.embedding = embedding
+        self.bucket = bucket
+
+
+class ResponseCache:
+    """
+    Two-tier cache of generated answers in front of the LLM.
+
+    The exact tier is an LRU keyed by normalized query text plus request parameters and can
+    skip retrieval entirely. The optional semantic tier is consulted after retrieval: it reuses
+    an answer when the new query retrieved exactly the same chunk IDs with the same parameters
+    and its embedding is within semantic_distance (cosine) of the cached query. Entries expire
+    after ttl_seconds and are dropped when the collection version they were computed against
+    changes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        semantic_distance: Optional[float] = None
+    ):
+        """
+        Args:
+            max_entries (int): Maximum number of entries per tier before LRU eviction.
+            ttl_seconds (float): Seconds an answer stays valid.
+            semantic_distance (float, optional): Maximum cosine distance for a semantic hit; None disables the tier.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_distance = semantic_distance
+        self._exact: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._semantic: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._buckets: Dict[Hashable, List[Hashable]] = {}
+        self._version = None
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(query: str, **params) -> Tuple:
+        """Build the exact-tier key from normalized query text and the request parameters."""
+        return (normalize_query(query),) + tuple(sorted(params.items()))
+
+    def get(self, key: Hashable, version: Any = None) -> Optional[Any]:
+        """Exact-tier lookup. Does not count a miss, since a semantic lookup may follow."""
+        self._check_version(version)
+        entry = self._exact.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self._exact.pop(key, None)
+            return None
+        self._exact.move_to_end(key)
+        self.counters["exact_hits"] += 1
+        return entry.value
+
+    def get_semantic(
+        self,
+        key: Hashable,
+        query_embedding: Sequence[float],
+        chunk_ids: Sequence[str],
+        version: Any = None
+    ) -> Optional[Any]:
+        """Semantic-tier lookup among entries with the same parameters and retrieved chunk IDs."""
+        self._check_version(version)
+        if self.semantic_distance is None or query_embedding is None:
+            self.counters["misses"] += 1
+            return None
+
+        bucket = self._bucket(key, chunk_ids)
+        candidates = self._buckets.get(bucket, [])
+        if candidates:
+            now = time.monotonic()
+            query_vector = self._unit(query_embedding)
+            for candidate_key in list(candidates):
+                entry = self._semantic.get(candidate_key)
+                if entry is None or entry.expires_at < now:
+                    self._drop_semantic(candidate_key)
+                    continue
+                if 1.0 - float(np.dot(query_vector, entry.embedding)) <= self.semantic_distance:
+                    self._semantic.move_to_end(candidate_key)
+                    self.counters["semantic_hits"] += 1
+                    return entry.value
+
+        self.counters["misses"] += 1
+        return None
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        version: Any = None,
+        query_embedding: Optional[Sequence[float]] = None,
+        chunk_ids: Optional[Sequence[str]] = None
+    ):
+        """Store an answer in the exact tier, and in the semantic tier if an embedding and chunk IDs are given."""
+        self._check_version(version)
+        expires_at = time.monotonic() + self.ttl_seconds
+
+        self._exact[key] = _Entry(value, expires_at, version)
+        self._exact.move_to_end(key)
+        while len(self._exact) > self.max_entries:
+            self._exact.popitem(last=False)
+            self.counters["evictions"] += 1
+
+        if self.semantic_distance is not None and query_embedding is not None and chunk_ids is not None:
+            self._drop_semantic(key)
+            bucket = self._bucket(key, chunk_ids)
+            self._semantic[key] = _Entry(value, expires_at, version, self._unit(query_embedding), bucket)
+            self._buckets.setdefault(bucket, []).append(key)
+            while len(self._semantic) > self.max_entries:
+                self._drop_semantic(next(iter(self._semantic)))
+                self.counters["evictions"] += 1
+
+    def invalidate(self):
+        """Drop every cached answer."""
+        self._exact.clear()
+        self._semantic.clear()
+        self._buckets.clear()
+        self.counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["exact_hits"] + self.counters["semantic_hits"] + self.counters["misses"]
+        hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+        return {
+            "entries": len(self._exact),
+            "semantic_entries": len(self._semantic),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "semantic_distance": self.semantic_distance,
+            **self.counters,
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
+
+    def _check_version(self, version: Any):
+        """Invalidate everything when the collection changed since entries were cached."""
+        if version is None:
+            return
+        if self._version is not None and version != self._version:
+            logger.info("Collection changed; invalidating response cache.")
+            self.invalidate()
+        self._version = version
+
+    def _bucket(self, key: Hashable, chunk_ids: Sequence[str]) -> Hashable:
+        # Everything but the query text must match: the request parameters and the retrieved chunks
+        return (key[1:] if isinstance(key, tuple) else None, tuple(chunk_ids))
+
+    def _drop_semantic(self, key: Hashable):
+        entry = self._semantic.pop(key, None)
+        if entry is None:
+            return
+        keys = self._buckets.get(entry.bucket)
+        if keys is not None:
+            keys.remove(key)
+            if not keys:
+                del self._buckets[entry.bucket]
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
@@ -0,0 +1,151 @@
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+import uvicorn
+
+import main
+
+logger = logging.getLogger(__name__)
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """Bind the listening socket once in the master so every worker accepts from it."""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, threads: int):
+    """Body of a forked worker: rebuild per-process state and serve the app on the shared socket."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if main.db is not None:
+        main.db.after_fork(threads)
+    main.rate_limiter.after_fork()
+    main.batch_rate_limiter.after_fork()
+    if main.db is not None:
+        # First inference happens here, so each worker builds its own inference thread pools
+        main.db.warm_up()
+
+    config = uvicorn.Config(main.app, log_level=os.environ.get("LOG_LEVEL", "info").lower())
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def ingest():
+    """Body of the spawned ingestion process: run the full startup and exit with its outcome."""
+    main.load_database()
+    sys.exit(0 if main.startup_state.ready else 1)
+
+
+def serve(host: str, port: int, workers: int):
+    """
+    Load the model and index once, then fork workers that share them.
+
+    Ingestion runs first in a spawned process, since it embeds documents and inference
+    thread pools (OpenMP, ONNX Runtime) do not survive fork. The master then only loads the
+    model and opens the index, without running inference, and freezes the garbage collector
+    so collections in the workers do not touch the objects it created. Model weights are
+    inherited copy-on-write, and the native vector index is memory-mapped, so its pages are
+    shared through the page cache. Each worker warms the model up after fork. Workers that
+    exit unexpectedly are replaced; SIGTERM/SIGINT stop them all.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind.
+        workers (int): Number of worker processes.
+    """
+    main.startup_state.mode = "prefork"
+    ingester = multiprocessing.get_context("spawn").Process(target=ingest, name="ingest")
+    ingester.start()
+    ingester.join()
+    if ingester.exitcode != 0:
+        logger.error("Ingestion failed; not starting workers")
+        sys.exit(1)
+
+    try:
+        import torch
+        # Single-threaded while loading, so no OpenMP pool exists in the master for workers to inherit
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    main.load_database(ingest=False, warm_up=False)
+    if not main.startup_state.ready:
+        logger.error("Startup failed; not starting workers")
+        sys.exit(1)
+
+    sock = bind_socket(host, port)
+    threads = max((os.cpu_count() or 1) // workers, 1)
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Serving on {host}:{port} with {workers} workers, {threads} inference threads each")
+
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(sock, threads)
+            finally:
+                # Skip the master's atexit handlers (index persist, cache flush) in workers
+                os._exit(0)
+        children[pid] = time.time()
+        logger.info(f"Started worker {pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started_at = children.pop(pid, None)
+        if started_at is None or stopping:
+            continue
+        logger.warning(f"Worker {pid} exited with status {status}; restarting")
+        if time.time() - started_at < 1.0:
+            # Avoid a tight restart loop when workers die right away
+            time.sleep(1.0)
+        spawn()
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers sharing one loaded model and index")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8001")), help="Port to bind")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("WORKERS", str(os.cpu_count() or 1))),
+        help="Worker processes (defaults to WORKERS or the CPU count)"
+    )
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one in-flight computation.
+
+    The first caller for a key starts the computation as a task; callers arriving while it
+    runs await the same task and receive its result or exception. Nothing is kept once the
+    task finishes, so this only deduplicates bursts and is not a cache. Every caller awaits
+    through asyncio.shield, so a client disconnecting does not cancel the work the others
+    are waiting for; once every caller has been cancelled, the work is cancelled too.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.counters = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run function for key, or join the run already in progress for it.
+
+        Args:
+            key: Identity of the computation, e.g. normalized query text plus parameters.
+            function: Zero-argument coroutine function computing the result.
+
+        Returns:
+            tuple: (result, shared), where shared is True if this call joined another caller's run.
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.counters["coalesced"] += 1
+        else:
+            self.counters["leaders"] += 1
+            task = asyncio.ensure_future(function())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Every caller went away; stop work whose result nobody will read
+                    task.cancel()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "in_flight": self.in_flight()}
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception retrieved in case every waiter was cancelled before it arrived
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Coalesced computation failed: {task.exception()}")
@@ -0,0 +1,598 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Element type of the codes scanned during candidate search for each storage mode
+STORAGE_DTYPES = {"float32": None, "float16": np.float16, "int8": np.int8}
+
+# Rows scored per matrix product, bounding the temporary float32 copy made for each query
+SCORE_BLOCK_ROWS = 8192
+
+# Superseded records tolerated in the record log, beyond one per live row, before persist compacts it
+LOG_SLACK_RECORDS = 10_000
+
+
+class LocalVectorIndex:
+    """
+    In-process vector index exposing the subset of the chromadb Collection API that
+    ChromaDatabase uses (add/upsert/update/delete/get/query/count).
+
+    Vectors are stored in a memory-mapped float32 matrix on disk, so the OS page cache holds
+    them and several processes can map the same file. Their squared norms are memory-mapped
+    alongside, so opening an index never reads the vectors themselves. Ids, documents and
+    metadata go to an append-only JSON-lines record log: persist() appends only the rows
+    changed since the last call, and documents are read back from the log by offset instead
+    of being held in memory. Distances are squared L2, matching Chroma's default.
+    Once the index holds ivf_min_rows vectors, an IVF (inverted file) partition with nlist
+    k-means centroids is trained and queries only scan the nprobe closest lists.
+
+    With storage="float16" or "int8", a compact copy of every vector (half precision, or int8
+    codes with a per-vector scale) is what queries scan. The best n_results * rerank_factor
+    candidates are then rescored exactly against the float32 vectors, so only those rows of
+    the full-precision file are paged in and the resident search set is 2x or ~4x smaller.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        nlist: int = 256,
+        nprobe: int = 16,
+        ivf_min_rows: int = 20_000,
+        storage: str = "float32",
+        rerank_factor: int = 4
+    ):
+        """
+        Open (or create) an index stored under directory/name.
+
+        Args:
+            directory (str): Root directory for local indexes.
+            name (str): Collection name.
+            nlist (int): Number of IVF lists (0 disables IVF and always scans exhaustively).
+            nprobe (int): Number of IVF lists scanned per query.
+            ivf_min_rows (int): Index size at which IVF is first trained.
+            storage (str): Vectors scanned during search: "float32" (exact), "float16" or "int8".
+            rerank_factor (int): Candidates per requested result rescored at full precision
+                when storage is compressed.
+        """
+        if storage not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown vector storage: {storage} (expected one of {', '.join(STORAGE_DTYPES)})")
+        self.name = name
+        self.directory = os.path.join(directory, name)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self.storage = storage
+        self.rerank_factor = max(rerank_factor, 1)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        # records.json holds the index header; indexes written before the record log kept every record in it
+        self._records_path = os.path.join(self.directory, "records.json")
+        self._log_path = os.path.join(self.directory, "records.jsonl")
+        self._ivf_path = os.path.join(self.directory, "ivf.npz")
+        self._codes_path = os.path.join(self.directory, f"codes.{storage}")
+        self._scales_path = os.path.join(self.directory, "scales.f32")
+        self._norms_path = os.path.join(self.directory, "norms.f32")
+
+        self._lock = threading.RLock()
+        self._dim: Optional[int] = None
+        self._capacity = 0
+        self._rows = 0
+        self._vectors = None
+        self._codes = None
+        self._scales = None
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        # Byte span of each row's latest record in the log (offset -1: none persisted)
+        self._log_offsets = np.zeros(0, dtype=np.int64)
+        self._log_lengths = np.zeros(0, dtype=np.int64)
+        self._log_bytes = 0
+        self._log_records = 0
+        self._log_fd: Optional[int] = None
+        # Rows whose record changed since the last persist, and their documents until then
+        self._changed_rows: Set[int] = set()
+        self._pending_documents: Dict[int, Optional[str]] = {}
+        self._id_to_row: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_rows = 0
+        self._dirty = False
+
+        self._load()
+
+    # Collection API -------------------------------------------------------------------------
+
+    def count(self) -> int:
+        return len(self._id_to_row)
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        self.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self._dim}")
+
+            for position, chunk_id in enumerate(ids):
+                row = self._id_to_row.get(chunk_id)
+                if row is None:
+                    row = self._allocate_row()
+                    self._id_to_row[chunk_id] = row
+                self._vectors[row] = vectors[position]
+                if self._codes is not None:
+                    self._encode_rows(np.array([row]), vectors[position:position + 1])
+                self._norms[row] = float(np.dot(vectors[position], vectors[position]))
+                self._alive[row] = True
+                self._set_record(
+                    row,
+                    chunk_id,
+                    documents[position] if documents is not None else None,
+                    metadatas[position] if metadatas is not None else None
+                )
+                if self._centroids is not None:
+                    self._assignments[row] = self._nearest_centroids(vectors[position:position + 1], 1)[0, 0]
+            self._dirty = True
+
+            if self.nlist and self.count() >= max(self.ivf_min_rows, self.nlist) and self.count() >= 2 * self._trained_rows:
+                self._train_ivf()
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None):
+        with self._lock:
+            # Like Chroma, silently skip IDs that are not in the index
+            positions = [position for position, chunk_id in enumerate(ids) if chunk_id in self._id_to_row]
+            rows = [self._id_to_row[ids[position]] for position in positions]
+            if embeddings is not None:
+                self.upsert(
+                    ids=[ids[position] for position in positions],
+                    embeddings=[embeddings[position] for position in positions],
+                    documents=[
+                        documents[position] if documents is not None else self._document(row)
+                        for position, row in zip(positions, rows)
+                    ],
+                    metadatas=[
+                        metadatas[position] if metadatas is not None else self._metadatas[row]
+                        for position, row in zip(positions, rows)
+                    ]
+                )
+                return
+            for position, row in zip(positions, rows):
+                self._set_record(
+                    row,
+                    self._ids[row],
+                    documents[position] if documents is not None else self._document(row),
+                    metadatas[position] if metadatas is not None else self._metadatas[row]
+                )
+            self._dirty = True
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            # Repeated ids select the same row more than once
+            for row in sorted(set(self._select_rows(ids, where))):
+                del self._id_to_row[self._ids[row]]
+                self._alive[row] = False
+                self._set_record(row, None, None, None)
+                self._free.append(row)
+            self._dirty = True
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        with self._lock:
+            start = offset or 0
+            rows = self._select_rows(ids, where)[start:start + limit if limit is not None else None]
+            results: Dict[str, Any] = {"ids": [self._ids[row] for row in rows]}
+            if "documents" in include:
+                results["documents"] = [self._document(row) for row in rows]
+            if "metadatas" in include:
+                results["metadatas"] = [self._metadatas[row] for row in rows]
+            if "embeddings" in include:
+                results["embeddings"] = [self._vectors[row].tolist() for row in rows]
+            return results
+
+    def query(self, query_embeddings, n_results=10, include=("documents", "metadatas", "distances"), where=None):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        results: Dict[str, Any] = {"ids": []}
+        for field in ("documents", "metadatas", "distances", "embeddings"):
+            if field in include:
+                results[field] = []
+
+        with self._lock:
+            allowed = None if where is None else set(self._select_rows(None, where))
+            for query in queries:
+                rows, distances = self._search(query, n_results, allowed)
+                results["ids"].append([self._ids[row] for row in rows])
+                if "documents" in include:
+                    results["documents"].append([self._document(row) for row in rows])
+                if "metadatas" in include:
+                    results["metadatas"].append([self._metadatas[row] for row in rows])
+                if "distances" in include:
+                    results["distances"].append([float(distance) for distance in distances])
+                if "embeddings" in include:
+                    results["embeddings"].append([self._vectors[row].tolist() for row in rows])
+        return results
+
+    # Persistence ----------------------------------------------------------------------------
+
+    def persist(self):
+        """Flush vectors, append changed records to the log and write the header and IVF partition."""
+        with self._lock:
+            if not self._dirty:
+                return
+            for matrix in (self._vectors, self._codes, self._scales, self._norms):
+                if isinstance(matrix, np.memmap):
+                    matrix.flush()
+            if self._log_records + len(self._changed_rows) > self.count() + LOG_SLACK_RECORDS:
+                self._compact_log()
+            else:
+                self._append_records(sorted(self._changed_rows))
+            self._changed_rows.clear()
+            self._pending_documents.clear()
+
+            # The header commits the log: bytes past log_bytes are discarded on load
+            records = {
+                "dim": self._dim,
+                "storage": self.storage,
+                "norms": True,
+                "capacity": self._capacity,
+                "rows": self._rows,
+                "log_bytes": self._log_bytes
+            }
+            with open(f"{self._records_path}.tmp", "w", encoding="utf-8") as records_file:
+                json.dump(records, records_file)
+            os.replace(f"{self._records_path}.tmp", self._records_path)
+
+            if self._centroids is not None:
+                np.savez(
+                    self._ivf_path,
+                    centroids=self._centroids,
+                    assignments=self._assignments[:self._rows],
+                    trained_rows=self._trained_rows
+                )
+            elif os.path.exists(self._ivf_path):
+                os.remove(self._ivf_path)
+            self._dirty = False
+
+    def drop(self):
+        """Delete the index and everything stored for it."""
+        with self._lock:
+            self._vectors = self._codes = self._scales = None
+            self._norms = np.zeros(0, dtype=np.float32)
+            self._close_log()
+            shutil.rmtree(self.directory, ignore_errors=True)
+            os.makedirs(self.directory, exist_ok=True)
+            self.__init__(
+                os.path.dirname(self.directory),
+                self.name,
+                self.nlist,
+                self.nprobe,
+                self.ivf_min_rows,
+                self.storage,
+                self.rerank_factor
+            )
+
+    def after_fork(self):
+        """Reset the lock in a forked child; the memory-mapped vectors stay shared with the parent."""
+        self._lock = threading.RLock()
+
+    def stats(self) -> Dict[str, Any]:
+        full_precision_bytes = self._rows * (self._dim or 0) * 4
+        if self._codes is None:
+            search_bytes = full_precision_bytes
+        else:
+            search_bytes = self._rows * (self._dim or 0) * self._codes.dtype.itemsize
+            if self._scales is not None:
+                search_bytes += self._rows * 4
+        return {
+            "backend": "native",
+            "vectors": self.count(),
+            "dimension": self._dim,
+            "storage": self.storage,
+            "search_bytes": search_bytes,
+            "full_precision_bytes": full_precision_bytes,
+            "rerank_factor": self.rerank_factor if self._codes is not None else None,
+            "ivf_lists": 0 if self._centroids is None else len(self._centroids),
+            "nprobe": self.nprobe
+        }
+
+    def _load(self):
+        if not os.path.exists(self._records_path):
+            return
+        with open(self._records_path, "r", encoding="utf-8") as records_file:
+            records = json.load(records_file)
+        self._dim = records["dim"]
+        self._capacity = records["capacity"]
+        self._rows = records["rows"]
+        self._log_offsets = np.full(self._capacity, -1, dtype=np.int64)
+        self._log_lengths = np.zeros(self._capacity, dtype=np.int64)
+        if "log_bytes" in records:
+            self._replay_log(records["log_bytes"])
+        else:
+            # Written before the record log: move every record into it on the next persist
+            self._ids = records["ids"]
+            self._metadatas = records["metadatas"]
+            for row, document in enumerate(records["documents"]):
+                if self._ids[row] is not None:
+                    self._pending_documents[row] = document
+                    self._changed_rows.add(row)
+            self._dirty = True
+        if self._dim is not None and self._capacity:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(self._capacity, self._dim))
+            self._open_codes(self._capacity)
+            self._open_norms(self._capacity)
+
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        for row in range(self._rows):
+            chunk_id = self._ids[row]
+            if chunk_id is None:
+                self._free.append(row)
+                continue
+            self._id_to_row[chunk_id] = row
+            self._alive[row] = True
+        if self._rows:
+            if not records.get("norms"):
+                # Written before norms were persisted: compute them once from the float32 vectors
+                for start in range(0, self._rows, SCORE_BLOCK_ROWS):
+                    block = np.asarray(self._vectors[start:min(start + SCORE_BLOCK_ROWS, self._rows)])
+                    self._norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+                self._dirty = True
+            if self._codes is not None and records.get("storage") != self.storage:
+                # Storage mode changed (or the index predates it): encode codes from the float32 vectors
+                logger.info(f"Encoding {self._rows} vectors as {self.storage} for index {self.name}")
+                for start in range(0, self._rows, SCORE_BLOCK_ROWS):
+                    rows = np.arange(start, min(start + SCORE_BLOCK_ROWS, self._rows))
+                    self._encode_rows(rows, np.asarray(self._vectors[rows]))
+                self._dirty = True
+
+        self._assignments = np.zeros(self._capacity, dtype=np.int32)
+        if os.path.exists(self._ivf_path):
+            ivf = np.load(self._ivf_path)
+            self._centroids = ivf["centroids"]
+            self._assignments[:len(ivf["assignments"])] = ivf["assignments"]
+            self._trained_rows = int(ivf["trained_rows"])
+        logger.info(f"Loaded local vector index {self.name} with {self.count()} vectors")
+
+    # Internals ------------------------------------------------------------------------------
+
+    def _allocate_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._rows >= self._capacity:
+            self._grow(max(self._capacity * 2, 1024))
+        row = self._rows
+        self._rows += 1
+        self._ids.append(None)
+        self._metadatas.append(None)
+        return row
+
+    def _grow(self, capacity: int):
+        for matrix in (self._vectors, self._codes, self._scales, self._norms):
+            if isinstance(matrix, np.memmap):
+                matrix.flush()
+        self._vectors = self._codes = self._scales = None
+        with open(self._vectors_path, "ab") as handle:
+            handle.truncate(capacity * self._dim * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+        self._open_codes(capacity)
+        self._open_norms(capacity)
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - self._capacity, dtype=bool)])
+        self._log_offsets = np.concatenate([self._log_offsets, np.full(capacity - self._capacity, -1, dtype=np.int64)])
+        self._log_lengths = np.concatenate([self._log_lengths, np.zeros(capacity - self._capacity, dtype=np.int64)])
+        self._assignments = np.concatenate([self._assignments, np.zeros(capacity - self._capacity, dtype=np.int32)])
+        self._capacity = capacity
+
+    def _open_codes(self, capacity: int):
+        """Map the compact search copy (and int8 scales) at the given capacity, growing the files as needed."""
+        dtype = STORAGE_DTYPES[self.storage]
+        if dtype is None:
+            return
+        with open(self._codes_path, "ab") as handle:
+            if handle.tell() < capacity * self._dim * np.dtype(dtype).itemsize:
+                handle.truncate(capacity * self._dim * np.dtype(dtype).itemsize)
+        self._codes = np.memmap(self._codes_path, dtype=dtype, mode="r+", shape=(capacity, self._dim))
+        if self.storage == "int8":
+            with open(self._scales_path, "ab") as handle:
+                if handle.tell() < capacity * 4:
+                    handle.truncate(capacity * 4)
+            self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r+", shape=(capacity,))
+
+    def _set_record(self, row: int, chunk_id: Optional[str], document: Optional[str], metadata: Optional[Dict[str, Any]]):
+        """Change a row's id, document and metadata; the log gets the new record on persist()."""
+        self._ids[row] = chunk_id
+        self._metadatas[row] = metadata
+        self._pending_documents[row] = document
+        self._changed_rows.add(row)
+
+    def _document(self, row: int) -> Optional[str]:
+        if row in self._pending_documents:
+            return self._pending_documents[row]
+        if self._log_offsets[row] < 0:
+            return None
+        if self._log_fd is None:
+            self._log_fd = os.open(self._log_path, os.O_RDONLY)
+        # pread leaves no shared file position, so forked workers can read concurrently
+        line = os.pread(self._log_fd, int(self._log_lengths[row]), int(self._log_offsets[row]))
+        return json.loads(line)["document"]
+
+    def _record_line(self, row: int) -> bytes:
+        if self._ids[row] is None:
+            return (json.dumps({"row": row, "id": None}) + "\n").encode("utf-8")
+        record = {"row": row, "id": self._ids[row], "document": self._document(row), "metadata": self._metadatas[row]}
+        return (json.dumps(record) + "\n").encode("utf-8")
+
+    def _append_records(self, rows: List[int]):
+        if not rows:
+            return
+        with open(self._log_path, "ab") as log_file:
+            # Drop anything past the committed length, e.g. from a persist that crashed midway
+            log_file.truncate(self._log_bytes)
+            offset = self._log_bytes
+            for row in rows:
+                line = self._record_line(row)
+                log_file.write(line)
+                self._log_offsets[row] = offset if self._ids[row] is not None else -1
+                self._log_lengths[row] = len(line)
+                offset += len(line)
+        self._log_bytes = offset
+        self._log_records += len(rows)
+
+    def _compact_log(self):
+        """Rewrite the log with one record per live row, dropping superseded records and tombstones."""
+        live = [row for row in range(self._rows) if self._ids[row] is not None]
+        offsets = np.full(self._capacity, -1, dtype=np.int64)
+        lengths = np.zeros(self._capacity, dtype=np.int64)
+        offset = 0
+        with open(f"{self._log_path}.tmp", "wb") as log_file:
+            for row in live:
+                line = self._record_line(row)
+                log_file.write(line)
+                offsets[row], lengths[row] = offset, len(line)
+                offset += len(line)
+        os.replace(f"{self._log_path}.tmp", self._log_path)
+        self._close_log()
+        self._log_offsets, self._log_lengths = offsets, lengths
+        self._log_bytes = offset
+        self._log_records = len(live)
+
+    def _replay_log(self, log_bytes: int):
+        """Rebuild ids, metadata and document offsets from the committed part of the record log."""
+        self._ids = [None] * self._rows
+        self._metadatas = [None] * self._rows
+        self._log_bytes = log_bytes
+        if not os.path.exists(self._log_path):
+            return
+        offset = 0
+        with open(self._log_path, "rb") as log_file:
+            for line in log_file:
+                if offset + len(line) > log_bytes:
+                    break
+                record = json.loads(line)
+                row = record["row"]
+                self._ids[row] = record["id"]
+                self._metadatas[row] = record.get("metadata")
+                self._log_offsets[row] = offset if record["id"] is not None else -1
+                self._log_lengths[row] = len(line)
+                self._log_records += 1
+                offset += len(line)
+
+    def _close_log(self):
+        if self._log_fd is not None:
+            os.close(self._log_fd)
+            self._log_fd = None
+
+    def _open_norms(self, capacity: int):
+        """Map the per-row squared norms at the given capacity, growing the file as needed."""
+        self._norms = None
+        with open(self._norms_path, "ab") as handle:
+            if handle.tell() < capacity * 4:
+                handle.truncate(capacity * 4)
+        self._norms = np.memmap(self._norms_path, dtype=np.float32, mode="r+", shape=(capacity,))
+
+    def _encode_rows(self, rows: np.ndarray, vectors: np.ndarray):
+        """Write the compact search copy of vectors into rows."""
+        if self.storage == "float16":
+            self._codes[rows] = vectors.astype(np.float16)
+            return
+        # Symmetric int8 with one scale per vector: x ~= scale * code, code in [-127, 127]
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        self._codes[rows] = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        self._scales[rows] = scales
+
+    def _dot(self, rows: np.ndarray, query: np.ndarray, exact: bool) -> np.ndarray:
+        """x.q for each row, from the float32 vectors or the compact codes, a block at a time."""
+        products = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            block = rows[start:start + SCORE_BLOCK_ROWS]
+            if exact or self._codes is None:
+                products[start:start + len(block)] = self._vectors[block] @ query
+            else:
+                scores = self._codes[block].astype(np.float32) @ query
+                if self._scales is not None:
+                    scores *= self._scales[block]
+                products[start:start + len(block)] = scores
+        return products
+
+    def _select_rows(self, ids: Optional[Sequence[str]], where: Optional[Dict[str, Any]]) -> List[int]:
+        if ids is not None:
+            rows = [self._id_to_row[chunk_id] for chunk_id in ids if chunk_id in self._id_to_row]
+        else:
+            rows = [int(row) for row in np.flatnonzero(self._alive[:self._rows])]
+        if where:
+            rows = [
+                row for row in rows
+                if all((self._metadatas[row] or {}).get(key) == value for key, value in where.items())
+            ]
+        return rows
+
+    def _candidate_rows(self, query: np.ndarray) -> np.ndarray:
+        """Rows to score exactly: every live row, or the members of the nprobe closest IVF lists."""
+        live = self._alive[:self._rows]
+        if self._centroids is None:
+            return np.flatnonzero(live)
+        lists = self._nearest_centroids(query[None, :], min(self.nprobe, len(self._centroids)))[0]
+        return np.flatnonzero(live & np.isin(self._assignments[:self._rows], lists))
+
+    def _search(self, query: np.ndarray, n_results: int, allowed: Optional[set]):
+        candidates = self._candidate_rows(query)
+        if allowed is not None:
+            candidates = np.array([row for row in candidates if row in allowed], dtype=np.int64)
+        if len(candidates) == 0:
+            return [], []
+
+        # Squared L2 via ||x||^2 - 2 x.q + ||q||^2, scored straight from the memory map
+        query_norm = float(np.dot(query, query))
+        shortlist = n_results * self.rerank_factor
+        if self._codes is not None and shortlist < len(candidates):
+            # Rank on the compact codes, then rescore only the best candidates at full precision
+            approximate = self._norms[candidates] - 2.0 * self._dot(candidates, query, exact=False)
+            candidates = np.sort(candidates[np.argpartition(approximate, shortlist - 1)[:shortlist]])
+        distances = self._norms[candidates] - 2.0 * self._dot(candidates, query, exact=True) + query_norm
+        k = min(n_results, len(candidates))
+        top = np.argpartition(distances, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [int(row) for row in candidates[top]], np.maximum(distances[top], 0.0)
+
+    def _nearest_centroids(self, vectors: np.ndarray, count: int) -> np.ndarray:
+        centroid_norms = np.einsum("ij,ij->i", self._centroids, self._centroids)
+        distances = centroid_norms[None, :] - 2.0 * (vectors @ self._centroids.T)
+        if count >= distances.shape[1]:
+            return np.argsort(distances, axis=1)
+        nearest = np.argpartition(distances, count - 1, axis=1)[:, :count]
+        order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+        return np.take_along_axis(nearest, order, axis=1)
+
+    def _train_ivf(self, iterations: int = 10, sample_size: int = 100_000):
+        """Train IVF centroids with k-means on a sample of live vectors and assign every row."""
+        rows = np.flatnonzero(self._alive[:self._rows])
+        nlist = min(self.nlist, len(rows))
+        rng = np.random.default_rng(0)
+        sample = np.asarray(self._vectors[np.sort(rng.choice(rows, min(sample_size, len(rows)), replace=False))])
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            self._centroids = centroids
+            labels = self._nearest_centroids(sample, 1)[:, 0]
+            for index in range(nlist):
+                members = sample[labels == index]
+                if len(members):
+                    centroids[index] = members.mean(axis=0)
+        self._centroids = centroids
+
+        for start in range(0, len(rows), 8192):
+            block = rows[start:start + 8192]
+            self._assignments[block] = self._nearest_centroids(np.asarray(self._vectors[block]), 1)[:, 0]
+        self._trained_rows = len(rows)
+        self._dirty = True
+        logger.info(f"Trained IVF index with {nlist} lists over {len(rows)} vectors")
@@ -0,0 +1,49 @@
+from context import ContextBudgeter, merge_overlapping
+
+
+def word_counts(texts):
+    return [len(text.split()) for text in texts]
+
+
+def test_merge_overlapping_drops_repeated_boundary():
+    first = "alpha beta gamma delta epsilon zeta eta theta"
+    second = "epsilon zeta eta theta iota kappa"
+    assert merge_overlapping(first, second) == "alpha beta gamma delta epsilon zeta eta theta iota kappa"
+    assert merge_overlapping("no overlap at all here", "something else entirely") == "no overlap at all here\nsomething else entirely"
+
+
+def test_pack_removes_duplicates_and_contained_chunks():
+    budgeter = ContextBudgeter(max_tokens=100, token_counter=word_counts, label_sources=False)
+    packed = budgeter.pack(["the full weather endpoint docs", "weather endpoint", "the full weather endpoint docs"])
+    assert packed["documents"] == ["the full weather endpoint docs"]
+    assert packed["chunks_used"] == 1
+    assert packed["chunks_dropped"] == 2
+
+
+def test_pack_merges_consecutive_chunks_of_a_source():
+    budgeter = ContextBudgeter(max_tokens=100, token_counter=word_counts)
+    packed = budgeter.pack(
+        ["part two of the guide", "part one of the guide"],
+        [
+            {"source": "guide.md", "file_name": "guide.md", "chunk_index": 1},
+            {"source": "guide.md", "file_name": "guide.md", "chunk_index": 0}
+        ]
+    )
+    assert packed["documents"] == ["[Source: guide.md]\npart one of the guide\npart two of the guide"]
+    assert packed["chunks_used"] == 2
+
+
+def test_pack_stops_at_the_budget_in_rank_order():
+    budgeter = ContextBudgeter(max_tokens=6, token_counter=word_counts, label_sources=False)
+    packed = budgeter.pack(["one two three", "four five six seven", "eight nine"])
+    assert packed["documents"] == ["one two three", "eight nine"]
+    assert packed["token_count"] == 5
+    assert packed["chunks_dropped"] == 1
+
+
+def test_pack_truncates_an_oversized_best_chunk():
+    budgeter = ContextBudgeter(max_tokens=3, token_counter=word_counts, label_sources=False)
+    packed = budgeter.pack(["a b c d e f g h i j"])
+    assert len(packed["documents"]) == 1
+    assert packed["token_count"] <= 3
+    assert "a b c d e f g h i j".startswith(packed["documents"][0])
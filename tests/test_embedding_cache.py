@@ -0,0 +1,41 @@
+from embedding_cache import EmbeddingCache
+
+
+def test_put_and_get(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    cache.put_many(["a", "b"], [[1.0, 0.0], [0.0, 1.0]])
+    assert cache.get_many(["a", "b", "c"]) == [[1.0, 0.0], [0.0, 1.0], None]
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_entry_is_evicted_when_full(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=2)
+    cache.put_many(["a", "b"], [[1.0], [2.0]])
+    cache.get_many(["a"])
+    cache.put_many(["c"], [[3.0]])
+    assert cache.get_many(["a", "b", "c"]) == [[1.0], None, [3.0]]
+    assert cache.stats()["entries"] == 2
+
+
+def test_entries_survive_reopen(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    cache.put_many(["a"], [[0.5, 0.25]])
+    cache.flush()
+    assert EmbeddingCache(str(tmp_path), "model").get_many(["a"]) == [[0.5, 0.25]]
+
+
+def test_reopen_with_smaller_max_entries_keeps_most_recent(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    cache.put_many(["a", "b", "c"], [[1.0], [2.0], [3.0]])
+    cache.flush()
+    reopened = EmbeddingCache(str(tmp_path), "model", max_entries=2)
+    assert reopened.get_many(["a", "b", "c"]) == [None, [2.0], [3.0]]
+
+
+def test_keys_depend_on_the_model(tmp_path):
+    first = EmbeddingCache(str(tmp_path), "model-a")
+    second = EmbeddingCache(str(tmp_path), "model-b")
+    assert first.key("text") != second.key("text")
+    first.put_many(["text"], [[1.0]])
+    assert second.get_many(["text"]) == [None]
@@ -0,0 +1,79 @@
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def make_index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical" / "docs"))
+    index.add(
+        ["weather", "forecast", "auth", "filler"],
+        [
+            "GET /data/2.5/weather returns the current weather for a city",
+            "The forecast endpoint returns weather for five days",
+            "Authenticate with an API key passed as the appid parameter",
+            "Unrelated text about billing and invoices"
+        ]
+    )
+    return index
+
+
+def test_tokenize_keeps_compound_identifiers():
+    tokens = tokenize("Call /data/2.5/weather now")
+    assert "data/2.5/weather" in tokens
+    assert {"data", "weather", "call", "now"} <= set(tokens)
+
+
+def test_search_ranks_by_bm25(tmp_path):
+    index = make_index(tmp_path)
+    ranked = [chunk_id for chunk_id, _ in index.search("current weather for a city")]
+    assert ranked[0] == "weather"
+    assert "forecast" in ranked
+    assert "filler" not in ranked
+
+
+def test_exact_identifier_outranks_common_terms(tmp_path):
+    index = make_index(tmp_path)
+    assert index.search("/data/2.5/weather", top_n=1)[0][0] == "weather"
+
+
+def test_search_respects_top_n_and_positive_scores(tmp_path):
+    index = make_index(tmp_path)
+    results = index.search("weather", top_n=1)
+    assert len(results) == 1
+    assert results[0][1] > 0
+    assert index.search("nothing matches this") == []
+
+
+def test_delete_tombstones_chunks(tmp_path):
+    index = make_index(tmp_path)
+    index.delete(["weather", "unknown"])
+    assert index.count() == 3
+    assert "weather" not in [chunk_id for chunk_id, _ in index.search("weather city")]
+
+
+def test_add_replaces_existing_text(tmp_path):
+    index = make_index(tmp_path)
+    index.add(["filler"], ["Now this chunk talks about weather in every city"])
+    assert index.count() == 4
+    assert "filler" in [chunk_id for chunk_id, _ in index.search("city")]
+    assert index.search("invoices") == []
+
+
+def test_tombstones_survive_compaction_and_reload(tmp_path):
+    index = make_index(tmp_path)
+    index.delete(["weather", "forecast"])
+    index.add(["extra"], ["More weather details"])
+    index.persist()
+
+    reloaded = LexicalIndex(index.path)
+    assert reloaded.count() == 3
+    assert [chunk_id for chunk_id, _ in reloaded.search("weather")] == ["extra"]
+    assert reloaded.search("key", top_n=1)[0][0] == "auth"
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]])
+    assert fused[0] == "b"
+    assert set(fused) == {"a", "b", "c"}
+
+
+def test_reciprocal_rank_fusion_single_ranking_keeps_order():
+    assert reciprocal_rank_fusion([["x", "y", "z"]]) == ["x", "y", "z"]
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import rate_limit
+from rate_limit import MemoryBucketStore, RateLimiter, SQLiteBucketStore, _refill_and_take
+
+
+def request_from(host: str):
+    return SimpleNamespace(client=SimpleNamespace(host=host))
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_refill_is_capped_at_capacity():
+    allowed, tokens, _ = _refill_and_take(0.0, 0.0, 1000.0, rate=1.0, capacity=5.0)
+    assert allowed
+    assert tokens == 4.0
+
+
+def test_refill_adds_elapsed_time_times_rate():
+    allowed, tokens, retry_after = _refill_and_take(0.0, 10.0, 12.0, rate=0.5, capacity=5.0)
+    assert allowed
+    assert tokens == 0.0
+    assert retry_after == 0.0
+
+
+def test_cost_larger_than_tokens_is_refused_with_retry_after():
+    allowed, tokens, retry_after = _refill_and_take(1.0, 10.0, 10.0, rate=2.0, capacity=10.0, cost=5.0)
+    assert not allowed
+    assert tokens == 1.0
+    assert retry_after == 2.0
+
+
+@pytest.mark.parametrize("make_store, clock_name", [
+    (lambda tmp_path: MemoryBucketStore(), "monotonic"),
+    (lambda tmp_path: SQLiteBucketStore(str(tmp_path / "buckets.db")), "time")
+])
+def test_store_burst_then_refill(tmp_path, monkeypatch, make_store, clock_name):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, clock_name, clock)
+    store = make_store(tmp_path)
+
+    assert store.take("client", rate=1.0, capacity=3.0, cost=2.0)[0]
+    allowed, retry_after = store.take("client", rate=1.0, capacity=3.0, cost=2.0)
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+
+    clock.now += 1.0
+    assert store.take("client", rate=1.0, capacity=3.0, cost=2.0)[0]
+    assert store.take("other", rate=1.0, capacity=3.0, cost=3.0)[0]
+    assert store.clients() == 2
+
+
+def test_memory_store_evicts_idle_buckets(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    store = MemoryBucketStore()
+    store.take("a", rate=1.0, capacity=2.0)
+    clock.now += 10.0
+    store.take("b", rate=1.0, capacity=2.0)
+    assert store.clients() == 1
+
+
+def test_limiter_raises_429_then_recovers(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    limiter = RateLimiter(requests_per_minute=60, burst=2)
+    request = request_from("10.0.0.1")
+
+    asyncio.run(limiter.take(request))
+    asyncio.run(limiter.take(request))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(limiter.take(request))
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "1"
+
+    clock.now += 1.0
+    assert asyncio.run(limiter.take(request))
+    assert limiter.stats()["allowed"] == 3
+    assert limiter.stats()["limited"] == 1
+
+
+def test_limiter_rejects_cost_above_burst():
+    limiter = RateLimiter(requests_per_minute=60, burst=10)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(limiter.take(request_from("10.0.0.1"), cost=11))
+    assert error.value.status_code == 413
+
+
+def test_scopes_keep_separate_buckets_in_one_store():
+    store = MemoryBucketStore()
+    queries = RateLimiter(requests_per_minute=60, burst=1, store=store)
+    batches = RateLimiter(requests_per_minute=60, burst=5, store=store, scope="batch")
+    request = request_from("10.0.0.1")
+
+    asyncio.run(queries.take(request))
+    asyncio.run(batches.take(request, cost=5))
+    assert store.clients() == 2
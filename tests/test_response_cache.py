@@ -0,0 +1,61 @@
+from response_cache import ResponseCache
+
+
+def test_make_key_normalizes_query_text():
+    assert ResponseCache.make_key("  How do I  Authenticate? ", top_n=5) == ResponseCache.make_key("how do i authenticate", top_n=5)
+    assert ResponseCache.make_key("auth", top_n=5) != ResponseCache.make_key("auth", top_n=3)
+
+
+def test_exact_hit_counts():
+    cache = ResponseCache()
+    key = ResponseCache.make_key("auth")
+    assert cache.get(key, version=1) is None
+    cache.put(key, "answer", version=1)
+    assert cache.get(key, version=1) == "answer"
+    assert cache.counters["exact_hits"] == 1
+
+
+def test_version_change_invalidates_every_entry():
+    cache = ResponseCache(semantic_distance=0.1)
+    cache.put("a", "first", version=1, query_embedding=[1.0, 0.0], chunk_ids=["c1"])
+    cache.put("b", "second", version=1)
+
+    assert cache.get("a", version=2) is None
+    assert cache.get("b", version=2) is None
+    assert cache.get_semantic("a", [1.0, 0.0], ["c1"], version=2) is None
+    assert cache.counters["invalidations"] == 1
+
+
+def test_entries_stored_under_new_version_are_served():
+    cache = ResponseCache()
+    cache.put("a", "old", version=1)
+    cache.put("a", "new", version=2)
+    assert cache.get("a", version=2) == "new"
+
+
+def test_semantic_hit_requires_same_chunks_and_close_embedding():
+    cache = ResponseCache(semantic_distance=0.05)
+    key = ResponseCache.make_key("how to authenticate", top_n=5)
+    cache.put(key, "answer", version=1, query_embedding=[1.0, 0.0], chunk_ids=["c1", "c2"])
+
+    other = ResponseCache.make_key("authentication how", top_n=5)
+    assert cache.get_semantic(other, [0.99, 0.01], ["c1", "c2"], version=1) == "answer"
+    assert cache.get_semantic(other, [0.99, 0.01], ["c3"], version=1) is None
+    assert cache.get_semantic(other, [0.0, 1.0], ["c1", "c2"], version=1) is None
+
+
+def test_expired_entries_are_dropped():
+    cache = ResponseCache(ttl_seconds=-1)
+    cache.put("a", "answer")
+    assert cache.get("a") is None
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.counters["evictions"] == 1
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+import vector_index
+from vector_index import LocalVectorIndex
+
+
+def random_vectors(count: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def make_index(tmp_path, count: int = 50, **kwargs):
+    index = LocalVectorIndex(str(tmp_path), "docs", **kwargs)
+    vectors = random_vectors(count)
+    index.upsert(
+        [f"id{i}" for i in range(count)],
+        vectors.tolist(),
+        [f"doc {i}" for i in range(count)],
+        [{"group": i % 2} for i in range(count)]
+    )
+    return index, vectors
+
+
+def test_query_returns_nearest_with_squared_l2(tmp_path):
+    index, vectors = make_index(tmp_path)
+    results = index.query([vectors[7].tolist()], n_results=3)
+    assert results["ids"][0][0] == "id7"
+    assert results["documents"][0][0] == "doc 7"
+    assert results["distances"][0][0] == pytest.approx(0.0, abs=1e-4)
+
+    expected = np.argsort(((vectors - vectors[7]) ** 2).sum(axis=1))[:3]
+    assert results["ids"][0] == [f"id{i}" for i in expected]
+    assert results["distances"][0] == pytest.approx(sorted(((vectors - vectors[7]) ** 2).sum(axis=1))[:3], rel=1e-4)
+
+
+def test_upsert_replaces_existing_ids(tmp_path):
+    index, vectors = make_index(tmp_path)
+    index.upsert(["id3"], [vectors[10].tolist()], ["moved"], [{"group": 9}])
+    assert index.count() == 50
+    assert index.get(ids=["id3"]) == {"ids": ["id3"], "documents": ["moved"], "metadatas": [{"group": 9}]}
+    assert set(index.query([vectors[10].tolist()], n_results=2)["ids"][0]) == {"id3", "id10"}
+
+
+def test_update_documents_without_embeddings(tmp_path):
+    index, _ = make_index(tmp_path)
+    index.update(["id1", "missing"], documents=["changed"])
+    assert index.get(ids=["id1"])["documents"] == ["changed"]
+    assert index.get(ids=["id1"])["metadatas"] == [{"group": 1}]
+
+
+def test_delete_by_id_and_where(tmp_path):
+    index, vectors = make_index(tmp_path)
+    index.delete(ids=["id7", "id7"])
+    assert index.count() == 49
+    assert "id7" not in index.query([vectors[7].tolist()], n_results=5)["ids"][0]
+
+    index.delete(where={"group": 0})
+    assert index.count() == 24
+    assert all(metadata["group"] == 1 for metadata in index.get()["metadatas"])
+
+
+def test_deleted_rows_are_reused(tmp_path):
+    index, vectors = make_index(tmp_path)
+    index.delete(ids=["id0"])
+    index.upsert(["new"], [vectors[0].tolist()], ["new doc"])
+    assert index.count() == 50
+    assert index.query([vectors[0].tolist()], n_results=1)["ids"][0] == ["new"]
+
+
+def test_where_filter_on_query(tmp_path):
+    index, vectors = make_index(tmp_path)
+    results = index.query([vectors[4].tolist()], n_results=5, where={"group": 1})
+    assert all(metadata["group"] == 1 for metadata in results["metadatas"][0])
+    assert "id4" not in results["ids"][0]
+
+
+def test_dimension_mismatch_is_rejected(tmp_path):
+    index, _ = make_index(tmp_path)
+    with pytest.raises(ValueError):
+        index.upsert(["bad"], random_vectors(1, dim=8).tolist())
+
+
+def test_persist_and_reopen(tmp_path):
+    index, vectors = make_index(tmp_path)
+    index.delete(ids=["id2"])
+    index.update(["id5"], documents=["edited"])
+    index.persist()
+
+    reopened = LocalVectorIndex(str(tmp_path), "docs")
+    assert reopened.count() == 49
+    assert reopened.get(ids=["id2", "id5"])["documents"] == ["edited"]
+    assert reopened.query([vectors[9].tolist()], n_results=1)["ids"][0] == ["id9"]
+
+
+def test_record_log_is_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, "LOG_SLACK_RECORDS", 5)
+    index, _ = make_index(tmp_path, count=10)
+    index.persist()
+    for round_number in range(3):
+        index.update([f"id{i}" for i in range(10)], documents=[f"v{round_number}"] * 10)
+        index.persist()
+
+    with open(index._log_path, "rb") as log_file:
+        assert sum(1 for _ in log_file) == 10
+    assert LocalVectorIndex(str(tmp_path), "docs").get(ids=["id4"])["documents"] == ["v2"]
+
+
+@pytest.mark.parametrize("storage", ["float16", "int8"])
+def test_compressed_storage_reranks_exactly(tmp_path, storage):
+    index, vectors = make_index(tmp_path, storage=storage)
+    results = index.query([vectors[12].tolist()], n_results=1)
+    assert results["ids"][0] == ["id12"]
+    assert results["distances"][0][0] == pytest.approx(0.0, abs=1e-4)